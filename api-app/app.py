@@ -1,6 +1,8 @@
 from flask import Flask, request, jsonify, send_file
 from utils.generate_report import run_generate_report
-from utils.helpers import generate_unique_key, generate_unique_file_path, generate_region_cache_path, generate_region_cache_key, get_json_from_region_csv, save_region_csv
+from utils.helpers import generate_unique_key, generate_unique_file_path, generate_region_cache_path, generate_region_cache_key, fetch_region_id, get_json_from_region_csv, save_region_csv
+from hydrosens_shared.profiling import (RequestProfiler, run_profiled, profiling_requested, profile_path,
+                                       list_profiles, PROFILE_FILES, PROFILE_HEADER, PROFILE_ID_HEADER)
 import requests
 import os
 from flask_cors import CORS  
@@ -18,6 +20,10 @@ HYDROSENS_STATISTICS = "curve-number, ndvi, precipitation, soil-fraction, temper
 from utils.coor_convert import lon_to_utm_zone, build_utm_wkt
 from pyproj import Transformer
 import json
+import uuid
+
+# Backend profile IDs are returned to the caller under this header
+BACKEND_PROFILE_ID_HEADER = "X-HydroSENS-Backend-Profile-Id"
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
@@ -37,7 +43,11 @@ def analyze():
             "crs": data.get("crs", "EPSG:4326"),
             "num_coordinates": data.get("num_coordinates", 0),
             "coordinates": data.get("coordinates"),
-            "endmember": data.get("endmember", 3)  # Extract endmember parameter with default value 3
+            "endmember": data.get("endmember", 3),  # Extract endmember parameter with default value 3
+            "unmixing_mode": data.get("unmixing_mode", "mesma"),  # 'mesma' or fast 'fcls'
+            "preview": data.get("preview", False),  # coarse preview, full resolution follows in the background
+            "sensor": data.get("sensor", "sentinel2"),  # 'sentinel2' or 'landsat' (Landsat 8/9)
+            "mode": data.get("mode", "full")  # 'stats' returns Earth Engine statistics without raster processing
         }
     except json.JSONDecodeError:
         return jsonify({"error": "Invalid request body."}), 400
@@ -52,13 +62,19 @@ def analyze():
         
         print(f"[analyze] Forwarding to HydroSENS at {hydrosens_url}")
         
+        # Profiling requests are passed through so the HydroSENS run itself is profiled
+        headers = {PROFILE_HEADER: "1"} if profiling_requested(request) else None
+
         # Send request to HydroSENS and wait for the response
         # This will now block until the latest request completes
-        response = requests.post(hydrosens_url, json=data_payload, timeout=None)  # No timeout - wait for completion
+        response = requests.post(hydrosens_url, json=data_payload, headers=headers, timeout=None)  # No timeout - wait for completion
         print(f"[analyze] HydroSENS responded with status {response.status_code}")
 
         response_data = response.json()
-        return jsonify(response_data), 200
+        result = jsonify(response_data)
+        if response.headers.get(PROFILE_ID_HEADER):
+            result.headers[BACKEND_PROFILE_ID_HEADER] = response.headers[PROFILE_ID_HEADER]
+        return result, 200
     
     except Exception as e:
         print(f"[analyze] Exception:", str(e))
@@ -96,7 +112,11 @@ def get_tif_zip():
             params={
                 "region_name": regionName,
                 "start_date": startDate,
-                "end_date": endDate
+                "end_date": endDate,
+                # Optional: CN and runoff products derived for this AMC / precipitation
+                "amc": data.get("amc"),
+                "precipitation": data.get("precipitation"),
+                "sensor": data.get("sensor", "sentinel2")
             }
         )
         
@@ -155,7 +175,8 @@ def get_csv_file():
             params={
                 "region_name": regionName,
                 "start_date": startDate,
-                "end_date": endDate
+                "end_date": endDate,
+                "sensor": data.get("sensor", "sentinel2")
             }
         )
         
@@ -185,10 +206,32 @@ def get_csv_file():
     
 @app.route('/generate-report', methods=['POST'])
 def generate_report():
-    output_master = os.getenv("OUTPUT_MASTER", "./data/output")
     data = request.get_json()
     if not data:
         return jsonify({"error": "Invalid JSON payload"}), 400
+
+    if not profiling_requested(request):
+        return build_report_response(data)
+
+    # X-HydroSENS-Profile: 1 profiles report generation here and the analysis in HydroSENS
+    profile_id = uuid.uuid4().hex
+    profiler = RequestProfiler(profile_id, label=f"POST /generate-report {data.get('region_name', '')}")
+    backend_profile = {}
+    result = run_profiled(profiler, build_report_response, data, profile=True, backend_profile=backend_profile)
+
+    response, status = result if isinstance(result, tuple) else (result, 200)
+    response.headers[PROFILE_ID_HEADER] = profile_id
+    if backend_profile.get("profile_id"):
+        response.headers[BACKEND_PROFILE_ID_HEADER] = backend_profile["profile_id"]
+    return response, status
+
+
+def build_report_response(data, profile=False, backend_profile=None):
+    """
+    Fetch the analysis from HydroSENS and build the PDF report response for a generate-report payload.
+    With profile=True the HydroSENS request is profiled as well and its profile ID is stored in backend_profile.
+    """
+    output_master = os.getenv("OUTPUT_MASTER", "./data/output")
     
     region_name = data.get("region_name", "Unknown Region")
     start_date = data.get("start_date")
@@ -198,12 +241,18 @@ def generate_report():
     precipitation = data.get("precipitation")
     crs = data.get("crs", "EPSG:4326")
     endmember = data.get("endmember", 3)
+    unmixing_mode = data.get("unmixing_mode", "mesma")
     
     if not region_name or not start_date or not end_date or not coordinates:
         return jsonify({"error": "Missing required parameters: region_name, start_date, end_date, coordinates"}), 400
     
-    # Find cached report data using region-based organization
-    pdf_file_path = generate_region_cache_path(region_name, start_date, end_date, extension=".pdf")
+    # Find cached report data using region-based organization, keyed on the polygon rather than its name
+    try:
+        region_id = fetch_region_id(coordinates, crs)
+    except Exception as e:
+        print(f"[generate_report] Could not resolve region ID: {str(e)}")
+        return jsonify({"error": f"Failed to resolve region ID from HydroSENS: {str(e)}"}), 500
+    pdf_file_path = generate_region_cache_path(region_id, start_date, end_date, extension=".pdf")
     print('Checking for cached report at:', pdf_file_path)
     if os.path.exists(pdf_file_path):
         return send_file(
@@ -214,7 +263,7 @@ def generate_report():
         )
 
     # Generate the full file path for the report
-    report_file_path = generate_region_cache_path(region_name, start_date, end_date, extension=".pdf")
+    report_file_path = generate_region_cache_path(region_id, start_date, end_date, extension=".pdf")
     # Extract just the filename without extension for the jobname
     report_filename = os.path.splitext(os.path.basename(report_file_path))[0]
 
@@ -230,7 +279,8 @@ def generate_report():
             "crs": crs,
             "num_coordinates": len(coordinates),
             "coordinates": coordinates,
-            "endmember": endmember
+            "endmember": endmember,
+            "unmixing_mode": unmixing_mode
         }
         
         # Get HydroSENS URL
@@ -243,8 +293,11 @@ def generate_report():
         print(f"[generate_report] Fetching data from HydroSENS at {hydrosens_url}")
         
         # Send request to HydroSENS API
-        response = requests.post(hydrosens_url, json=data_payload, timeout=None)
+        headers = {PROFILE_HEADER: "1"} if profile else None
+        response = requests.post(hydrosens_url, json=data_payload, headers=headers, timeout=None)
         print(f"[generate_report] HydroSENS responded with status {response.status_code}")
+        if backend_profile is not None and response.headers.get(PROFILE_ID_HEADER):
+            backend_profile["profile_id"] = response.headers[PROFILE_ID_HEADER]
         
         if response.status_code != 200:
             try:
@@ -449,6 +502,21 @@ def delete_region_cache(region_name):
         
         if response.status_code == 200:
             hydrosens_response = response.json()
+
+            # Reports are stored under the region ID resolved by HydroSENS
+            # Only once no other region name shares the cache (see HydroSENS region registry)
+            region_id = hydrosens_response.get("region_id")
+            if region_id and region_id != region_folder and hydrosens_response.get("region_deleted", True):
+                region_id_path = os.path.join(output_master, region_id)
+                if os.path.exists(region_id_path):
+                    try:
+                        import shutil
+                        shutil.rmtree(region_id_path)
+                        pdf_cache_deleted = True
+                        print(f"Deleted PDF cache for region ID: {region_id}")
+                    except Exception as e:
+                        pdf_cache_error = str(e)
+                        print(f"Failed to delete PDF cache for region ID {region_id}: {str(e)}")
             
             # Combine results from both PDF cache and Hydrosens cache deletion
             combined_response = {
@@ -477,5 +545,31 @@ def delete_region_cache(region_name):
         print(f"[delete_region_cache] Exception: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List stored request profiles of this service (newest first)
+    """
+    return jsonify({"profiles": list_profiles()}), 200
+
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@app.route('/profiles/<profile_id>/<kind>', methods=['GET'])
+def get_profile(profile_id, kind='meta'):
+    """
+    Download a stored profile: kind is 'meta' (summary with top functions), 'pstats' or 'speedscope'.
+    Profiles of the HydroSENS run are served by HydroSENS under the backend profile ID.
+    """
+    path = profile_path(profile_id, kind)
+    if path is None:
+        return jsonify({"error": f"Invalid profile request. Expected kind in {sorted(PROFILE_FILES)}"}), 400
+    if not os.path.exists(path):
+        return jsonify({"error": f"Profile '{profile_id}' not found"}), 404
+
+    filename, mimetype = PROFILE_FILES[kind]
+    return send_file(path, mimetype=mimetype, as_attachment=kind != 'meta',
+                     download_name=f"{profile_id}_{filename}")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
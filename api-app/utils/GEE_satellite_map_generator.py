@@ -1,27 +1,22 @@
 import ee
-import geemap
 import numpy as np
 import matplotlib.pyplot as plt
-import contextily as ctx
-import geopandas as gpd
 from shapely.geometry import Polygon
 import warnings
 import os
 import tempfile
 from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
-import requests
+from hydrosens_shared.ee_client import ensure_initialized, get_info, ee_call, download_url
 
 warnings.filterwarnings('ignore')
 
-service_account = 'khoabui@hydrosens-garfield.iam.gserviceaccount.com'
-credentials = ee.ServiceAccountCredentials(service_account, r"./.secret/hydrosens-garfield-f6fe24f0d188.json")
-ee.Initialize(credentials)
-
 def coordinates_to_ee_geometry(coordinates):
     """
     Convert coordinate array to Earth Engine Geometry
     """
+    ensure_initialized()
+
     # Ensure the polygon is closed (first and last coordinates are the same)
     if coordinates[0] != coordinates[-1]:
         coordinates = coordinates + [coordinates[0]]
@@ -263,7 +258,7 @@ def get_satellite_image_from_gee(coordinates, output_path, image_size=2048, max_
                     .sort(source['cloud_property'])
                 
                 # Check if any images are available
-                count = collection.size().getInfo()
+                count = get_info(collection.size(), "image count")
                 if count == 0:
                     print(f"      No images available for {source['name']}")
                     continue
@@ -275,7 +270,7 @@ def get_satellite_image_from_gee(coordinates, output_path, image_size=2048, max_
                 image_for_viz = best_image.select(source['bands'])
                 
                 # Get image date
-                image_date = ee.Date(best_image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
+                image_date = get_info(ee.Date(best_image.get('system:time_start')).format('YYYY-MM-dd'), "image date")
                 
                 # Scale pixel values for visualization (Landsat needs scaling)
                 if 'LANDSAT' in source['collection']:
@@ -289,17 +284,17 @@ def get_satellite_image_from_gee(coordinates, output_path, image_size=2048, max_
                 }
                 
                 # Get the image URL for download
-                url = image_for_viz.getThumbURL({
+                url = ee_call(image_for_viz.getThumbURL, {
                     'region': expanded_aoi,
                     'dimensions': image_size,
                     'format': 'png',
                     **vis_params
-                })
+                }, description="thumbnail URL")
                 
                 print(f"      Requesting image from GEE...")
                 
-                # Download the image
-                response = requests.get(url, timeout=120)
+                # Download the image, throttled and 5xx responses are retried
+                response = download_url(url, description="thumbnail", timeout=120)
                 if response.status_code == 200:
                     if len(response.content) > 10000:  # At least 10KB for a real image
                         with open(output_path, 'wb') as f:
@@ -458,6 +453,10 @@ def generate_contextily_satellite_map(coordinates, output_path, figsize=(8, 6),
     """
     Generate satellite map using contextily with improved resolution
     """
+    # Only needed for this fallback, imported on use to keep worker startup fast
+    import contextily as ctx
+    import geopandas as gpd
+
     try:
         # Ensure polygon is closed
         coords = np.array(coordinates)
@@ -21,6 +21,29 @@ def generate_unique_key(region_name: str, start_date: str, end_date: str) -> str
     return unique_key
 
 
+def fetch_region_id(coordinates: list, crs: str = "EPSG:4326") -> str:
+    """
+    Ask HydroSENS for the region ID of a polygon, the key its region registry stores caches under.
+    Report caches use the same key, so region IDs are never computed on this side.
+
+    Args:
+        coordinates (list): List of [lon, lat] pairs defining the polygon.
+        crs (str): CRS of the coordinates.
+
+    Returns:
+        str: The region ID.
+    """
+    import requests
+
+    hydrosens_url = os.getenv("HYDROSENS_URL")
+    if not hydrosens_url:
+        raise RuntimeError("HYDROSENS_URL environment variable is not set")
+    response = requests.post(hydrosens_url.rstrip("/") + "/hydrosens/region-id",
+                             json={"coordinates": coordinates, "crs": crs}, timeout=30)
+    response.raise_for_status()
+    return response.json()["region_id"]
+
+
 def generate_unique_file_path(region_name: str, start_date: str, end_date: str, extension: str = ".csv") -> str:
     """
     Generate a unique filename based on region name and date range.
@@ -46,7 +69,7 @@ def generate_region_cache_path(region_name: str, start_date: str, end_date: str,
     Generate a cache file path organized by region folders with simple date-based naming.
     
     Args:
-        region_name (str): Name of the region (e.g., "Iowa-Central").
+        region_name (str): Region folder key, normally the region ID from fetch_region_id.
         start_date (str): Start date in format YYYY-MM-DD.
         end_date (str): End date in format YYYY-MM-DD.
         extension (str): File extension, default is ".pdf".
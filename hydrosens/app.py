@@ -1,7 +1,18 @@
 from flask import Flask, request, jsonify, send_file
-from utils.main_sentinel_update import run_hydrosens_with_coordinates
+from utils.main_sentinel_update import run_hydrosens_with_coordinates, run_statistics_with_coordinates, STATS_SCALE
 from utils.data_utils import get_dates_from_range, check_existing_data, append_to_csv
 from utils.thread_utils import terminate_thread
+from utils.region_registry import (register_region, region_storage_key, record_ingest_params, compute_region_id,
+                                   resolve_region_id, delete_region_alias)
+from utils.memory_profiler import MemoryProfiler, MEMORY_PROFILE
+from utils.runoff import cached_cn_dates, runoff_what_if
+from utils.derived_products import CN_AMCII_FILE, amc_cn_layer, amc_runoff_layer, refresh_downstream_stages
+from utils.stage_cache import stage_params
+from hydrosens_shared.profiling import (RequestProfiler, run_profiled, profiling_requested, profile_path,
+                                       list_profiles, PROFILE_FILES, PROFILE_ID_HEADER)
+from hydrosens_shared.ee_client import ee_client_stats
+from utils.ingestion import IngestionScheduler
+from utils.sensors import get_sensor, sensor_storage_key, SENSORS
 import os
 import base64
 import json
@@ -23,22 +34,223 @@ current_result = None
 result_ready_event = threading.Event()
 thread_lock = threading.Lock()
 
+# Preview runs process at a coarser resolution and are replaced by a full-resolution job.
+# FULL_SCALE is the Sentinel-2 resolution; other sensors run at their own native resolution.
+PREVIEW_SCALE = int(os.getenv('PREVIEW_SCALE', '50'))
+FULL_SCALE = 10
 
-def run_hydrosens_background(thread_id, region_name, coordinates, start_date, end_date, output_dir, amc, precipitation, crs, endmember):
+# One lock per region so background full-resolution jobs and requests never write the same folders at once
+region_locks = {}
+region_locks_guard = threading.Lock()
+
+
+def get_region_lock(region_key):
+    with region_locks_guard:
+        return region_locks.setdefault(region_key, threading.Lock())
+
+
+# Background full-resolution jobs that follow preview requests
+full_resolution_threads = set()
+full_resolution_guard = threading.Lock()
+
+
+def request_work_running():
+    """True while an interactive job or a full-resolution follow-up job is running."""
+    if current_thread is not None and current_thread.is_alive():
+        return True
+    with full_resolution_guard:
+        full_resolution_threads.difference_update([t for t in full_resolution_threads if not t.is_alive()])
+        return bool(full_resolution_threads)
+
+
+# Background ingestion of new scenes for cached regions (disabled unless INGEST_INTERVAL_HOURS is set).
+# It is not started at import: importing app.py (tests, import benchmarks, the reloader's watcher
+# process) must not start background jobs. start_ingestion() runs in the process that serves requests.
+ingestion_scheduler = IngestionScheduler(os.getenv('OUTPUT_MASTER', '/app/data/output'), get_region_lock,
+                                         request_work_running, scale=FULL_SCALE)
+ingestion_started = False
+ingestion_start_lock = threading.Lock()
+
+
+def start_ingestion():
+    """Start the ingestion scheduler once per process."""
+    global ingestion_started
+    with ingestion_start_lock:
+        if ingestion_started:
+            return
+        ingestion_started = True
+    ingestion_scheduler.start()
+
+
+@app.before_request
+def start_ingestion_with_first_request():
+    # Under `flask run` the app is only imported, so ingestion starts with the first request the
+    # process serves. The reloader's watcher process never serves requests and never starts it.
+    start_ingestion()
+
+
+def run_full_resolution_job(region_key, coordinates, dates, output_dir, amc, precipitation, crs, endmember, unmixing_mode, sensor='sentinel2'):
+    """
+    Recompute preview dates at full resolution and replace the preview results in the region store
+    """
+    sensor = get_sensor(sensor)
+    try:
+        print(f"Starting full-resolution job for {len(dates)} preview dates in region {region_key}")
+        with get_region_lock(region_key):
+            results = run_hydrosens_with_coordinates(
+                region_name=region_key,
+                coordinates=coordinates,
+                dates_to_process=dates,
+                output_dir=output_dir,
+                amc=amc,
+                precipitation=precipitation,
+                crs=crs,
+                endmember=endmember,
+                unmixing_mode=unmixing_mode,
+                scale=sensor.native_scale,
+                sensor=sensor.name
+            )
+            append_to_csv(output_dir, sensor_storage_key(region_key, sensor), results, resolution='full')
+        print(f"Full-resolution job finished for region {region_key}: {len(results)} dates replaced")
+    except Exception as e:
+        print(f"Full-resolution job failed for region {region_key}: {str(e)}")
+
+
+def schedule_full_resolution(region_key, coordinates, dates, output_dir, amc, precipitation, crs, endmember, unmixing_mode, sensor='sentinel2'):
+    """Start the full-resolution job for preview results outside the request thread"""
+    thread = threading.Thread(
+        target=run_full_resolution_job,
+        args=(region_key, coordinates, dates, output_dir, amc, precipitation, crs, endmember, unmixing_mode, sensor),
+        daemon=True
+    )
+    # Tracked so background ingestion yields to it as well (see request_work_running)
+    with full_resolution_guard:
+        full_resolution_threads.add(thread)
+    thread.start()
+    return thread
+
+
+def refresh_cached_dates(output_dir, region_key, stale_downstream, existing_data, dates_to_process, request_params):
+    """
+    Refresh the cn/runoff stages of cached dates in place and update their CSV rows.
+    Dates that cannot be refreshed (no stored AMC II layer) are moved to dates_to_process.
+    """
+    refreshed = {'full': {}, 'preview': {}}
+    for date_str, info in sorted(stale_downstream.items()):
+        date_dir = os.path.join(output_dir, region_key, date_str)
+        curve_number = refresh_downstream_stages(date_dir, stage_params(date_str, **request_params))
+        if curve_number is None:
+            print(f"Date {date_str} has no stored AMC II layer, will reprocess")
+            existing_data.pop(date_str, None)
+            dates_to_process.append(datetime.strptime(date_str, '%Y-%m-%d'))
+            continue
+        existing_data[date_str]['curve-number'] = curve_number
+        refreshed[info['resolution']][date_str] = existing_data[date_str]
+
+    for resolution, rows in refreshed.items():
+        if rows:
+            append_to_csv(output_dir, region_key, rows, resolution=resolution)
+    dates_to_process.sort()
+
+
+def run_statistics_request(region_name, coordinates, start_date, end_date, output_dir, crs):
+    """
+    Statistics-only analysis (mode=stats): NDVI, water fraction and weather are reduced inside Earth Engine
+    in one batched request. Fractions and curve numbers need the unmixing and are only reported where a
+    full run has already cached them (null otherwise).
+    """
+    region_key = register_region(output_dir, region_name, coordinates, crs)
+    requested_dates = get_dates_from_range(start_date, end_date)
+    print(f"Statistics-only analysis for region {region_key}: {start_date} to {end_date} ({len(requested_dates)} dates)")
+
+    outputs = run_statistics_with_coordinates(region_key, coordinates, requested_dates, output_dir, crs=crs)
+
+    _, cached_data, _, _ = check_existing_data(output_dir, region_key, requested_dates, accept_preview=True)
+    for date_str, values in outputs.items():
+        cached_values = cached_data.get(date_str, {})
+        for key in ('vegetation-fraction', 'soil-fraction', 'curve-number'):
+            values[key] = cached_values.get(key)
+
+    return {
+        'success': True,
+        'message': 'Statistics computed in Earth Engine',
+        'parameters': {
+            'region_name': region_name,
+            'region_id': region_key,
+            'start_date': start_date,
+            'end_date': end_date,
+            'coordinates': coordinates,
+            'crs': crs,
+            'mode': 'stats',
+            'scale': STATS_SCALE,
+            'num_coordinates': len(coordinates),
+            'dates_with_imagery': len(outputs),
+            'dates_with_cached_fractions': sum(1 for d in outputs if d in cached_data)
+        },
+        'outputs': outputs
+    }
+
+
+def run_hydrosens_background(thread_id, region_name, coordinates, start_date, end_date, output_dir, amc, precipitation, crs, endmember, unmixing_mode='mesma', preview=False, memory_profile=False, sensor='sentinel2'):
     """
-    Wrapper function that runs hydrosens analysis in background with caching
+    Wrapper function that runs hydrosens analysis in background with caching.
+    With preview=True the analysis runs at PREVIEW_SCALE and a full-resolution job is scheduled afterwards.
+    sensor selects the satellite ('sentinel2' or 'landsat'); Landsat results are cached in <region_id>/landsat.
+    With memory_profile=True RSS and top allocators are recorded per stage into the job record and
+    into OUTPUT_MASTER/<region_id>/memory_profiles/<thread_id>.json.
     """
     global current_result
+    profiler = None
     
     try:
         print(f"Starting Hydrosens analysis (Thread: {thread_id}) for region: {region_name}")
+
+        # Caches are keyed on the polygon, the region name is only an alias
+        region_key = register_region(output_dir, region_name, coordinates, crs)
+        print(f"Region '{region_name}' resolved to region ID {region_key}")
+        sensor = get_sensor(sensor)
+        data_key = sensor_storage_key(region_key, sensor)
+        # Background ingestion processes new Sentinel-2 scenes of this region with the same parameters
+        if sensor.name == 'sentinel2':
+            record_ingest_params(output_dir, region_key, {
+                'amc': amc,
+                'precipitation': precipitation,
+                'endmember': endmember,
+                'unmixing_mode': unmixing_mode
+            })
+
+        if memory_profile:
+            profiler = MemoryProfiler(
+                run_id=thread_id,
+                report_path=os.path.join(output_dir, region_key, 'memory_profiles', f'{thread_id}.json')
+            )
         
         # Step 1: Get all dates in the requested range
         requested_dates = get_dates_from_range(start_date, end_date)
         print(f"Requested date range: {start_date} to {end_date} ({len(requested_dates)} dates)")
         
         # Step 2 & 3: Check existing data and determine what needs processing
-        dates_to_process, existing_data = check_existing_data(output_dir, region_name, requested_dates)
+        full_scale = sensor.native_scale
+        scale = max(PREVIEW_SCALE, full_scale) if preview else full_scale
+        request_params = {
+            'coordinates': coordinates,
+            'crs': crs,
+            'endmember': endmember,
+            'unmixing_mode': unmixing_mode,
+            'scale': scale,
+            'amc': amc,
+            'p': precipitation,
+            'sensor': sensor.name
+        }
+        dates_to_process, existing_data, expired_no_data, stale_downstream = check_existing_data(
+            output_dir, data_key, requested_dates, accept_preview=preview, request_params=request_params,
+            accept_scales=(float(full_scale),) if preview else ())
+
+        # Cached dates where only AMC or precipitation changed: rebuild CN/runoff from the stored AMC II layer
+        if stale_downstream:
+            with get_region_lock(region_key):
+                refresh_cached_dates(output_dir, data_key, stale_downstream, existing_data, dates_to_process,
+                                     request_params)
         
         if len(dates_to_process) == 0:
             print("All requested dates already have complete data, no processing needed")
@@ -47,6 +259,7 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
                 'message': 'All data already available from cache',
                 'parameters': {
                     'region_name': region_name,
+                    'region_id': region_key,
                     'start_date': start_date,
                     'end_date': end_date,
                     'amc': amc,
@@ -54,6 +267,9 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
                     'coordinates': coordinates,
                     'crs': crs,
                     'endmember': endmember,
+                    'unmixing_mode': unmixing_mode,
+                    'sensor': sensor.name,
+                    'preview': preview,
                     'num_coordinates': len(coordinates),
                     'dates_from_cache': len(existing_data),
                     'dates_processed': 0
@@ -62,17 +278,23 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
             }
         else:
             # Step 4: Run hydrosens on the dates that have no data
-            print(f"Processing {len(dates_to_process)} dates that need analysis")
-            new_results = run_hydrosens_with_coordinates(
-                region_name=region_name,
-                coordinates=coordinates,
-                dates_to_process=dates_to_process,  # Pass specific dates instead of range
-                output_dir=output_dir,
-                amc=amc,
-                precipitation=precipitation,
-                crs=crs,
-                endmember=endmember
-            )
+            print(f"Processing {len(dates_to_process)} dates that need analysis at {scale}m")
+            with get_region_lock(region_key):
+                new_results = run_hydrosens_with_coordinates(
+                    region_name=region_key,
+                    coordinates=coordinates,
+                    dates_to_process=dates_to_process,  # Pass specific dates instead of range
+                    output_dir=output_dir,
+                    amc=amc,
+                    precipitation=precipitation,
+                    crs=crs,
+                    endmember=endmember,
+                    refresh_dates=expired_no_data,
+                    unmixing_mode=unmixing_mode,
+                    scale=scale,
+                    memory_profiler=profiler,
+                    sensor=sensor.name
+                )
             
             # Step 5: Determine which dates had no data (were requested but not in results)
             processed_date_strings = set(new_results.keys())
@@ -80,10 +302,16 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
             no_data_dates = list(requested_date_strings - processed_date_strings)
             
             if no_data_dates:
-                print(f"Found {len(no_data_dates)} dates with no Sentinel-2 imagery available")
+                print(f"Found {len(no_data_dates)} dates with no {sensor.label} imagery available")
             
             # Step 6: Append the new results to the CSV file, including NO DATA markers
-            csv_path = append_to_csv(output_dir, region_name, new_results, no_data_dates)
+            csv_path = append_to_csv(output_dir, data_key, new_results, no_data_dates,
+                                     resolution='preview' if preview else 'full')
+
+            # Preview results are replaced once the full-resolution run is done
+            if preview and new_results:
+                schedule_full_resolution(region_key, coordinates, sorted(new_results.keys()), output_dir,
+                                         amc, precipitation, crs, endmember, unmixing_mode, sensor.name)
             
             # Step 7: Return combined result (excluding NO DATA entries)
             combined_results = {**existing_data, **new_results}
@@ -93,6 +321,7 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
                 'message': 'Hydrosens analysis completed successfully',
                 'parameters': {
                     'region_name': region_name,
+                    'region_id': region_key,
                     'start_date': start_date,
                     'end_date': end_date,
                     'amc': amc,
@@ -100,6 +329,11 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
                     'coordinates': coordinates,
                     'crs': crs,
                     'endmember': endmember,
+                    'unmixing_mode': unmixing_mode,
+                    'sensor': sensor.name,
+                    'preview': preview,
+                    'scale': scale,
+                    'full_resolution_scheduled': bool(preview and new_results),
                     'num_coordinates': len(coordinates),
                     'dates_from_cache': len(existing_data),
                     'dates_processed': len(new_results),
@@ -107,6 +341,9 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
                 },
                 'outputs': combined_results
             }
+
+        if profiler is not None:
+            current_result['memory_profile'] = profiler.summary()
         
         print(f"Thread {thread_id} completed successfully for region: {region_name}")
         result_ready_event.set()
@@ -122,8 +359,14 @@ def run_hydrosens_background(thread_id, region_name, coordinates, start_date, en
             'success': False,
             'error': str(e)
         }
+        if profiler is not None:
+            current_result['memory_profile'] = profiler.summary()
         result_ready_event.set()
 
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
 @app.route('/hydrosens', methods=['POST'])
 def run_hydrosens_endpoint():
     """
@@ -145,6 +388,12 @@ def run_hydrosens_endpoint():
         coordinates = data.get('coordinates')
         crs = data.get('crs', 'EPSG:4326')
         endmember = data.get('endmember')  # Extract endmember parameter
+        unmixing_mode = (data.get('unmixing_mode') or 'mesma').lower()  # 'mesma' or fast 'fcls'
+        preview = bool(data.get('preview', False))  # coarse preview first, full resolution scheduled afterwards
+        sensor = (data.get('sensor') or 'sentinel2').lower()  # 'sentinel2' or 'landsat' (Landsat 8/9)
+        memory_profile = bool(data.get('memory_profile', MEMORY_PROFILE))  # per-stage RSS/allocation report
+        profile = profiling_requested(request)  # X-HydroSENS-Profile: 1 runs the job under the CPU profiler
+        mode = (data.get('mode') or 'full').lower()  # 'full' raster pipeline or 'stats' (Earth Engine statistics only)
         
         # Validate required parameters
         if not all([start_date, end_date, coordinates]):
@@ -159,6 +408,31 @@ def run_hydrosens_endpoint():
             return jsonify({
                 "error": f"Missing required parameters: {', '.join(missing)}"
             }), 400
+
+        if unmixing_mode not in ('mesma', 'fcls'):
+            return jsonify({
+                "error": f"Invalid unmixing_mode '{unmixing_mode}'. Expected 'mesma' or 'fcls'"
+            }), 400
+
+        if sensor not in SENSORS:
+            return jsonify({
+                "error": f"Invalid sensor '{sensor}'. Expected one of: {', '.join(sorted(SENSORS))}"
+            }), 400
+
+        if mode == 'stats' and sensor != 'sentinel2':
+            return jsonify({
+                "error": "mode 'stats' is only available for sensor 'sentinel2'"
+            }), 400
+
+        if mode not in ('full', 'stats'):
+            return jsonify({
+                "error": f"Invalid mode '{mode}'. Expected 'full' or 'stats'"
+            }), 400
+
+        if mode == 'stats':
+            # Statistics requests are answered directly and never cancel a running full analysis
+            os.makedirs(output_master, exist_ok=True)
+            return jsonify(run_statistics_request(region_name, coordinates, start_date, end_date, output_master, crs)), 200
         
         # Create output directory
         os.makedirs(output_master, exist_ok=True)
@@ -181,10 +455,20 @@ def run_hydrosens_endpoint():
             result_ready_event.clear()
             
             # Create and start new thread with region_name and endmember parameter
-            current_thread = threading.Thread(
-                target=run_hydrosens_background,
-                args=(new_thread_id, region_name, coordinates, start_date, end_date, output_master, amc, precipitation, crs, endmember)
-            )
+            job_args = (new_thread_id, region_name, coordinates, start_date, end_date, output_master, amc, precipitation, crs, endmember, unmixing_mode, preview, memory_profile, sensor)
+            profiler = None
+            if profile:
+                # The profiler has to run inside the job thread, the profile ID is the job ID
+                profiler = RequestProfiler(new_thread_id, label=f"POST /hydrosens {region_name}")
+                current_thread = threading.Thread(
+                    target=run_profiled,
+                    args=(profiler, run_hydrosens_background) + job_args
+                )
+            else:
+                current_thread = threading.Thread(
+                    target=run_hydrosens_background,
+                    args=job_args
+                )
             current_thread_id = new_thread_id
             current_thread.start()
         
@@ -193,6 +477,7 @@ def run_hydrosens_endpoint():
         app.logger.info(f"  Date range: {start_date} to {end_date}")
         app.logger.info(f"  AMC: {amc}, Precipitation: {precipitation}mm")
         app.logger.info(f"  Endmembers: {endmember} ({'vegetation, soil' if endmember == 2 else 'vegetation, impervious, soil'})")
+        app.logger.info(f"  Sensor: {sensor}, Unmixing mode: {unmixing_mode}, Preview: {preview}")
         app.logger.info(f"  Coordinates: {len(coordinates)} points, CRS: {crs}")
         app.logger.info(f"  Output directory: {output_master}")
         
@@ -205,16 +490,25 @@ def run_hydrosens_endpoint():
             print(f"Thread {new_thread_id} was superseded by {current_thread_id}")
             return jsonify({}), 200  # Conflict
         
+        if profiler is not None and current_result is not None:
+            current_result['profile_id'] = new_thread_id
+
         # Return the result
         if current_result and current_result.get('success'):
             print(f"Thread {new_thread_id} completed successfully")
-            return jsonify(current_result), 200
+            response = jsonify(current_result), 200
         else:
             error_msg = current_result.get('error', 'Unknown error') if current_result else 'No result available'
             print(f"Thread {new_thread_id} failed: {error_msg}")
-            return jsonify({
+            response = jsonify({
                 "error": error_msg
             }), 500
+
+        if profiler is not None:
+            # The job thread writes the profile right after publishing its result
+            profiler.saved.wait(timeout=30)
+            response[0].headers[PROFILE_ID_HEADER] = new_thread_id
+        return response
         
     except Exception as e:
         app.logger.error(f"Error in Hydrosens analysis: {str(e)}")
@@ -229,13 +523,17 @@ def get_csv_file():
     region_name = request.args.get('region_name', 'Unknown Region')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    sensor = (request.args.get('sensor') or 'sentinel2').lower()
     
     # Validate required parameters
     if not start_date or not end_date:
         return jsonify({"error": "Missing required parameters: start_date, end_date"}), 400
+    if sensor not in SENSORS:
+        return jsonify({"error": f"Invalid sensor '{sensor}'"}), 400
     
     output_master = os.getenv('OUTPUT_MASTER', '/app/data/output')
-    csv_file_path = os.path.join(output_master, region_name, 'output.csv')
+    region_key = sensor_storage_key(region_storage_key(output_master, region_name), sensor)
+    csv_file_path = os.path.join(output_master, region_key, 'output.csv')
 
     if not os.path.exists(csv_file_path):
         return jsonify({"error": f"CSV output file not found for region '{region_name}'."}), 404
@@ -314,7 +612,11 @@ def get_csv_file():
 
 @app.route('/hydrosens/export-tifs', methods=['GET'])
 def export_tifs_zip():
-    """Create and return a zip of .tif files within the specified date range."""
+    """
+    Create and return a zip of .tif files within the specified date range.
+    With the optional amc (and precipitation) query parameters, CCN_final.tif and Runoff.tif are replaced by
+    products derived from the stored AMC II curve numbers for that AMC.
+    """
     import zipfile
     from io import BytesIO
     from datetime import datetime
@@ -323,13 +625,21 @@ def export_tifs_zip():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     region_name = request.args.get('region_name', 'Unknown Region')
+    amc = request.args.get('amc', type=int)
+    precipitation = request.args.get('precipitation', type=float)
+    sensor = (request.args.get('sensor') or 'sentinel2').lower()
     
     if not start_date or not end_date:
         return jsonify({"error": "Missing required parameters: start_date, end_date"}), 400
+    if amc is not None and amc not in (1, 2, 3):
+        return jsonify({"error": "amc must be 1, 2 or 3"}), 400
+    if sensor not in SENSORS:
+        return jsonify({"error": f"Invalid sensor '{sensor}'"}), 400
 
     output_master = os.getenv('OUTPUT_MASTER', '/app/data/output')
-    # Update path to include region folder
-    region_output_dir = os.path.join(output_master, region_name)
+    # Update path to include region folder (and the sensor subfolder for sensors other than Sentinel-2)
+    region_output_dir = os.path.join(output_master,
+                                     sensor_storage_key(region_storage_key(output_master, region_name), sensor))
     zip_buffer = BytesIO()
 
     if not os.path.exists(region_output_dir):
@@ -359,9 +669,18 @@ def export_tifs_zip():
                         print(f"Including date folder: {date_folder}")
                         
                         # Add all .tif files from this date folder
+                        derive = amc is not None and os.path.exists(os.path.join(date_path, CN_AMCII_FILE))
                         for file_name in os.listdir(date_path):
                             if file_name.endswith('.tif'):
                                 file_path = os.path.join(date_path, file_name)
+                                if derive and file_name == 'CCN_final.tif':
+                                    file_path = amc_cn_layer(date_path, amc)
+                                elif derive and file_name == 'Runoff.tif':
+                                    if precipitation is None:
+                                        # The stored runoff belongs to the AMC of the original run
+                                        print(f"Skipping Runoff.tif for {date_folder}: precipitation needed for AMC {amc}")
+                                        continue
+                                    file_path = amc_runoff_layer(date_path, amc, precipitation)
                                 arcname = os.path.join(date_folder, file_name)
                                 zipf.write(file_path, arcname=arcname)
                                 tif_files_found = True
@@ -395,6 +714,91 @@ def export_tifs_zip():
         app.logger.error(f"Error creating TIF zip: {str(e)}")
         return jsonify({"error": f"Failed to create TIF zip: {str(e)}"}), 500
 
+@app.route('/hydrosens/runoff', methods=['POST'])
+def runoff_what_if_endpoint():
+    """
+    Recompute runoff from the cached curve number layers for a list of precipitation depths.
+    No Earth Engine access: only dates that were already processed for the region are evaluated.
+
+    JSON body:
+        region_name: Region to evaluate
+        precipitations: List of precipitation depths in mm
+        dates: Optional list of 'YYYY-MM-DD' dates, or start_date/end_date (default: all cached dates)
+        amc: Optional antecedent moisture condition (1, 2 or 3); curve numbers are then derived from the
+             stored AMC II layer instead of using CCN_final.tif as processed
+        include_rasters: If true, a zip with runoff.json and Runoff_P<depth>.tif per date is returned
+    """
+    from io import BytesIO
+
+    data = request.get_json() or {}
+    region_name = data.get('region_name')
+    precipitations = data.get('precipitations')
+    if precipitations is None and data.get('precipitation') is not None:
+        precipitations = [data.get('precipitation')]
+
+    if not region_name or not precipitations:
+        return jsonify({"error": "Missing required parameters: region_name, precipitations"}), 400
+    try:
+        precipitations = [float(p) for p in precipitations]
+    except (TypeError, ValueError):
+        return jsonify({"error": "precipitations must be a list of numbers (mm)"}), 400
+    if any(p < 0 for p in precipitations):
+        return jsonify({"error": "precipitations must not be negative"}), 400
+    amc = data.get('amc')
+    if amc is not None and amc not in (1, 2, 3):
+        return jsonify({"error": "amc must be 1, 2 or 3"}), 400
+
+    try:
+        dates = data.get('dates')
+        if dates is None and data.get('start_date') and data.get('end_date'):
+            dates = [d.strftime('%Y-%m-%d') for d in get_dates_from_range(data['start_date'], data['end_date'])]
+
+        output_master = os.getenv('OUTPUT_MASTER', '/app/data/output')
+        region_key = region_storage_key(output_master, region_name)
+        region_dir = os.path.join(output_master, region_key)
+        if amc is None:
+            cn_paths = cached_cn_dates(region_dir, dates)
+        else:
+            cn_paths = {date_str: amc_cn_layer(os.path.dirname(path), amc)
+                        for date_str, path in cached_cn_dates(region_dir, dates, cn_file=CN_AMCII_FILE).items()}
+        if not cn_paths:
+            return jsonify({"error": f"No cached curve number layers found for region '{region_name}'"}), 404
+
+        result = {
+            'region_name': region_name,
+            'region_id': region_key,
+            'precipitations': precipitations,
+            'amc': amc,
+            'dates_missing': sorted(set(dates) - set(cn_paths)) if dates is not None else []
+        }
+
+        if not data.get('include_rasters'):
+            result['outputs'] = runoff_what_if(cn_paths, precipitations)
+            return jsonify(result), 200
+
+        with tempfile.TemporaryDirectory() as raster_dir:
+            result['outputs'] = runoff_what_if(cn_paths, precipitations, raster_dir=raster_dir)
+            zip_buffer = BytesIO()
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                zipf.writestr('runoff.json', json.dumps(result, indent=2))
+                for root, _, files in os.walk(raster_dir):
+                    for file_name in files:
+                        file_path = os.path.join(root, file_name)
+                        zipf.write(file_path, arcname=os.path.relpath(file_path, raster_dir))
+        zip_buffer.seek(0)
+        return send_file(
+            zip_buffer,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=f'runoff_{region_name}.zip'
+        )
+
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date format. Expected YYYY-MM-DD. Error: {str(e)}"}), 400
+    except Exception as e:
+        app.logger.error(f"Error computing runoff what-if for region '{region_name}': {str(e)}")
+        return jsonify({"error": f"Failed to compute runoff: {str(e)}"}), 500
+
 @app.route('/hydrosens/cache', methods=['POST'])
 def check_cache():
     """Check if cache exists for the specified regions."""
@@ -419,7 +823,7 @@ def check_cache():
             if not isinstance(region_name, str):
                 return jsonify({"error": f"Invalid region name: {region_name}. Must be a string."}), 400
             
-            region_output_dir = os.path.join(output_master, region_name)
+            region_output_dir = os.path.join(output_master, region_storage_key(output_master, region_name))
             has_cache[region_name] = os.path.exists(region_output_dir)
         
         return jsonify({"hasCache": has_cache}), 200
@@ -472,13 +876,19 @@ def delete_all_cache():
 
 @app.route('/hydrosens/cache/<region_name>', methods=['DELETE'])
 def delete_region_cache(region_name):
-    """Delete cache files for a specific region."""
+    """
+    Delete the cache of a region name.
+    Caches are shared by every alias of a geometry: the name is removed from the region registry and
+    the cache folder is only deleted once no other alias points at it. Passing a region ID deletes
+    that region with all its aliases.
+    """
     try:
         if not region_name or not isinstance(region_name, str):
             return jsonify({"error": "Invalid region name"}), 400
         
         output_master = os.getenv('OUTPUT_MASTER', '/app/data/output')
-        region_path = os.path.join(output_master, region_name)
+        region_key = region_storage_key(output_master, region_name)
+        region_path = os.path.join(output_master, region_key)
         
         if not os.path.exists(region_path):
             return jsonify({"error": f"Cache for region '{region_name}' not found"}), 404
@@ -486,21 +896,96 @@ def delete_region_cache(region_name):
         if not os.path.isdir(region_path):
             return jsonify({"error": f"'{region_name}' is not a valid region directory"}), 400
         
-        import shutil
-        shutil.rmtree(region_path)
+        with get_region_lock(region_key):
+            result = delete_region_alias(output_master, region_name)
         
-        print(f"Deleted cache for region: {region_name}")
+        if result['deleted']:
+            print(f"Deleted cache for region: {region_name}")
+            message = f"Cache for region '{region_name}' deleted successfully"
+        else:
+            print(f"Removed alias '{region_name}', cache kept for {result['remaining_aliases']}")
+            message = f"Region '{region_name}' removed, its cache is still used by other region names"
         
         return jsonify({
-            "message": f"Cache for region '{region_name}' deleted successfully",
-            "deleted_region": region_name
+            "message": message,
+            "deleted_region": region_name,
+            "region_id": result['region_id'],
+            "region_deleted": result['deleted'],
+            "remaining_aliases": result['remaining_aliases']
         }), 200
         
     except Exception as e:
         app.logger.error(f"Error deleting cache for region '{region_name}': {str(e)}")
         return jsonify({"error": f"Failed to delete cache for region '{region_name}': {str(e)}"}), 500
+
+
+@app.route('/hydrosens/region-id', methods=['POST'])
+def get_region_id():
+    """
+    Region ID of a polygon, the key other services store their per-region caches under.
+    Returns the registered ID of region_name when only a name is given.
+    """
+    data = request.get_json() or {}
+    coordinates = data.get('coordinates')
+    if coordinates:
+        try:
+            return jsonify({"region_id": compute_region_id(coordinates, data.get('crs', 'EPSG:4326'))}), 200
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid coordinates: {str(e)}"}), 400
+    region_name = data.get('region_name')
+    if not region_name:
+        return jsonify({"error": "Missing required parameter: coordinates or region_name"}), 400
+    region_id = resolve_region_id(os.getenv('OUTPUT_MASTER', '/app/data/output'), region_name)
+    if region_id is None:
+        return jsonify({"error": f"Region '{region_name}' is not registered"}), 404
+    return jsonify({"region_id": region_id}), 200
+
     
+@app.route('/hydrosens/ingestion', methods=['GET'])
+def get_ingestion_status():
+    """
+    Status of the scheduled background ingestion
+    """
+    return jsonify(ingestion_scheduler.status()), 200
+
+
+@app.route('/hydrosens/ee-stats', methods=['GET'])
+def get_ee_stats():
+    """
+    Earth Engine client counters since startup: calls, retries, throttled, timeouts, failures
+    """
+    return jsonify(ee_client_stats()), 200
+
+
+@app.route('/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List stored request profiles (newest first)
+    """
+    return jsonify({"profiles": list_profiles()}), 200
+
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@app.route('/profiles/<profile_id>/<kind>', methods=['GET'])
+def get_profile(profile_id, kind='meta'):
+    """
+    Download a stored profile: kind is 'meta' (summary with top functions), 'pstats' or 'speedscope'
+    """
+    path = profile_path(profile_id, kind)
+    if path is None:
+        return jsonify({"error": f"Invalid profile request. Expected kind in {sorted(PROFILE_FILES)}"}), 400
+    if not os.path.exists(path):
+        return jsonify({"error": f"Profile '{profile_id}' not found"}), 404
+
+    filename, mimetype = PROFILE_FILES[kind]
+    return send_file(path, mimetype=mimetype, as_attachment=kind != 'meta',
+                     download_name=f"{profile_id}_{filename}")
+
+
 if __name__ == "__main__":
     import logging
     logging.basicConfig(level=logging.INFO)
+    # With debug=True the reloader runs this file twice; only the child (WERKZEUG_RUN_MAIN) serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_ingestion()
     app.run(host="0.0.0.0", port=5050, debug=True)
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import the service modules the way app.py does (utils.<module>), run them from hydrosens/:
+#   python -m pytest -q tests
+# The modules shared with api-app live in shared/ (copied next to app.py in the Docker image)
+HYDROSENS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HYDROSENS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(HYDROSENS_DIR), "shared"))
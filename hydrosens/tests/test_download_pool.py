@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from utils.download_pool import DownloadPool
+
+
+class Recorder:
+    def __init__(self, delays=None, fail=None):
+        self.delays = delays or {}
+        self.fail = fail
+        self.started = []
+        self.lock = threading.Lock()
+
+    def __call__(self, item):
+        with self.lock:
+            self.started.append(item)
+        time.sleep(self.delays.get(item, 0.01))
+        if item == self.fail:
+            raise RuntimeError(f"download of {item} failed")
+        return item * 10
+
+
+def test_results_keep_item_order():
+    # Later items finish first, the consumer still sees them in order
+    fetch = Recorder(delays={0: 0.2, 1: 0.1, 2: 0.0})
+    pool = DownloadPool(max_workers=2, prefetch=3)
+    assert list(pool.prefetch(range(5), fetch)) == [(i, i * 10) for i in range(5)]
+
+
+def test_prefetch_is_bounded():
+    fetch = Recorder()
+    pool = DownloadPool(max_workers=2, prefetch=2)
+    results = pool.prefetch(range(20), fetch)
+
+    assert next(results) == (0, 0)
+    time.sleep(0.3)
+    # One item held by the consumer, prefetch_dates queued and one submitted waiting for a slot
+    assert len(fetch.started) <= 1 + 2 + 1
+    results.close()
+
+
+def test_fetch_errors_reach_the_consumer():
+    pool = DownloadPool(max_workers=2, prefetch=2)
+    received = []
+    with pytest.raises(RuntimeError, match="download of 2 failed"):
+        for item, result in pool.prefetch(range(6), Recorder(fail=2)):
+            received.append(item)
+    assert received == [0, 1]
+
+
+def test_stopping_early_stops_fetching():
+    fetch = Recorder(delays={i: 0.05 for i in range(50)})
+    pool = DownloadPool(max_workers=2, prefetch=2)
+    for item, _ in pool.prefetch(range(50), fetch):
+        if item == 1:
+            break
+    time.sleep(0.3)
+    started = len(fetch.started)
+    time.sleep(0.3)
+    assert len(fetch.started) == started < 10
+
+
+def test_run_all_returns_results_in_task_order():
+    pool = DownloadPool(max_workers=3)
+    tasks = [lambda d=d: (time.sleep(d), d)[1] for d in (0.1, 0.0, 0.05)]
+    assert pool.run_all(tasks) == [0.1, 0.0, 0.05]
+    pool.shutdown()
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+ee = pytest.importorskip("ee")
+pytest.importorskip("requests")
+
+from hydrosens_shared import ee_client
+from hydrosens_shared.ee_client import EECallTimeout, ee_call, is_retryable, is_throttled
+
+
+@pytest.fixture(autouse=True)
+def no_initialization(monkeypatch):
+    monkeypatch.setattr(ee_client, "_initialized", True)
+    monkeypatch.setattr(ee_client, "EE_MAX_QPS", 0)
+    monkeypatch.setattr(ee_client, "backoff_delay", lambda attempt: 0)
+
+
+@pytest.mark.parametrize("message", [
+    "HTTP Error 503: Service Unavailable",
+    "<HttpError 500 when requesting https://earthengine.googleapis.com>",
+    "Internal error.",
+    "Deadline exceeded",
+])
+def test_transient_errors_are_retried(message):
+    assert is_retryable(ee.EEException(message))
+
+
+@pytest.mark.parametrize("message", [
+    "Computation timed out.",
+    "User memory limit exceeded.",
+    "Image.select: Pattern 'B500' did not match any bands.",
+    "Total request size (50000000 bytes) must be less than or equal to 50331648 bytes.",
+    "Asset 'users/x/timeout_500' not found.",
+])
+def test_deterministic_errors_fail_fast(message):
+    assert not is_retryable(ee.EEException(message))
+
+
+def test_throttling():
+    assert is_throttled(ee.EEException("Too many concurrent aggregations."))
+    assert is_throttled(ee.EEException("status code: 429"))
+    assert not is_throttled(ee.EEException("Image has 429 bands"))
+
+
+def test_timed_out_call_keeps_its_slot(monkeypatch):
+    monkeypatch.setattr(ee_client, "_concurrency", threading.BoundedSemaphore(1))
+    release = threading.Event()
+
+    with pytest.raises(EECallTimeout):
+        ee_call(release.wait, 5, timeout=0.05, retries=0)
+    # The abandoned call is still running, so no other call may start
+    assert not ee_client._concurrency.acquire(timeout=0.1)
+
+    release.set()
+    time.sleep(0.05)
+    assert ee_call(lambda: "done", timeout=1) == "done"
+
+
+def test_retries_transient_errors_only():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ee.EEException("HTTP Error 502: Bad Gateway")
+        return "ok"
+
+    assert ee_call(flaky, timeout=1, retries=5) == "ok"
+    assert len(calls) == 3
+
+    def broken():
+        calls.append(1)
+        raise ee.EEException("Computation timed out.")
+
+    calls.clear()
+    with pytest.raises(ee.EEException):
+        ee_call(broken, timeout=1, retries=5)
+    assert len(calls) == 1
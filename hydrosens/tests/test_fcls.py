@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from utils.Functions_update import fcls_unmix, class_mean_spectra
+
+ENDMEMBERS = np.array([
+    [0.05, 0.30, 0.20],
+    [0.08, 0.28, 0.25],
+    [0.04, 0.26, 0.30],
+    [0.45, 0.24, 0.35],
+    [0.30, 0.22, 0.40],
+    [0.15, 0.20, 0.45],
+])  # bands x (vegetation, impervious, soil)
+
+
+def _mix(fractions):
+    fractions = np.asarray(fractions, dtype=float)
+    return (ENDMEMBERS @ fractions.reshape(3, -1)).reshape(ENDMEMBERS.shape[0], *fractions.shape[1:])
+
+
+def test_recovers_exact_mixtures():
+    fractions = np.array([
+        [[0.6, 0.0], [1.0, 0.2]],
+        [[0.3, 0.5], [0.0, 0.2]],
+        [[0.1, 0.5], [0.0, 0.6]],
+    ])
+    result = fcls_unmix(_mix(fractions), ENDMEMBERS)
+    np.testing.assert_allclose(result, fractions, atol=1e-8)
+
+
+def test_fractions_are_non_negative_and_sum_to_one():
+    rng = np.random.default_rng(0)
+    image = rng.uniform(0.0, 0.6, size=(6, 4, 5))
+    result = fcls_unmix(image, ENDMEMBERS)
+    assert np.all(result >= 0)
+    np.testing.assert_allclose(result.sum(axis=0), 1.0, atol=1e-8)
+
+
+def test_nodata_pixels_stay_nan():
+    image = _mix(np.full((3, 1, 2), 1 / 3))
+    image[:, 0, 1] = -9999
+    image[2, 0, 0] = np.nan
+    result = fcls_unmix(image, ENDMEMBERS)
+    assert np.isnan(result).all()
+
+
+def test_class_mean_spectra_orders_classes():
+    class_list = np.array(['soil', 'vegetation', 'soil'])
+    spectra = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    means = class_mean_spectra(class_list, spectra, ['vegetation', 'soil'])
+    assert means.tolist() == [[2.0, 2.0], [5.0, 5.0]]
+    with pytest.raises(ValueError):
+        class_mean_spectra(class_list, spectra, ['impervious'])
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+pytest.importorskip("scipy")
+
+from utils.Functions_update import Fill
+
+
+def test_fill_uses_nearest_valid_pixel():
+    data = np.array([
+        [1, 255, 255, 255],
+        [255, 255, 255, 255],
+        [255, 255, 255, 4],
+    ], dtype=np.int16)
+    filled = Fill(data, nodata_value=255)
+    assert filled.tolist() == [
+        [1, 1, 1, 4],
+        [1, 1, 4, 4],
+        [1, 4, 4, 4],
+    ]
+
+
+def test_fill_leaves_valid_pixels_and_input_untouched():
+    data = np.array([[5, 255], [6, 7]], dtype=np.int16)
+    original = data.copy()
+    filled = Fill(data)
+    assert filled[0, 1] in (5, 7)
+    assert filled[data != 255].tolist() == data[data != 255].tolist()
+    assert np.array_equal(data, original)
+
+
+def test_fill_without_holes_or_without_data_returns_a_copy():
+    data = np.full((2, 2), 9)
+    assert np.array_equal(Fill(data), data)
+    empty = np.full((2, 2), 255)
+    assert np.array_equal(Fill(empty), empty)
+
+
+def test_fill_accepts_rgba_reads():
+    rgba = np.zeros((1, 3, 4), dtype=np.uint8)
+    rgba[0, :, :3] = [[8, 8, 8], [255, 255, 255], [9, 9, 9]]
+    filled = Fill(rgba)
+    assert filled.shape == (1, 3)
+    assert filled[0, 0] == 8 and filled[0, 2] == 9 and filled[0, 1] in (8, 9)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from utils.Functions_update import (normalized_difference, fcls_unmix, classification, convert_amc,
+                                    clean_curve_number, slope_correction)
+from utils.runoff import runoff_from_cn
+
+# Tolerances of HYDROSENS_PRECISION=float32 against the float64 default, in output units:
+#   indices (NDVI, MNDWI, -1..1)       1e-6
+#   unmixing fractions (0..1)          1e-5
+#   curve numbers (0..100)             1e-3
+#   runoff depths (mm)                 1e-3 + 1e-5 relative
+INDEX_ATOL = 1e-6
+FRACTION_ATOL = 1e-5
+CN_ATOL = 1e-3
+RUNOFF_ATOL = 1e-3
+RUNOFF_RTOL = 1e-5
+
+rng = np.random.default_rng(42)
+
+
+def _both(array):
+    return array.astype(np.float64), array.astype(np.float32)
+
+
+@pytest.mark.parametrize("low,high", [(0.0, 1.0), (0.0, 0.05)])
+def test_normalized_difference(low, high):
+    a64, a32 = _both(rng.uniform(low, high, size=(50, 60)))
+    b64, b32 = _both(rng.uniform(low, high, size=(50, 60)))
+    a64[0, :5] = b64[0, :5] = a32[0, :5] = b32[0, :5] = 0
+
+    result32 = normalized_difference(a32, b32)
+    assert result32.dtype == np.float32
+    np.testing.assert_allclose(result32, normalized_difference(a64, b64), atol=INDEX_ATOL)
+    assert np.all(result32[0, :5] == 0)
+
+
+def test_fcls_unmix():
+    endmembers = np.array([
+        [0.05, 0.30, 0.20],
+        [0.08, 0.28, 0.25],
+        [0.04, 0.26, 0.30],
+        [0.45, 0.24, 0.35],
+        [0.30, 0.22, 0.40],
+        [0.15, 0.20, 0.45],
+    ])
+    fractions = rng.dirichlet(np.ones(3), size=(20, 30)).transpose(2, 0, 1)
+    image = np.einsum('bc,crx->brx', endmembers, fractions) + rng.normal(0, 0.005, size=(6, 20, 30))
+    image64, image32 = _both(image)
+
+    np.testing.assert_allclose(fcls_unmix(image32, endmembers), fcls_unmix(image64, endmembers),
+                               atol=FRACTION_ATOL)
+
+
+def test_classification_stays_float32(tmp_path):
+    table = tmp_path / "CN_lookup.csv"
+    table.write_text("0,1,2,3,4\n11,30,55,70,77\n0,77,86,91,94\n")
+    array1 = np.array([[11, 0], [11, 0]])
+    array2 = np.array([[1, 2], [4, 3]])
+
+    classified = classification(str(table), array1, array2)
+    assert classified.dtype == np.float32
+    assert classified.tolist() == [[30, 86], [77, 91]]
+
+
+@pytest.mark.parametrize("amc", [1, 2, 3])
+def test_curve_number_conversion(amc):
+    cn64, cn32 = _both(rng.uniform(30, 98, size=(40, 40)))
+    cn64[0, 0] = cn32[0, 0] = 0
+    cn64[0, 1] = cn32[0, 1] = np.nan
+
+    result32 = clean_curve_number(convert_amc(cn32, amc))
+    assert result32.dtype == np.float32
+    np.testing.assert_allclose(result32, clean_curve_number(convert_amc(cn64, amc)), atol=CN_ATOL)
+
+
+def test_slope_correction():
+    y, x = np.mgrid[0:60, 0:80]
+    dem = 200 + 15 * np.sin(x / 6.0) * np.cos(y / 9.0) + 0.8 * x
+    dem64, dem32 = _both(dem)
+    cn64, cn32 = _both(rng.uniform(40, 95, size=dem.shape))
+
+    result32 = slope_correction(cn32, dem32, cellsize=10)
+    assert result32.dtype == np.float32
+    np.testing.assert_allclose(result32, slope_correction(cn64, dem64, cellsize=10), atol=CN_ATOL)
+
+
+def test_runoff_from_cn():
+    cn64, cn32 = _both(np.round(rng.uniform(30, 100, size=(40, 40))))
+
+    for p in (5.0, 25.0, 120.0):
+        result32 = runoff_from_cn(cn32, p)
+        assert result32.dtype == np.float32
+        result64 = runoff_from_cn(cn64, p)
+        np.testing.assert_array_equal(np.isnan(result32), np.isnan(result64))
+        np.testing.assert_allclose(result32, result64, atol=RUNOFF_ATOL, rtol=RUNOFF_RTOL, equal_nan=True)
@@ -0,0 +1,90 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("osgeo")
+pytest.importorskip("ee")
+pytest.importorskip("requests")
+
+from utils import ingestion
+from utils.ingestion import IngestionScheduler
+from utils.region_registry import register_region
+
+SQUARE = [[10.0, 50.0], [10.01, 50.0], [10.01, 50.01], [10.0, 50.01]]
+RESULT = {"vegetation-fraction": 0.4, "soil-fraction": 0.5, "curve-number": 71.0,
+          "ndvi": 0.3, "temperature": 18.0, "precipitation": 10.0}
+
+
+def _day(days_ago):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (today - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+
+
+def _region(output_master, name, coordinates=SQUARE):
+    region_id = register_region(output_master, name, coordinates)
+    os.makedirs(os.path.join(output_master, region_id))
+    return region_id
+
+
+def _write_csv(output_master, region_id, rows):
+    columns = ["date", "veg_mean", "soil_mean", "curve_number", "ndvi", "temperature", "precipitation",
+               "resolution", "checked_at"]
+    pd.DataFrame(rows, columns=columns).to_csv(os.path.join(output_master, region_id, "output.csv"), index=False)
+
+
+def _scheduler(output_master):
+    return IngestionScheduler(output_master, lambda region_id: threading.Lock(), lambda: False,
+                              interval_hours=1, lookback_days=2)
+
+
+def test_ingestion_keeps_cached_rows(tmp_path, monkeypatch):
+    output_master = str(tmp_path)
+    region_id = _region(output_master, "field")
+    expired_checked_at = (datetime.utcnow() - timedelta(days=1)).isoformat(timespec='seconds')
+    _write_csv(output_master, region_id, [
+        ["2024-05-01", 0.3, 0.6, 70.0, 0.2, 15.0, 10.0, "full", None],
+        ["2024-05-06", 0.35, 0.55, 72.0, 0.25, 16.0, 10.0, "full", None],
+        [_day(2)] + ["NO DATA"] * 6 + [None, expired_checked_at],
+    ])
+
+    calls = []
+
+    def run_hydrosens(**kwargs):
+        calls.append(kwargs)
+        date_str = kwargs["dates_to_process"][0].strftime('%Y-%m-%d')
+        return {date_str: RESULT} if date_str == _day(1) else {}
+
+    monkeypatch.setattr(ingestion, "run_hydrosens_with_coordinates", run_hydrosens)
+    assert _scheduler(output_master).run_once() == 1
+
+    df = pd.read_csv(os.path.join(output_master, region_id, "output.csv"))
+    assert df["date"].tolist() == ["2024-05-01", "2024-05-06", _day(2), _day(1), _day(0)]
+    assert df.set_index("date").loc[_day(1), "curve_number"] == "71.0"
+    assert df.set_index("date").loc[_day(0), "veg_mean"] == "NO DATA"
+
+    refresh = {call["dates_to_process"][0].strftime('%Y-%m-%d'): call["refresh_dates"] for call in calls}
+    assert refresh == {_day(2): [_day(2)], _day(1): None, _day(0): None}
+
+
+def test_failing_region_does_not_stop_the_cycle(tmp_path, monkeypatch):
+    output_master = str(tmp_path)
+    broken_id = _region(output_master, "broken")
+    other = [[lon + 1, lat] for lon, lat in SQUARE]
+    other_id = _region(output_master, "other", other)
+
+    def run_hydrosens(**kwargs):
+        if kwargs["region_name"] == broken_id:
+            raise RuntimeError("Earth Engine call timed out")
+        return {}
+
+    monkeypatch.setattr(ingestion, "run_hydrosens_with_coordinates", run_hydrosens)
+    scheduler = _scheduler(output_master)
+    scheduler.run_once()
+
+    assert scheduler.state["regions_checked"] == 2
+    assert any("Earth Engine call timed out" in error for error in scheduler.state["errors"])
+    df = pd.read_csv(os.path.join(output_master, other_id, "output.csv"))
+    assert df["date"].tolist() == [_day(2), _day(1), _day(0)]
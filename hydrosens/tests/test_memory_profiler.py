@@ -0,0 +1,38 @@
+import json
+import tracemalloc
+
+from utils.memory_profiler import MemoryProfiler, active_profiles
+
+
+def test_tracemalloc_runs_until_the_last_profile_stops():
+    assert not tracemalloc.is_tracing()
+    first = MemoryProfiler(run_id="first")
+    second = MemoryProfiler(run_id="second")
+    assert active_profiles() == 2
+
+    first.stop()
+    first.stop()  # idempotent, must not release the second profile's session
+    assert tracemalloc.is_tracing()
+    assert active_profiles() == 1
+
+    second.checkpoint("after_first_stopped")
+    second.stop()
+    assert not tracemalloc.is_tracing()
+    assert active_profiles() == 0
+
+
+def test_report_is_written_at_stop_not_every_checkpoint(tmp_path):
+    path = tmp_path / "profile.json"
+    profiler = MemoryProfiler(run_id="job", report_path=str(path), write_interval=3600)
+    # Written once at start so an early OOM still leaves a report
+    assert [c["stage"] for c in json.loads(path.read_text())["checkpoints"]] == ["start"]
+
+    profiler.checkpoint("download", date="2024-01-01")
+    profiler.checkpoint("unmixing", date="2024-01-01")
+    assert len(json.loads(path.read_text())["checkpoints"]) == 1
+
+    profiler.stop()
+    report = json.loads(path.read_text())
+    assert [c["stage"] for c in report["checkpoints"]] == ["start", "download", "unmixing"]
+    assert report["checkpoints"][1]["context"] == {"date": "2024-01-01"}
+    assert list(tmp_path.iterdir()) == [path]
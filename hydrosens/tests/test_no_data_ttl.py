@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from utils.data_utils import parse_ttl_tiers, no_data_expired
+
+NOW = datetime(2024, 6, 30, 12, 0)
+
+
+def _date(days_ago):
+    return (NOW - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+
+
+def _checked(hours_ago):
+    return (NOW - timedelta(hours=hours_ago)).isoformat()
+
+
+def test_parse_ttl_tiers_sorts_and_skips_empty_parts():
+    assert parse_ttl_tiers("30:24, ,7:6") == [(7.0, 6.0), (30.0, 24.0)]
+
+
+def test_recent_markers_expire_after_their_tier_ttl():
+    # Default tiers: 7 days -> 6 h, 30 days -> 24 h, 90 days -> 168 h
+    assert not no_data_expired(_date(2), _checked(5), now=NOW)
+    assert no_data_expired(_date(2), _checked(7), now=NOW)
+    assert not no_data_expired(_date(20), _checked(23), now=NOW)
+    assert no_data_expired(_date(20), _checked(25), now=NOW)
+    assert no_data_expired(_date(60), _checked(200), now=NOW)
+
+
+def test_old_markers_never_expire():
+    assert not no_data_expired(_date(400), _checked(10000), now=NOW)
+    assert not no_data_expired(_date(400), None, now=NOW)
+
+
+def test_legacy_or_unreadable_markers_expire_inside_a_tier():
+    assert no_data_expired(_date(3), None, now=NOW)
+    assert no_data_expired(_date(3), "", now=NOW)
+    assert no_data_expired(_date(3), "not a timestamp", now=NOW)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from utils.pipeline import PublishStage
+
+
+def test_tasks_run_in_submission_order():
+    published = []
+    stage = PublishStage(max_pending=3)
+    for date, delay in enumerate((0.05, 0.0, 0.02, 0.0)):
+        stage.submit(lambda d=date, s=delay: (time.sleep(s), published.append(d)))
+    stage.close()
+    assert published == [0, 1, 2, 3]
+
+
+def test_submit_blocks_while_max_pending_dates_wait():
+    release = threading.Event()
+    stage = PublishStage(max_pending=1)
+    stage.submit(release.wait)   # taken by the worker
+    time.sleep(0.05)
+    stage.submit(lambda: None)   # fills the queue
+
+    submitted = threading.Event()
+    threading.Thread(target=lambda: (stage.submit(lambda: None), submitted.set()), daemon=True).start()
+    assert not submitted.wait(0.2)
+
+    release.set()
+    assert submitted.wait(1)
+    stage.close()
+
+
+def test_publish_error_is_raised_by_submit():
+    ran = []
+    stage = PublishStage(max_pending=1)
+    stage.submit(lambda: 1 / 0)
+    time.sleep(0.1)
+    with pytest.raises(ZeroDivisionError):
+        stage.submit(ran.append, 1)
+    with pytest.raises(ZeroDivisionError):
+        stage.close()
+    assert ran == []
+
+
+def test_publish_error_is_raised_by_close():
+    ran = []
+    stage = PublishStage(max_pending=2)
+    stage.submit(lambda: 1 / 0)
+    stage.submit(ran.append, 1)
+    with pytest.raises(ZeroDivisionError):
+        stage.close()
+    # Dates after a failed one are dropped
+    assert ran == []
+
+
+def test_abort_drops_queued_tasks():
+    release = threading.Event()
+    ran = []
+    stage = PublishStage(max_pending=2)
+    stage.submit(release.wait)
+    time.sleep(0.05)
+    stage.submit(ran.append, 1)
+    stage.submit(ran.append, 2)
+
+    stage.abort()
+    release.set()
+    stage._thread.join(1)
+    assert not stage._thread.is_alive()
+    assert ran == []
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ee")
+pytest.importorskip("requests")
+pytest.importorskip("osgeo")
+
+from utils import pixel_fetch
+from utils.pixel_fetch import plan_tiles, sub_grid, fits_single_request
+
+GRID = {
+    "crs": "EPSG:32633",
+    "geotransform": [500000.0, 10.0, 0.0, 5600000.0, 0.0, -10.0],
+    "width": 2500,
+    "height": 1700,
+    "projection": ""
+}
+
+
+def test_sub_grid_shares_pixel_edges():
+    window = sub_grid(GRID, row=100, col=40, height=20, width=30)
+    assert window["geotransform"] == [500400.0, 10.0, 0.0, 5599000.0, 0.0, -10.0]
+    assert (window["width"], window["height"]) == (30, 20)
+    assert window["crs"] == GRID["crs"]
+    assert sub_grid(GRID, 0, 0, GRID["height"], GRID["width"]) == GRID
+
+
+def test_tiles_cover_the_grid_exactly_once():
+    tiles = plan_tiles(GRID, n_bands=8)
+    assert len(tiles) > 1
+
+    coverage = np.zeros((GRID["height"], GRID["width"]), dtype=int)
+    for row, col, tile in tiles:
+        assert tile == sub_grid(GRID, row, col, tile["height"], tile["width"])
+        assert fits_single_request(tile, 8)
+        coverage[row:row + tile["height"], col:col + tile["width"]] += 1
+    assert (coverage == 1).all()
+
+
+def test_tiles_are_row_major():
+    origins = [(row, col) for row, col, _ in plan_tiles(GRID, n_bands=8)]
+    assert origins == sorted(origins)
+
+
+def test_fixed_tile_size(monkeypatch):
+    monkeypatch.setattr(pixel_fetch, "EE_TILE_SIZE", 1000)
+    tiles = plan_tiles(GRID, n_bands=1)
+    assert [(row, col) for row, col, _ in tiles] == [(r, c) for r in (0, 1000) for c in (0, 1000, 2000)]
+    last = tiles[-1][2]
+    assert (last["height"], last["width"]) == (700, 500)
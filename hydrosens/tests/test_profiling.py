@@ -0,0 +1,52 @@
+import json
+import os
+import time
+
+import pytest
+
+from hydrosens_shared import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_samples_are_collapsed_per_stack(profile_dir):
+    profiler = profiling.RequestProfiler("p1", label="test", interval_ms=1)
+    profiling.run_profiled(profiler, _busy, 0.2)
+
+    meta = json.loads((profile_dir / "p1" / "meta.json").read_text())
+    speedscope = json.loads((profile_dir / "p1" / "speedscope.json").read_text())
+    samples = speedscope["profiles"][0]["samples"]
+    weights = speedscope["profiles"][0]["weights"]
+
+    assert meta["status"] == "completed"
+    assert meta["samples"] > 10
+    assert meta["distinct_stacks"] == len(samples) < meta["samples"]
+    assert len({tuple(s) for s in samples}) == len(samples)
+    assert weights == sorted(weights, reverse=True)
+    names = {speedscope["shared"]["frames"][i]["name"] for s in samples for i in s}
+    assert "_busy" in names
+
+
+def test_prune_keeps_newest_and_drops_old(profile_dir):
+    now = time.time()
+    for i, age_days in enumerate([0, 1, 2, 3, 30]):
+        directory = profile_dir / f"p{i}"
+        directory.mkdir()
+        os.utime(directory, (now - age_days * 86400, now - age_days * 86400))
+    (profile_dir / "not a profile").mkdir()
+
+    deleted = profiling.prune_profiles(max_count=3, max_age_days=7, keep="p3")
+
+    assert sorted(deleted) == ["p4"]
+    assert sorted(p.name for p in profile_dir.iterdir()) == ["not a profile", "p0", "p1", "p2", "p3"]
+    assert profiling.prune_profiles(max_count=2, max_age_days=0) == ["p2", "p3"]
@@ -0,0 +1,61 @@
+import os
+
+from utils.region_registry import (canonicalize_polygon, compute_region_id, register_region, resolve_region_id,
+                                   load_registry, delete_region_alias)
+
+SQUARE = [[-120.5, 35.2], [-120.3, 35.2], [-120.3, 35.4], [-120.5, 35.4]]
+
+
+def test_canonical_ring_ignores_closing_vertex_orientation_and_start():
+    closed = SQUARE + [SQUARE[0]]
+    clockwise = list(reversed(SQUARE))
+    rotated = SQUARE[2:] + SQUARE[:2]
+    expected = canonicalize_polygon(SQUARE)
+    assert canonicalize_polygon(closed) == expected
+    assert canonicalize_polygon(clockwise) == expected
+    assert canonicalize_polygon(rotated) == expected
+    assert expected[0] == min(expected)
+
+
+def test_canonical_ring_drops_repeated_vertices_and_rounds():
+    noisy = [SQUARE[0], SQUARE[0], [SQUARE[1][0] + 1e-9, SQUARE[1][1]]] + SQUARE[2:]
+    assert canonicalize_polygon(noisy) == canonicalize_polygon(SQUARE)
+
+
+def test_region_id_is_stable_and_geometry_sensitive():
+    region_id = compute_region_id(SQUARE)
+    assert region_id.startswith("r") and len(region_id) == 17
+    assert compute_region_id(list(reversed(SQUARE)), "epsg:4326") == region_id
+    assert compute_region_id(SQUARE, "4326") == region_id
+    moved = [[x + 0.01, y] for x, y in SQUARE]
+    assert compute_region_id(moved) != region_id
+    assert compute_region_id(SQUARE, "EPSG:3857") != region_id
+
+
+def test_delete_alias_keeps_cache_shared_with_other_aliases(tmp_path):
+    output = str(tmp_path)
+    region_id = register_region(output, "first", SQUARE)
+    assert register_region(output, "second", SQUARE) == region_id
+    os.makedirs(os.path.join(output, region_id, "2024-01-01"))
+
+    result = delete_region_alias(output, "first")
+    assert result == {"region_id": region_id, "deleted": False, "remaining_aliases": ["second"]}
+    assert os.path.isdir(os.path.join(output, region_id))
+    assert resolve_region_id(output, "first") is None
+
+    result = delete_region_alias(output, "second")
+    assert result["deleted"] is True
+    assert not os.path.exists(os.path.join(output, region_id))
+    assert region_id not in load_registry(output)["regions"]
+
+
+def test_delete_by_region_id_removes_every_alias(tmp_path):
+    output = str(tmp_path)
+    region_id = register_region(output, "first", SQUARE)
+    register_region(output, "second", SQUARE)
+    os.makedirs(os.path.join(output, region_id))
+
+    result = delete_region_alias(output, region_id)
+    assert result["deleted"] is True
+    registry = load_registry(output)
+    assert registry["aliases"] == {} and registry["regions"] == {}
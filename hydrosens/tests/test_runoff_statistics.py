@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+
+from utils.runoff import runoff_from_cn, runoff_statistics
+
+
+def test_matches_per_pixel_statistics():
+    rng = np.random.default_rng(7)
+    cn = rng.integers(40, 101, size=5000).astype(float)
+    precipitations = [5.0, 25.0, 80.0]
+
+    stats = runoff_statistics(cn, precipitations)
+
+    assert [s["precipitation"] for s in stats] == precipitations
+    for entry, p in zip(stats, precipitations):
+        runoff = runoff_from_cn(cn, p)
+        assert entry["pixels"] == entry["valid_pixels"] == cn.size
+        assert entry["mean"] == pytest.approx(runoff.mean())
+        assert entry["std"] == pytest.approx(runoff.std())
+        assert entry["min"] == pytest.approx(runoff.min())
+        assert entry["max"] == pytest.approx(runoff.max())
+        for key, q in (("p10", 10), ("median", 50), ("p90", 90)):
+            assert entry[key] == pytest.approx(np.percentile(runoff, q, method="inverted_cdf"))
+        assert entry["runoff_coefficient"] == pytest.approx(runoff.mean() / p)
+
+
+def test_invalid_runoff_is_excluded():
+    # CN 100 has no storage, so zero precipitation gives 0/0
+    cn = np.array([100.0, 100.0, 70.0])
+
+    dry, wet = runoff_statistics(cn, [0.0, 10.0])
+
+    assert dry["pixels"] == 3 and dry["valid_pixels"] == 1
+    assert dry["runoff_coefficient"] is None
+    assert wet["valid_pixels"] == 3
+    assert wet["max"] == pytest.approx(10.0)
+
+
+def test_no_valid_pixels():
+    (entry,) = runoff_statistics(np.array([100.0]), [0.0])
+    assert entry["valid_pixels"] == 0
+    assert entry["mean"] is None and entry["median"] is None and entry["runoff_coefficient"] is None
+
+    (empty,) = runoff_statistics(np.array([]), [10.0])
+    assert empty["pixels"] == 0 and empty["mean"] is None
@@ -0,0 +1,50 @@
+from utils.stage_cache import (stage_params, stage_key, write_stage_manifest, clear_stage_manifest,
+                               first_stale_stage)
+
+POLYGON = [[10.0, 50.0], [10.1, 50.0], [10.1, 50.1], [10.0, 50.1]]
+
+
+def _params(**overrides):
+    values = dict(date_str="2024-06-01", coordinates=POLYGON, crs="EPSG:4326", endmember=3,
+                  unmixing_mode="mesma", scale=10, amc=2, p=10.0)
+    values.update(overrides)
+    return stage_params(**values)
+
+
+def test_stage_key_ignores_key_order_and_tracks_values():
+    assert stage_key({"a": 1, "b": 2}) == stage_key({"b": 2, "a": 1})
+    assert stage_key({"a": 1}) != stage_key({"a": 2})
+    assert len(stage_key({})) == 16
+
+
+def test_stage_params_normalize_equivalent_requests():
+    assert _params() == _params(amc="2", scale=10.0, unmixing_mode=None)
+    assert _params(amc=5)["cn"]["amc"] == 2
+    assert "sensor" not in _params()["imagery"]
+    assert _params(sensor="landsat")["imagery"]["sensor"] == "landsat"
+    assert _params(sensor="landsat")["imagery"]["sensor_revision"] == 2
+
+
+def test_first_stale_stage(tmp_path):
+    assert first_stale_stage(str(tmp_path), _params()) == "imagery"
+
+    write_stage_manifest(str(tmp_path), _params())
+    assert first_stale_stage(str(tmp_path), _params()) is None
+    assert first_stale_stage(str(tmp_path), _params(p=25.0)) == "runoff"
+    assert first_stale_stage(str(tmp_path), _params(amc=3)) == "cn"
+    assert first_stale_stage(str(tmp_path), _params(endmember=2)) == "imagery"
+    assert first_stale_stage(str(tmp_path), _params(sensor="landsat")) == "imagery"
+    moved = [[x + 0.01, y] for x, y in POLYGON]
+    assert first_stale_stage(str(tmp_path), _params(coordinates=moved)) == "imagery"
+
+    clear_stage_manifest(str(tmp_path))
+    assert first_stale_stage(str(tmp_path), _params()) == "imagery"
+
+
+def test_preview_request_accepts_full_resolution_cache(tmp_path):
+    write_stage_manifest(str(tmp_path), _params(scale=10))
+    preview = _params(scale=60)
+
+    assert first_stale_stage(str(tmp_path), preview) == "imagery"
+    assert first_stale_stage(str(tmp_path), preview, accept_scales=(10.0,)) is None
+    assert first_stale_stage(str(tmp_path), _params(scale=60, p=25.0), accept_scales=(10.0,)) == "runoff"
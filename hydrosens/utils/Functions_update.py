@@ -4,30 +4,38 @@ osgeo.gdal.UseExceptions()
 import rasterio
 from rasterio.mask import mask
 import numpy as np
-import scipy
-import geopandas as gpd
 import pandas as pd
 import csv
 from numpy import ndarray
 import timeit
-import rioxarray
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
-import xarray as xr
-from mesma.core import mesma, shade_normalisation
-from scipy.interpolate import griddata
-import netCDF4 as nc
-import geemap
+from scipy import ndimage
 from datetime import datetime
-import cdsapi
 from shapely.geometry import Polygon
 import math
+import threading
+from .memory_profiler import checkpoint, MEMORY_PROFILE_CHUNK_SAMPLE
 import os
 
+def gdal_float_type(dtype):
+    """
+    gdal_float_type
+        This function is used to pick the GDAL float type for an array: Float32 for float32 data, Float64 otherwise.
+    Parameters:
+        dtype: numpy dtype (or an array)
+    Returns:
+        gdal.GDT_Float32 or gdal.GDT_Float64
+    """
+    dtype = np.dtype(getattr(dtype, "dtype", dtype))
+    return gdal.GDT_Float32 if dtype == np.float32 else gdal.GDT_Float64
+
+
 def writeTCI(red_array, green_array, blue_array, reference, array_name, output):
     output_filename = os.path.join(output, array_name + ".tif")
     driver = gdal.GetDriverByName("GTiff")
-    output_raster = driver.Create(output_filename, reference.RasterXSize, reference.RasterYSize, 3, gdal.GDT_Float64)
+    output_raster = driver.Create(output_filename, reference.RasterXSize, reference.RasterYSize, 3,
+                                  gdal_float_type(red_array))
 
     output_raster.SetProjection(reference.GetProjection())
     output_raster.SetGeoTransform(reference.GetGeoTransform())
@@ -94,7 +102,8 @@ def CreateInt(array, reference, array_name, output):
 def CreateFloat(array, reference, array_name, output):
     """
     CreateFLoat
-        This function is used to create a float geotiff from a numpy array.
+        This function is used to create a float geotiff from a numpy array. float32 arrays are written as Float32,
+        everything else as Float64.
     Parameters:
         array:  a numpy array of the image
         reference: another geotiff that will serve as a reference for the new image
@@ -106,7 +115,7 @@ def CreateFloat(array, reference, array_name, output):
     """
     output_filename = output + "/" + array_name + ".tif"
     output_raster = gdal.GetDriverByName("GTiff").Create(output_filename, reference.RasterXSize,
-                                                         reference.RasterYSize, 1, gdal.GDT_Float64)
+                                                         reference.RasterYSize, 1, gdal_float_type(array))
     output_raster.SetProjection(reference.GetProjection())
     output_raster.SetGeoTransform(reference.GetGeoTransform())
     output_raster.GetRasterBand(1).WriteArray(array)
@@ -128,6 +137,8 @@ def Extract(raster_path, coordinates, crs, output_path, nodata_value = -9999):
     Returns:
         None
     """
+    import geopandas as gpd
+
     try:
         with rasterio.open(raster_path) as src:
             # Create polygon from coordinates
@@ -183,6 +194,8 @@ def Create_buffer(coordinates, crs, buffer_distance=250):
         List of buffered coordinates and CRS info for further processing
 
     """
+    import geopandas as gpd
+
     try:
         # Create polygon from coordinates
         polygon = coordinates_to_polygon(coordinates)
@@ -258,31 +271,53 @@ def extract_raster(source, reference, output):
         with rasterio.open(output, 'w', **source_meta) as dst:
             dst.write(source_data)
 
-def Fill(data):
+def Fill(data, nodata_value=255):
     """
     Fill
         This function is used to fill nodata portions of the raster
         with information from the nearest neighbors. This is used with the global soil dataset, as the coarse nature
         of the raster causes areas of land surrounding water bodies are also being incorrectly labeled as nodata.
         This way, all of the possible land is accounted for.
+        A Euclidean distance transform returns, for every nodata pixel, the index of the nearest valid pixel,
+        so the fill is exact and linear in the number of pixels. Valid pixels are left untouched.
     Parameters:
-        data: geotiff read using matplotlib.pyplot
+        data: 2D array of the geotiff read with GDAL (a 3D RGB(A) array read using matplotlib.pyplot is also accepted)
+        nodata_value: value marking the holes to fill
     Returns:
         Filled array
 
     """
-    # create a boolean mask that identifies locations in array with valid data and creates mask
-    mask = ~((data[:, :, 0] == 255) & (data[:, :, 1] == 255) & (data[:, :, 2] == 255))
-    # create grid
-    xx, yy = np.meshgrid(np.arange(data.shape[1]), np.arange(data.shape[0]))
-    xym =np.vstack((np.ravel(xx[mask]), np.ravel(yy[mask]))).T
-    # extracts data from array where mask is true
-    data0 = np.ravel(data[:, :, 0][mask])
-    # valid data points xym and corresponding data0 values are used to interpolate with nearest neighbor algorithm
-    interp0 = scipy.interpolate.NearestNDInterpolator(xym, data0)
-    # interpolated data is reshaped to original array
-    result0 = interp0(np.ravel(xx), np.ravel(yy)).reshape(xx.shape)
-    return result0
+    if data.ndim == 3:
+        # RGB(A) read: a pixel is nodata when all colour channels are nodata
+        invalid = np.all(data[:, :, :3] == nodata_value, axis=2)
+        data = data[:, :, 0]
+    else:
+        invalid = data == nodata_value
+
+    filled = np.array(data, copy=True)
+    if not invalid.any() or invalid.all():
+        return filled
+
+    # indices[k][i, j] is the k-th coordinate of the valid pixel nearest to (i, j)
+    indices = ndimage.distance_transform_edt(invalid, return_distances=False, return_indices=True)
+    filled[invalid] = data[indices[0][invalid], indices[1][invalid]]
+    return filled
+
+
+def normalized_difference(array1, array2):
+    """
+    normalized_difference
+        This function is used to compute a normalized difference index such as NDVI (nir, red) or MNDWI (green, swir1).
+        Pixels where both bands sum to zero are set to 0. The result keeps the dtype of the input bands.
+    Parameters:
+        array1: first band
+        array2: second band
+    Returns:
+        (array1 - array2) / (array1 + array2)
+    """
+    total = array1 + array2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.divide(array1 - array2, total, out=np.zeros_like(total), where=total != 0)
 
 
 def classification(CN_table,array1,array2):
@@ -360,6 +395,64 @@ def AMCI(array):
     return CCN_arr
 
 
+def convert_amc(array, amc):
+    """
+    convert_amc
+        This function is used to convert a slope-corrected AMC II CN map to the requested antecedent moisture condition.
+    Parameters:
+        array: the numpy array containing the CN values in AMC II
+        amc: antecedent moisture condition (1, 2 or 3)
+    Returns:
+        CN array for the requested AMC
+    """
+    if amc == 1:
+        return AMCI(array)
+    elif amc == 3:
+        return AMCIII(array)
+    return array
+
+
+def clean_curve_number(array):
+    """
+    clean_curve_number
+        This function is used to clean up a CN map before it is saved: NaN, infinite, zero and values above 100
+        are set to 100.
+    Parameters:
+        array: the numpy array containing the CN values
+    Returns:
+        cleaned copy of the CN array
+    """
+    CCN_arr = np.array(array, copy=True)
+    CCN_arr[~np.isfinite(CCN_arr)] = 100
+    CCN_arr[CCN_arr > 100] = 100
+    CCN_arr[CCN_arr == 0] = 100
+    return CCN_arr
+
+
+def slope_correction(CCNarr, DEM, cellsize):
+    """
+    slope_correction
+        This function is used to correct an AMC II CN map for slope with the Sharpley-Williams method. Slopes below
+        5 degrees are not corrected.
+    Parameters:
+        CCNarr: the numpy array containing the composite CN values in AMC II
+        DEM: elevation array on the same grid
+        cellsize: pixel size of the DEM in meters
+    Returns:
+        slope-corrected AMC II CN array, in the dtype of the inputs
+    """
+    # Create slope map isolating pixels >5%
+    px, py = np.gradient(DEM, cellsize)
+    slope_init = np.sqrt(px ** 2 + py ** 2)
+    slope = np.degrees(np.arctan(slope_init))
+
+    slope[slope < 5] = 0
+    slope[slope == 90] = 0
+
+    AMC_III = AMCIII(CCNarr)
+    return (1 / 3) * (AMC_III - CCNarr) * (1 - ((2 * 2.718281) ** (-13.86 * slope))) + CCNarr
+
+
 def prepare_S2image(fpath, scale_factor=10000.0, min_val=0, max_val=10000, no_data_pixels=-9999):
     """
     prepare_image
@@ -373,16 +466,21 @@ def prepare_S2image(fpath, scale_factor=10000.0, min_val=0, max_val=10000, no_da
         3D xarray.DataArray with reflectance scaled to range 0-1
 
     """
+    import rioxarray
+    import xarray as xr
+
     img = rioxarray.open_rasterio(fpath)
     return xr.where((img.min(dim='band')<=min_val) |
                     (img.max(dim='band')>max_val), no_data_pixels*scale_factor,
                     img).T / scale_factor
 
 
-def prepare_L8image(fpath, scale_factor=100000.0, min_val=0, max_val=100000, no_data_pixels=-9999):
+def prepare_L8image(fpath, scale_factor=10000.0, min_val=0, max_val=10000, no_data_pixels=-9999):
     """
     prepare_image
-        This function is used prepare an image for MESMA by scaling the reflectance from 0-1
+        This function is used prepare an image for MESMA by scaling the reflectance from 0-1.
+        Landsat bands are converted to reflectance * 10000 in Earth Engine before the download
+        (GEE_Functions_update.landsat_reflectance), so the scaling matches Sentinel-2.
     Parameters:
        fpath: filepath to an image
        scale_factor: scale factor of reflectance data (MESMA requires values to be in range 0-1)
@@ -392,6 +490,9 @@ def prepare_L8image(fpath, scale_factor=100000.0, min_val=0, max_val=100000, no_
         3D xarray.DataArray with reflectance scaled to range 0-1
 
     """
+    import rioxarray
+    import xarray as xr
+
     img = rioxarray.open_rasterio(fpath)
     return xr.where((img.min(dim='band')<=min_val) |
                     (img.max(dim='band')>max_val), no_data_pixels*scale_factor,
@@ -421,34 +522,28 @@ def prepare_sli(fpath, num_bands):
 def not_modelled_spots(arr1, arr2, arr3):
     """
      not_modelled_spots
-         This function is used to fill areas with no appropriate MESMA models (where all fractions = 0) by interpolating
-         nearby values. The final arrays are then normalized so that all fractions add up to 1.
+         This function is used to fill areas with no appropriate MESMA models (where all fractions = 0) with the
+         values of the nearest modelled pixel. The nearest-source index is computed once with a Euclidean distance
+         transform and applied to all fractions, which are then normalized in place so that they add up to 1.
      input:
          arr1, arr2, arr3: vegetation, impervious, and soil arrays obtained from the MESMA function
      output:
          normalized_array1, normalized_array2, normalized_array3: filled and normalized arrays for the final fraction maps
 
      """
-    filled_array1 = np.copy(arr1)
-    filled_array2 = np.copy(arr2)
-    filled_array3 = np.copy(arr3)
-    # Create the grid of non-zero pixel coordinates and interpolate values for 0 spots
-    zero_indices = np.argwhere((arr1 == 0) & (arr2 == 0) & (arr3 == 0))
-    non_zero_indices = np.argwhere((arr1 != 0) | (arr2 != 0) | (arr3 != 0))
-    x = non_zero_indices[:, 1]
-    y = non_zero_indices[:, 0]
-    # Interpolate the values for zero spots
-    filled_array1[zero_indices[:, 0], zero_indices[:, 1]] = griddata((x, y), arr1[non_zero_indices[:, 0], non_zero_indices[:, 1]], zero_indices, method='nearest')
-    filled_array2[zero_indices[:, 0], zero_indices[:, 1]] = griddata((x, y), arr2[non_zero_indices[:, 0], non_zero_indices[:, 1]], zero_indices, method='nearest')
-    filled_array3[zero_indices[:, 0], zero_indices[:, 1]] = griddata((x, y), arr3[non_zero_indices[:, 0], non_zero_indices[:, 1]], zero_indices, method='nearest')
-    # Normalize each array
-    stacked_array = np.stack((filled_array1, filled_array2, filled_array3))
-    sums = np.sum(stacked_array, axis=0)
-    normalized_array1 = filled_array1 / sums
-    normalized_array2 = filled_array2 / sums
-    normalized_array3 = filled_array3 / sums
-
-    return normalized_array1, normalized_array2, normalized_array3
+    fractions = np.stack((arr1, arr2, arr3)).astype(float, copy=False)
+    not_modelled = ~np.any(fractions != 0, axis=0)
+
+    if not_modelled.any() and not not_modelled.all():
+        # indices[k][i, j] is the k-th coordinate of the modelled pixel nearest to (i, j)
+        indices = ndimage.distance_transform_edt(not_modelled, return_distances=False, return_indices=True)
+        fractions[:, not_modelled] = fractions[:, indices[0][not_modelled], indices[1][not_modelled]]
+
+    # Normalize in place
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions /= fractions.sum(axis=0)
+
+    return fractions[0], fractions[1], fractions[2]
 
 
 def trimmed_library(fpath, num_bands, row_numbers= None):
@@ -476,105 +571,310 @@ def trimmed_library(fpath, num_bands, row_numbers= None):
     return class_list, em_spectra.T
 
 
-def doMESMA(class_list, img, trim_lib):
+class MesmaEngine:
+    """
+    MesmaEngine
+        Reusable Multiple Endmember Spectral Mixture Analysis executor. It keeps one MesmaCore for its lifetime,
+        builds the model look-up table once per class list, and unmixes the image in chunks whose size is derived
+        from a memory budget and the image width. An engine is not thread-safe: every job thread gets its own
+        (see get_mesma_engine) and only the look-up tables are shared.
+    Parameters:
+        n_cores: worker processes used by MesmaCore (MESMA_N_CORES, defaults to the CPU count)
+        memory_budget_mb: approximate working memory per chunk (MESMA_MEMORY_BUDGET_MB, default 256)
+        min_chunk_rows: lower bound of the rows per chunk (MESMA_MIN_CHUNK_ROWS, default 10), so a small budget
+            or a wide image does not end up in single-row chunks dominated by the MesmaCore overhead
+    """
+
+    # Look-up tables only depend on the class list, so they are shared between engines
+    _lut_cache = {}
+    _lut_lock = threading.Lock()
+
+    def __init__(self, n_cores=None, memory_budget_mb=None, min_chunk_rows=None):
+        from mesma.core import mesma
+
+        self.n_cores = int(n_cores or os.getenv("MESMA_N_CORES") or os.cpu_count() or 1)
+        self.memory_budget_mb = float(memory_budget_mb or os.getenv("MESMA_MEMORY_BUDGET_MB", "256"))
+        self.min_chunk_rows = max(1, int(min_chunk_rows or os.getenv("MESMA_MIN_CHUNK_ROWS", "10")))
+        self.core = mesma.MesmaCore(n_cores=self.n_cores)
+        self.chunk_timings = []
+
+    def look_up_table(self, class_list):
+        """Return (look_up_table, em_per_class, n_classes) for class_list, building it on first use."""
+        key = tuple(str(c) for c in class_list)
+        with self._lut_lock:
+            if key not in self._lut_cache:
+                self._lut_cache[key] = self._build_look_up_table(class_list)
+            return self._lut_cache[key]
+
+    @staticmethod
+    def _build_look_up_table(class_list):
+        from mesma.core import mesma
+
+        # Setup MESMA model based on trimmed spectral library
+        em_models = mesma.MesmaModels()
+        em_models.setup(class_list)
+
+        # Get the number of unique classes
+        n_classes = len(np.unique(class_list))
+
+        # Use standard 3-endmember model setup since we're including dummy impervious
+        # This should avoid the indexing issues
+        em_models.select_level(state=True, level=2)
+        em_models.select_level(state=True, level=3)
+        em_models.select_level(state=False, level=4)
+
+        for i in range(min(n_classes, 3)):  # Limit to 3 to avoid index errors
+            em_models.select_class(state=True, index=i, level=2)
+            em_models.select_class(state=True, index=i, level=3)
+            em_models.select_class(state=False, index=i, level=4)
+
+        return em_models.return_look_up_table(), em_models.em_per_class, n_classes
+
+    def chunk_rows(self, look_up_table, n_bands, n_classes, row_width):
+        """
+        Number of image rows unmixed per chunk so that a chunk stays within the memory budget.
+        MesmaCore evaluates one complexity level at a time and only keeps the best model per pixel between
+        levels, so the largest single level sets the working memory. The result is at least min_chunk_rows.
+        """
+        try:
+            n_models = max(sum(len(models) for models in level.values()) for level in look_up_table.values())
+        except Exception:
+            n_models = 1000
+        # Every model of the level keeps fractions, rmse and residuals for each pixel in float64
+        bytes_per_pixel = max(1, n_models) * (n_bands + n_classes + 2) * 8
+        rows = int(self.memory_budget_mb * 1024 * 1024 // (bytes_per_pixel * max(1, row_width)))
+        return max(self.min_chunk_rows, rows)
+
+    def run(self, class_list, img, trim_lib, dtype=np.float64, memory_profiler=None):
+        """
+        Unmix img with the spectral library trim_lib.
+        Parameters:
+            class_list: Material classes extracted from the spectral library
+            img: Prepared input image
+            trim_lib: Spectral library that has been pruned with the output of AMUSES
+            dtype: dtype of the output fractions (float64 or float32)
+            memory_profiler: Optional MemoryProfiler, sampled every MEMORY_PROFILE_CHUNK_SAMPLE chunks
+        Returns:
+            3D array with endmember fractions (number of bands depends on number of endmembers)
+        """
+        look_up_table, em_per_class, n_classes = self.look_up_table(class_list)
+        print(f"MESMA processing with {n_classes} endmember classes: {np.unique(class_list)}")
+
+        # Initialize output array - expect the standard setup
+        expected_bands = n_classes + 1  # materials + shade
+        out_fractions = np.full((expected_bands, img.shape[1], img.shape[2]), np.nan, dtype=dtype)
+
+        print(f"Initialized output array shape: {out_fractions.shape}")
+        print(f"Expected {expected_bands} bands: {n_classes} materials + 1 shade")
+
+        image_data = img.data
+        # The nodata mask is computed once and sliced per chunk
+        no_data_mask = image_data[0] == -9999
+        split = self.chunk_rows(look_up_table, image_data.shape[0], n_classes, image_data.shape[2])
+        print(f"MESMA using {self.n_cores} cores, {split} rows per chunk")
+        checkpoint(memory_profiler, "mesma_setup", rows_per_chunk=split, output_shape=list(out_fractions.shape))
+
+        self.chunk_timings = []
+        total_start = timeit.default_timer()
+        start_row = 0
+
+        try:
+            for chunk, start_row in enumerate(range(0, image_data.shape[1], split)):
+                start = timeit.default_timer()
+                stop_row = min(start_row + split, image_data.shape[1])
+
+                models, fractions, rmse, residuals = self.core.execute(
+                    image=image_data[:, start_row:stop_row, :],
+                    library=trim_lib,
+                    look_up_table=look_up_table,
+                    em_per_class=em_per_class,
+                    constraints=(0, 1.0, -0.1, 0.8, 0.025, -9999, -9999),
+                    no_data_pixels=np.where(no_data_mask[start_row:stop_row, :]),
+                    shade_spectrum=None,
+                    fusion_value=0.007,
+                    bands_selection_values=(0.99, 0.01)
+                )
+
+                np.seterr(invalid='ignore')
+
+                # Handle fractions array dimensions
+                min_bands = min(fractions.shape[0], out_fractions.shape[0])
+                out_fractions[:min_bands, start_row:stop_row, :] = fractions[:min_bands]
+
+                # If we got fewer bands than expected, fill the rest with zeros
+                if fractions.shape[0] < out_fractions.shape[0]:
+                    out_fractions[fractions.shape[0]:, start_row:stop_row, :] = 0
+
+                stop = timeit.default_timer()
+                self.chunk_timings.append({
+                    "chunk": chunk,
+                    "rows": [start_row, stop_row],
+                    "seconds": stop - start
+                })
+                print(f"Chunk {chunk} (rows {start_row}-{stop_row}): {stop - start:.2f} seconds")
+                if chunk % MEMORY_PROFILE_CHUNK_SAMPLE == 0 or stop_row == image_data.shape[1]:
+                    checkpoint(memory_profiler, "mesma_chunk", chunk=chunk, rows=[start_row, stop_row])
+
+        except Exception as e:
+            print(f"Error during MESMA processing: {e}")
+            print("Attempting to continue with partial results...")
+            # Fill any unprocessed areas with NaN
+            if start_row < img.shape[1]:
+                out_fractions[:, start_row:, :] = np.nan
+
+        total_stop = timeit.default_timer()
+        print(f"Total execution time: {total_stop - total_start:.2f} seconds over {len(self.chunk_timings)} chunks")
+
+        # Perform shade normalization if we have valid data
+        try:
+            from mesma.core import shade_normalisation
+            out_shade = shade_normalisation.ShadeNormalisation.execute(out_fractions, shade_band=-1)
+            # The normalisation divides in float64, keep the requested precision
+            out_shade = out_shade.astype(dtype, copy=False)
+            print(f"MESMA output shape after shade normalization: {out_shade.shape}")
+        except Exception as e:
+            print(f"Error during shade normalization: {e}")
+            print("Returning unnormalized results")
+            out_shade = out_fractions
+
+        print(f"Final MESMA output bands: {out_shade.shape[0]}")
+        checkpoint(memory_profiler, "mesma_shade_normalisation")
+
+        return out_shade
+
+
+_mesma_engines = threading.local()
+
+
+def get_mesma_engine():
+    """
+    Return the MesmaEngine of the calling thread, creating it on first use.
+    Interactive, full-resolution and ingestion jobs each run on their own thread, so a job reuses one engine
+    for all of its dates without sharing its MesmaCore or chunk timings with concurrent jobs.
+    """
+    engine = getattr(_mesma_engines, "engine", None)
+    if engine is None:
+        engine = _mesma_engines.engine = MesmaEngine()
+    return engine
+
+
+def doMESMA(class_list, img, trim_lib, dtype=np.float64, memory_profiler=None):
     """
      doMESMA
          This function carries out Multiple Endmember Spectral Mixture Analysis and subsequent shade normalization
+         with the MesmaEngine of the calling job thread
      Parameters:
          class_list: Material classes extracted from the spectral library
          img: Prepared input image
          trim_lib: Spectral library that has been pruned with the output of AMUSES
+         dtype: dtype of the output fractions (float64 or float32)
+         memory_profiler: Optional MemoryProfiler (see memory_profiler.py)
      Returns:
          3D array with endmember fractions (number of bands depends on number of endmembers)
      """
+    return get_mesma_engine().run(class_list, img, trim_lib, dtype=dtype, memory_profiler=memory_profiler)
 
-    # Setup MESMA model based on trimmed spectral library
-    em_models = mesma.MesmaModels()
-    em_models.setup(class_list)
-    
-    # Get the number of unique classes
-    n_classes = len(np.unique(class_list))
-    print(f"MESMA processing with {n_classes} endmember classes: {np.unique(class_list)}")
-    
-    # Use standard 3-endmember model setup since we're including dummy impervious
-    # This should avoid the indexing issues
-    em_models.select_level(state=True, level=2)
-    em_models.select_level(state=True, level=3)
-    em_models.select_level(state=False, level=4)
-    
-    for i in range(min(n_classes, 3)):  # Limit to 3 to avoid index errors
-        em_models.select_class(state=True, index=i, level=2)
-        em_models.select_class(state=True, index=i, level=3)
-        em_models.select_class(state=False, index=i, level=4)
-
-    # Initialize output array - expect the standard setup
-    expected_bands = n_classes + 1  # materials + shade
-    out_fractions = np.zeros((expected_bands, img.shape[1], img.shape[2])) * np.nan
-    
-    print(f"Initialized output array shape: {out_fractions.shape}")
-    print(f"Expected {expected_bands} bands: {n_classes} materials + 1 shade")
-    
-    total_start = timeit.default_timer()
-    start_row = 0
-    split = 10  # number of rows to be unmixed at a time
-
-    try:
-        for chunk in range(start_row, img.shape[1], split):
-            start = timeit.default_timer()
-            MESMA = mesma.MesmaCore(n_cores=8)
-
-            models, fractions, rmse, residuals = MESMA.execute(
-                image=img[:, start_row:start_row + split, :].data,
-                library=trim_lib,
-                look_up_table=em_models.return_look_up_table(),
-                em_per_class=em_models.em_per_class,
-                constraints=(0, 1.0, -0.1, 0.8, 0.025, -9999, -9999),
-                no_data_pixels=np.where(img[0, start_row:start_row + split, :].data == -9999),
-                shade_spectrum=None,
-                fusion_value=0.007,
-                bands_selection_values=(0.99, 0.01)
-            )
-
-            np.seterr(invalid='ignore')
-            
-            print(f"Chunk {chunk}: fractions shape = {fractions.shape}")
-            
-            # Handle fractions array dimensions
-            min_bands = min(fractions.shape[0], out_fractions.shape[0])
-            out_fractions[:min_bands, start_row:start_row + split, :] = fractions[:min_bands]
-            
-            # If we got fewer bands than expected, fill the rest with zeros
-            if fractions.shape[0] < out_fractions.shape[0]:
-                for missing_band in range(fractions.shape[0], out_fractions.shape[0]):
-                    out_fractions[missing_band, start_row:start_row + split, :] = 0
+def class_mean_spectra(class_list, em_spectra, classes):
+    """
+    class_mean_spectra
+        This function is used to reduce a spectral library to one mean spectrum per material class
+    Parameters:
+        class_list: 1D array with the class of each library spectrum (see prepare_sli)
+        em_spectra: 2D array of shape (bands, endmembers) (see prepare_sli)
+        classes: material classes to keep, in output order
+    Returns:
+        2D array of shape (bands, len(classes))
+    """
+    class_list = np.asarray(class_list)
+    means = []
+    for cls in classes:
+        members = class_list == cls
+        if not members.any():
+            raise ValueError(f"Spectral library has no '{cls}' spectra")
+        means.append(em_spectra[:, members].mean(axis=1))
+    return np.stack(means, axis=1)
 
-            start_row = start_row + split
 
-            stop = timeit.default_timer()
-            print('Chunk Time: ', stop - start)
+def fcls_unmix(image, endmembers, no_data_value=-9999):
+    """
+    fcls_unmix
+        This function carries out a fully constrained (non-negative, sum-to-one) linear unmixing of every pixel,
+        vectorized over the whole image. The sum-to-one least squares solution is computed in closed form on every
+        subset of endmembers, and each pixel keeps the feasible solution with the lowest residual, which is the exact
+        FCLS optimum. This is practical for the 2-3 class models used by HydroSENS (3-7 subsets).
+    Parameters:
+        image: 3D array of shape (bands, rows, cols) with reflectance scaled to 0-1
+        endmembers: 2D array of shape (bands, classes)
+        no_data_value: pixels with this value (or NaN) in any band are not unmixed
+    Returns:
+        3D array of shape (classes, rows, cols) with fractions, NaN for nodata pixels
+    """
+    from itertools import combinations
+
+    n_bands, rows, cols = image.shape
+    n_classes = endmembers.shape[1]
+    pixels = image.reshape(n_bands, -1)
+    valid = np.all(np.isfinite(pixels) & (pixels != no_data_value), axis=0)
+    x = pixels[:, valid].astype(float)
+
+    best_fractions = np.zeros((n_classes, x.shape[1]))
+    best_error = np.full(x.shape[1], np.inf)
+
+    for size in range(1, n_classes + 1):
+        for subset in combinations(range(n_classes), size):
+            subset = list(subset)
+            e = endmembers[:, subset]
+            gram_inv = np.linalg.pinv(e.T @ e)
+            # Unconstrained least squares, then projection onto the sum-to-one plane
+            unconstrained = gram_inv @ (e.T @ x)
+            g1 = gram_inv.sum(axis=1)
+            correction = (unconstrained.sum(axis=0) - 1) / g1.sum()
+            fractions = unconstrained - np.outer(g1, correction)
+
+            feasible = np.all(fractions >= -1e-9, axis=0)
+            residual = e @ fractions - x
+            error = np.einsum('ij,ij->j', residual, residual)
+            better = feasible & (error < best_error)
+
+            best_error[better] = error[better]
+            best_fractions[:, better] = 0
+            best_fractions[np.ix_(subset, np.flatnonzero(better))] = fractions[:, better]
+
+    np.clip(best_fractions, 0, 1, out=best_fractions)
+    out = np.full((n_classes, rows * cols), np.nan)
+    out[:, valid] = best_fractions
+    return out.reshape(n_classes, rows, cols)
+
+
+def fcls_fractions(img, sli, num_bands, endmember=3):
+    """
+    fcls_fractions
+        This function is the fast alternative to MESMA. It unmixes the prepared image against the class-mean spectra
+        of the spectral library with fcls_unmix and returns the fraction maps in the same orientation as the
+        MESMA path.
+    Parameters:
+        img: Prepared input image (see prepare_S2image)
+        sli: path to the spectral library
+        num_bands: number of bands in the spectral library. Must match number of bands in input image
+        endmember: 3 = vegetation, impervious, soil; 2 = vegetation, soil
+    Returns:
+        vegetation, impervious, soil: 2D fraction arrays (impervious is zero for 2 endmembers)
+    """
+    classes = ['vegetation', 'soil'] if endmember == 2 else ['vegetation', 'impervious', 'soil']
+    class_list, em_spectra = prepare_sli(sli, num_bands=num_bands)
+    endmembers = class_mean_spectra(class_list, em_spectra, classes)
 
-    except Exception as e:
-        print(f"Error during MESMA processing: {e}")
-        print("Attempting to continue with partial results...")
-        # Fill any unprocessed areas with NaN
-        if start_row < img.shape[1]:
-            out_fractions[:, start_row:, :] = np.nan
+    # Prepared images are (band, x, y), the fraction maps are (y, x)
+    image = np.transpose(np.asarray(img.data, dtype=float), (0, 2, 1))
+    start = timeit.default_timer()
+    fractions = fcls_unmix(image, endmembers)
+    print(f"FCLS unmixing of {image.shape[1]}x{image.shape[2]} pixels took {timeit.default_timer() - start:.2f} seconds")
 
-    total_stop = timeit.default_timer()
-    print(f"Total execution time: {total_stop - total_start:.2f} seconds")
+    vegetation = fractions[0]
+    soil = fractions[-1]
+    impervious = fractions[1] if endmember != 2 else np.zeros_like(soil)
+    return vegetation, impervious, soil
 
-    # Perform shade normalization if we have valid data
-    try:
-        out_shade = shade_normalisation.ShadeNormalisation.execute(out_fractions, shade_band=-1)
-        print(f"MESMA output shape after shade normalization: {out_shade.shape}")
-    except Exception as e:
-        print(f"Error during shade normalization: {e}")
-        print("Returning unnormalized results")
-        out_shade = out_fractions
-    
-    print(f"Final MESMA output bands: {out_shade.shape[0]}")
-    
-    return out_shade
 
 def nan_to_zero(x):
     return 0 if math.isnan(x) else x
@@ -1,12 +1,24 @@
 import ee
-import ee.mapclient
-import geemap
 import os
 import pandas as pd
-
-service_account = 'khoabui@hydrosens-garfield.iam.gserviceaccount.com'
-credentials = ee.ServiceAccountCredentials(service_account, r"./.secret/hydrosens-garfield-f6fe24f0d188.json")
-ee.Initialize(credentials)
+from datetime import datetime, timedelta
+from .download_cache import geometry_hash, export_cache_key, fetch_cached_export, store_export, export_key_lock
+from .weather_cache import weather_cell, get_cached_weather, store_weather
+from .pixel_fetch import fetch_raster
+from hydrosens_shared.ee_client import ensure_initialized, get_info, export_image
+
+FABDEM_COLLECTION = "projects/sat-io/open-datasets/FABDEM"
+SENTINEL2_COLLECTION = "COPERNICUS/S2_SR_HARMONIZED"
+SENTINEL2_BANDS = ['B2', 'B3', 'B4', 'B7', 'B8', 'B8A', 'B11', 'B12']
+# Landsat 8 and 9 share the OLI band layout and Collection 2 Level-2 processing
+LANDSAT_COLLECTIONS = ["LANDSAT/LC08/C02/T1_L2", "LANDSAT/LC09/C02/T1_L2"]
+LANDSAT_BANDS = ['SR_B2', 'SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7']
+# Collection 2 Level-2 surface reflectance is stored as DN: reflectance = DN * 2.75e-05 - 0.2.
+# The Landsat adapters convert to reflectance * 10000, the units of Sentinel-2 SR, so indices,
+# true color and unmixing see the same reflectance for both sensors.
+LANDSAT_SR_SCALE = 2.75e-05
+LANDSAT_SR_OFFSET = -0.2
+REFLECTANCE_SCALE = 10000
 
 
 def coordinates_to_ee_geometry(coordinates):
@@ -18,6 +30,9 @@ def coordinates_to_ee_geometry(coordinates):
     Returns:
         ee.Geometry.Polygon
     """
+    # Every pipeline builds its AOI first, so Earth Engine is initialized here on first use
+    ensure_initialized()
+
     # Ensure the polygon is closed (first and last coordinates are the same)
     if coordinates[0] != coordinates[-1]:
         coordinates = coordinates + [coordinates[0]]
@@ -40,26 +55,52 @@ def get_centroid_from_coordinates(coordinates):
     return np.mean(lons), np.mean(lats)
 
 
+def _local_centroid(aoi):
+    """
+    Compute the centroid of a client-side polygon without an Earth Engine request.
+    Falls back to a server-side centroid for computed geometries.
+    """
+    try:
+        ring = aoi.toGeoJSON()['coordinates'][0]
+        if ring[0] == ring[-1]:
+            ring = ring[:-1]
+        return get_centroid_from_coordinates(ring)
+    except Exception:
+        try:
+            return tuple(get_info(aoi.centroid(maxError=1).coordinates(), "centroid"))
+        except Exception:
+            return tuple(get_info(aoi.bounds().centroid(maxError=1).coordinates(), "centroid"))
+
+
 def get_daily_weather(date_list, aoi):
     """
     Get weather data for specific dates.
+
+    Values are cached per (ERA5-Land cell, date) in weather_cache, so only dates that are
+    not cached yet are requested from Earth Engine.
     
     Args:
-        date_list: List of date strings in 'YYYY-MM-DD' format
+        date_list: List of dates (datetime objects or 'YYYY-MM-DD' strings)
         aoi: Area of interest (Earth Engine geometry)
     
     Returns:
         Dictionary with weather data for each date
     """
-    try:
-        # aoi is already an ee.Geometry, so we can call centroid directly
-        centroid = aoi.centroid(maxError=1)
-    except Exception as e:
-        # If centroid fails, try using bounds and then centroid
-        centroid = aoi.bounds().centroid(maxError=1)
+    date_strings = [date.strftime('%Y-%m-%d') if not isinstance(date, str) else date for date in date_list]
+
+    lon, lat = _local_centroid(aoi)
+    cell_id, cell_lon, cell_lat = weather_cell(lon, lat)
+
+    weather_data, missing_dates = get_cached_weather(cell_id, date_strings)
+    print(f"Weather cache: {len(weather_data)} cached, {len(missing_dates)} to fetch for cell {cell_id}")
+    if not missing_dates:
+        return weather_data
+
+    # Sample at the cell center so every AOI sharing the cell reads the same ERA5 pixel
+    centroid = ee.Geometry.Point([cell_lon, cell_lat])
     
     # Convert dates to milliseconds since epoch for filtering
-    date_millis = [ee.Date(date).millis() for date in date_list]
+    date_millis = [ee.Date(date).millis() for date in missing_dates]
     
     # Filter collection by the specific dates
     era5_land = ee.ImageCollection("ECMWF/ERA5_LAND/DAILY_AGGR") \
@@ -76,18 +117,22 @@ def get_daily_weather(date_list, aoi):
         })
     
     feature_collection = era5_land.map(extract_point_value)
-    results = feature_collection.getInfo()['features']
+    results = get_info(feature_collection, "daily weather")['features']
 
-    weather_data = {}
+    fetched = {}
     for feature in results:
         props = feature['properties']
         temp_k = props.get('temperature_2m')
         precip_m = props.get('precipitation')
         if temp_k is not None and precip_m is not None:
-            weather_data[props['date']] = {
+            fetched[props['date']] = {
                 'temperature': temp_k - 273.15, 
                 'precipitation': precip_m * 1000 
             }
+
+    # Dates that ERA5-Land has not published yet are not cached and will be retried next time
+    store_weather(cell_id, fetched)
+    weather_data.update(fetched)
     return weather_data
 
 def get_sentinel2_dates(aoi, start_date, end_date, max_cloud_coverage=30):
@@ -97,13 +142,144 @@ def get_sentinel2_dates(aoi, start_date, end_date, max_cloud_coverage=30):
                 .filterDate(start_date, end_date) \
                 .filter(ee.Filter.lte('CLOUDY_PIXEL_PERCENTAGE', max_cloud_coverage))
 
-    dates = sentinel2.aggregate_array('system:time_start').getInfo()
+    dates = get_info(sentinel2.aggregate_array('system:time_start'), "Sentinel-2 dates")
 
-    date_list = [ee.Date(date).format('YYYY-MM-DD').getInfo() for date in dates]
+    # Format on the client instead of one getInfo per date
+    date_list = [datetime.utcfromtimestamp(date / 1000).strftime('%Y-%m-%d') for date in dates]
 
     return date_list
 
 
+def query_scenes(aoi, start_date, end_date, collections, cloud_property, max_cloud_coverage, label="scene"):
+    """
+    query_scenes
+        This function lists every acquisition of one or more image collections over the aoi in a
+        date range with a single aggregated Earth Engine request.
+    input:
+        aoi: The area of interest (ee.Geometry)
+        start_date: first date of the range (datetime)
+        end_date: last date of the range, inclusive (datetime)
+        collections: list of image collection IDs, merged before filtering
+        cloud_property: image property holding the cloud percentage
+        max_cloud_coverage: images with cloud_property >= this value are ignored
+        label: name of the query used in log messages
+    output:
+        dictionary mapping 'YYYY-MM-DD' to {'id': asset ID, 'cloud': cloud percentage} of the
+        least cloudy image acquired on that day
+
+    """
+    collection = ee.ImageCollection(collections[0])
+    for collection_id in collections[1:]:
+        collection = collection.merge(ee.ImageCollection(collection_id))
+    collection = collection\
+        .filterDate(start_date, end_date + timedelta(days=1))\
+        .filterBounds(aoi)\
+        .filterMetadata(cloud_property, 'less_than', max_cloud_coverage)\
+        .sort(cloud_property)
+
+    info = get_info(ee.Dictionary({
+        'ids': collection.aggregate_array('system:id'),
+        'times': collection.aggregate_array('system:time_start'),
+        'clouds': collection.aggregate_array(cloud_property)
+    }), f"{label} scene index")
+
+    scenes = {}
+    # The collection is sorted by cloud cover, so the first image seen for a day is the one
+    # load_Sentinel2/load_Landsat would have selected
+    for image_id, time_start, cloud in zip(info['ids'], info['times'], info['clouds']):
+        date_str = datetime.utcfromtimestamp(time_start / 1000).strftime('%Y-%m-%d')
+        if date_str not in scenes:
+            scenes[date_str] = {'id': image_id, 'cloud': cloud}
+    return scenes
+
+
+def query_sentinel2_scenes(aoi, start_date, end_date, max_cloud_coverage=35):
+    """
+    query_sentinel2_scenes
+        This function lists every Sentinel 2 acquisition over the aoi in a date range with a
+        single aggregated Earth Engine request. It applies the same filters as load_Sentinel2.
+    input:
+        aoi: The area of interest (ee.Geometry)
+        start_date: first date of the range (datetime)
+        end_date: last date of the range, inclusive (datetime)
+        max_cloud_coverage: images with CLOUDY_PIXEL_PERCENTAGE >= this value are ignored
+    output:
+        see query_scenes
+
+    """
+    return query_scenes(aoi, start_date, end_date, [SENTINEL2_COLLECTION], 'CLOUDY_PIXEL_PERCENTAGE',
+                        max_cloud_coverage, label="Sentinel-2")
+
+
+def query_landsat_scenes(aoi, start_date, end_date, max_cloud_coverage=30):
+    """
+    query_landsat_scenes
+        This function lists every Landsat 8/9 acquisition over the aoi in a date range with a
+        single aggregated Earth Engine request. It applies the same filters as load_Landsat.
+    input:
+        aoi: The area of interest (ee.Geometry)
+        start_date: first date of the range (datetime)
+        end_date: last date of the range, inclusive (datetime)
+        max_cloud_coverage: images with CLOUD_COVER >= this value are ignored
+    output:
+        see query_scenes
+
+    """
+    return query_scenes(aoi, start_date, end_date, LANDSAT_COLLECTIONS, 'CLOUD_COVER', max_cloud_coverage,
+                        label="Landsat")
+
+
+def compute_scene_statistics(aoi, scene_ids, crs_string, scale=30):
+    """
+    compute_scene_statistics
+        This function computes per-scene statistics inside Earth Engine instead of downloading rasters.
+        All scenes are reduced in a single batched request, always at the requested scale (the reduction
+        fails instead of silently coarsening the scale for very large AOIs).
+        The indices use the same bands and water threshold as the raster pipeline, but the values are not
+        interchangeable with it: they are means over the polygon of bilinearly resampled bands, whereas the
+        raster pipeline averages NDVI over the downloaded grid (the polygon's bounding box, zero outside the
+        polygon) and sieves the water mask before using it.
+    input:
+        aoi: The area of interest (ee.Geometry)
+        scene_ids: dictionary mapping 'YYYY-MM-DD' to a Sentinel 2 asset ID
+        crs_string: CRS string for projection
+        scale: reduction scale in meters
+    output:
+        dictionary mapping 'YYYY-MM-DD' to {'ndvi': polygon mean of NDVI (B8A, B4), 'water-fraction': share of
+        polygon pixels with MNDWI (B3, B11) > 0, 'scale': scale in meters the values were reduced at}
+
+    """
+    if not scene_ids:
+        return {}
+
+    features = []
+    for date_str, image_id in sorted(scene_ids.items()):
+        image = ee.Image(image_id).select('B3', 'B4', 'B8A', 'B11').resample('bilinear')
+        ndvi = image.normalizedDifference(['B8A', 'B4']).rename('ndvi')
+        water = image.normalizedDifference(['B3', 'B11']).gt(0).rename('water')
+        stats = ndvi.addBands(water).reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=aoi,
+            crs=crs_string,
+            scale=scale,
+            maxPixels=1e13,
+            tileScale=4
+        )
+        features.append(ee.Feature(None, stats).set('date', date_str))
+
+    results = get_info(ee.FeatureCollection(features), "scene statistics")['features']
+
+    statistics = {}
+    for feature in results:
+        props = feature['properties']
+        statistics[props['date']] = {
+            'ndvi': props.get('ndvi'),
+            'water-fraction': props.get('water'),
+            'scale': float(scale)
+        }
+    return statistics
+
+
 def load_Sentinel2(aoi, StartDate, EndDate):
     """
     load_Sentinel2
@@ -116,33 +292,54 @@ def load_Sentinel2(aoi, StartDate, EndDate):
         StartDate: The start date of the satellite images
         EndDate: The end date of the satellite images;
     output:
-        filtered_col: a collection of filtered images that meet the criteria
+        first_img: the least cloudy image that meets the criteria
+        num_images: number of images that meet the criteria
+        image_id: asset ID of first_img (None if there are no images), used to address the export cache
 
     """
     
-    filtered_col1 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')\
+    filtered_col1 = ee.ImageCollection(SENTINEL2_COLLECTION)\
         .filterDate(StartDate,EndDate)\
         .filterBounds(aoi) \
         .filterMetadata('CLOUDY_PIXEL_PERCENTAGE','less_than', 35)\
         .sort('CLOUDY_PIXEL_PERCENTAGE')\
         .select('B2', 'B3', 'B4', 'B7', 'B8', 'B8A', 'B11', 'B12')
-    num_images = filtered_col1.size().getInfo()
+    # A single round-trip returns both the image count and the ID of the first image
+    image_ids = get_info(filtered_col1.aggregate_array('system:id'), "Sentinel-2 image IDs")
+    num_images = len(image_ids)
     first_img = filtered_col1.first()
+    image_id = image_ids[0] if image_ids else None
 
-
-    return first_img, num_images
+    return first_img, num_images, image_id
 
 def load_Landsat(aoi, StartDate, EndDate):
-    filtered_col1 = ee.ImageCollection('LANDSAT/LC08/C02/T1_L2')\
+    """
+    load_Landsat
+        This function is used to obtain a collection of Landsat 8 and 9 images that meet a
+        specific criteria (cloud coverage <30%, date range), sorted by cloud coverage.
+    input:
+        aoi: The area of interest (ee.Geometry)
+        StartDate: The start date of the satellite images
+        EndDate: The end date of the satellite images
+    output:
+        first_img: the least cloudy image that meets the criteria
+        num_images: number of images that meet the criteria
+        image_id: asset ID of first_img (None if there are no images), used to address the export cache
+
+    """
+    filtered_col1 = ee.ImageCollection(LANDSAT_COLLECTIONS[0])\
+        .merge(ee.ImageCollection(LANDSAT_COLLECTIONS[1]))\
         .filterDate(StartDate,EndDate)\
         .filterBounds(aoi) \
         .filterMetadata('CLOUD_COVER','less_than', 30)\
         .sort('CLOUD_COVER')\
-        .select('SR_B2', 'SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7')
-    num_images = filtered_col1.size().getInfo()
+        .select(*LANDSAT_BANDS)
+    image_ids = get_info(filtered_col1.aggregate_array('system:id'), "Landsat image IDs")
+    num_images = len(image_ids)
     first_img = filtered_col1.first()
+    image_id = image_ids[0] if image_ids else None
 
-    return first_img, num_images
+    return first_img, num_images, image_id
 
 def mosaic(filtered_col):
     """
@@ -160,7 +357,7 @@ def mosaic(filtered_col):
     return mosaic
 
 
-def resampling(image, crs_string):
+def resampling(image, crs_string, scale=10, band_names=SENTINEL2_BANDS):
     """
     resampling
         This function is used to resample bands 8A, 11, and 12 to the 10m resolution of bands
@@ -168,12 +365,14 @@ def resampling(image, crs_string):
     input:
         image: product of mosaic function
         crs_string: CRS string for projection
+        scale: output resolution in meters (10 m, or coarser for previews)
+        band_names: bands to keep (Sentinel 2 bands by default, LANDSAT_BANDS for Landsat)
     output:
         resample: image with resampled bands
 
     """
-    bands = image.select('B2', 'B3', 'B4', 'B7', 'B8', 'B8A', 'B11', 'B12')
-    resample = bands.resample('bilinear').reproject(crs=crs_string, scale=10)
+    bands = image.select(*band_names)
+    resample = bands.resample('bilinear').reproject(crs=crs_string, scale=scale)
     return resample
 
 
@@ -188,14 +387,47 @@ def getDEM(aoi):
         DEM:  FABDEM image with the elevation data
 
     """
-    DEM = ee.ImageCollection("projects/sat-io/open-datasets/FABDEM")\
+    DEM = ee.ImageCollection(FABDEM_COLLECTION)\
         .filterBounds(aoi)\
         .mosaic()\
         .rename('elevation')
     return DEM
 
 
-def Bandsexport(image, crs_string, output, aoi):
+def export_image_cached(image, output_file, band_names, scale, aoi, crs_string, image_id=None):
+    """
+    export_image_cached
+        This function wraps ee_client.export_image with the content-addressed download cache.
+        Exports are addressed by (image ID, band list, region geometry hash, scale, CRS), so a
+        repeat export is copied from local disk without any Earth Engine request.
+    input:
+        image: image to export, already restricted to band_names
+        output_file: path of the output geotiff
+        band_names: list of exported band names
+        scale: export scale in meters
+        aoi: the area of interest (ee.Geometry)
+        crs_string: CRS string for projection
+        image_id: asset ID of the source image. Without it the export is not cached.
+    output:
+        output_file in the user-designated output folder
+
+    """
+    if image_id is None:
+        export_image(image, output_file, scale=scale, region=aoi, crs=crs_string)
+        return output_file
+
+    key = export_cache_key(image_id, band_names, geometry_hash(aoi), scale, crs_string)
+    # Exports may run concurrently (see download_pool.py); identical ones are downloaded once
+    with export_key_lock(key):
+        if fetch_cached_export(key, output_file):
+            return output_file
+
+        export_image(image, output_file, scale=scale, region=aoi, crs=crs_string)
+        store_export(key, output_file)
+    return output_file
+
+
+def Bandsexport(image, crs_string, output, aoi, image_id=None, scale=10):
     """
     Bandsexport
         This function is used to export the resampled Sentinel 2 images to a geotiff file.
@@ -205,22 +437,23 @@ def Bandsexport(image, crs_string, output, aoi):
         crs_string: CRS string for projection
         output: output folder
         aoi: the area of interest (ee.Geometry)
+        image_id: asset ID of the Sentinel 2 image, used to serve repeat exports from the cache
+        scale: export resolution in meters (10 m, or coarser for previews)
     output:
         Bands.tif in the user-designated output folder
 
     """
     output_file = os.path.join(output, "Bands.tif")
 
-    band_names = ['B2', 'B3', 'B4', 'B7', 'B8', 'B8A', 'B11', 'B12']
+    band_names = SENTINEL2_BANDS
 
     final_selected = image.select(band_names, band_names).float()
 
-    geemap.ee_export_image(final_selected, output_file, scale=10, region=aoi,
-                           crs=crs_string)
+    export_image_cached(final_selected, output_file, band_names, scale, aoi, crs_string, image_id)
     return Bandsexport
 
 
-def DEMexport(image, crs_string, output, aoi):
+def DEMexport(image, crs_string, output, aoi, image_id=FABDEM_COLLECTION, scale=10):
     """
     DEMexport
         This function is used to export the elevation data of the FABDEM to a geotiff file.
@@ -231,6 +464,9 @@ def DEMexport(image, crs_string, output, aoi):
         crs_string: CRS string for projection
         output: output folder
         aoi: the area of interest (ee.Geometry)
+        image_id: cache identity of the DEM. The FABDEM mosaic does not change between dates,
+                  so every date of a region shares a single cached export.
+        scale: export resolution in meters (10 m, or coarser for previews)
     output:
         DEM.tif in the user-designated output folder
 
@@ -241,32 +477,124 @@ def DEMexport(image, crs_string, output, aoi):
 
     final_selected = image.select(band_names, band_names)
 
-    geemap.ee_export_image(final_selected, output_file, scale=10, region=aoi,
-                           crs=crs_string)
+    export_image_cached(final_selected, output_file, band_names, scale, aoi, crs_string, image_id)
     return DEMexport
 
-def Bandsexport_Landsat(image, crs_string, output, aoi):
+def fetch_clipped(image, band_names, grid, aoi, image_id=None):
+    """
+    fetch_clipped
+        This function fetches the pixels of an image directly into memory with computePixels on
+        the processing grid. Large grids are fetched as tiles and mosaicked. There is no per-raster
+        fallback: bands and DEM must stay on one grid, so the caller falls back to exporting both
+        (see process_specific_dates).
+    input:
+        image: image to fetch, not reprojected (the grid sets CRS, origin and scale)
+        band_names: list of band names
+        grid: processing grid, see pixel_fetch.compute_grid
+        aoi: the area of interest (ee.Geometry)
+        image_id: asset ID of the source image, used for the download cache
+    output:
+        RasterArray with the pixels. Failing requests raise ee.EEException or EECallTimeout.
+    """
+    # Match the file export, which masks pixels outside the polygon (written as 0)
+    clipped = image.select(band_names, band_names).clip(aoi).unmask(0, False)
+    return fetch_raster(clipped, band_names, grid, image_id=image_id)
+
+
+def Bandsfetch(image, aoi, grid, image_id=None):
+    """
+    Bandsfetch
+        This function is used to fetch the Sentinel 2 bands into memory on the processing grid.
+    input:
+        image: image with bands 2,3,4,7,8,8A,11, and 12, bilinear resampling set
+        aoi: the area of interest (ee.Geometry)
+        grid: processing grid, see pixel_fetch.compute_grid
+        image_id: asset ID of the Sentinel 2 image, used for the download cache
+    output:
+        RasterArray with the bands
+    """
+    return fetch_clipped(image, SENTINEL2_BANDS, grid, aoi, image_id=image_id)
+
+
+def DEMfetch(image, aoi, grid, image_id=FABDEM_COLLECTION):
+    """
+    DEMfetch
+        This function is used to fetch the FABDEM elevation data into memory on the processing
+        grid, pixel-aligned with the bands fetched by Bandsfetch.
+    input:
+        image: image with FABDEM elevation data
+        aoi: the area of interest (ee.Geometry)
+        grid: processing grid, see pixel_fetch.compute_grid
+        image_id: cache identity of the DEM, shared by every date of a region
+    output:
+        RasterArray with the elevation
+    """
+    return fetch_clipped(image, ['elevation'], grid, aoi, image_id=image_id)
+
+
+def landsat_reflectance(image):
+    """
+    landsat_reflectance
+        This function applies the Collection 2 Level-2 scale and offset to the Landsat SR bands
+        and rescales the result to reflectance * 10000, like Sentinel-2 SR.
+    input:
+        image: Landsat 8/9 Collection 2 Level-2 image with bands 2,3,4,5,6, and 7
+    output:
+        image with the LANDSAT_BANDS as surface reflectance * 10000
+    """
+    return image.select(LANDSAT_BANDS, LANDSAT_BANDS)\
+        .multiply(LANDSAT_SR_SCALE).add(LANDSAT_SR_OFFSET)\
+        .multiply(REFLECTANCE_SCALE)
+
+
+def landsat_cache_id(image_id):
+    """Cache identity of the scaled Landsat bands, distinct from exports cached before the scaling was applied."""
+    return None if image_id is None else image_id + ":sr10000"
+
+
+def Bandsexport_Landsat(image, crs_string, output, aoi, image_id=None, scale=30):
     """
     Bandsexport
-        This function is used to export the Landsat 8 images to a geotiff file.
-        The output geotiff matches the aoi projection and bounds.
+        This function is used to export the Landsat 8/9 images to a geotiff file.
+        The output geotiff matches the aoi projection and bounds and holds surface
+        reflectance * 10000 (see landsat_reflectance).
     input:
         image: image with bands 2,3,4,5, 6, and 7
         crs_string: CRS string for projection
         output: output folder
         aoi: the area of interest (ee.Geometry)
+        image_id: asset ID of the Landsat image, used to serve repeat exports from the cache
+        scale: export resolution in meters (30 m, or coarser for previews)
     output:
         Bands.tif in the user-designated output folder
 
     """
     output_file = os.path.join(output, "Bands.tif")
 
-    band_names = ['SR_B2', 'SR_B3', 'SR_B4', 'SR_B5', 'SR_B6', 'SR_B7']
+    band_names = LANDSAT_BANDS
 
-    final_selected = image.select(band_names, band_names).float()
+    final_selected = landsat_reflectance(image).float()
+
+    export_image_cached(final_selected, output_file, band_names, scale, aoi, crs_string,
+                        landsat_cache_id(image_id))
+    return Bandsexport_Landsat
 
-    geemap.ee_export_image(final_selected, output_file, scale=30, region=aoi,
-                           crs=crs_string)
+
+def Bandsfetch_Landsat(image, aoi, grid, image_id=None):
+    """
+    Bandsfetch_Landsat
+        This function is used to fetch the Landsat 8/9 bands into memory on the processing grid,
+        as surface reflectance * 10000 (see landsat_reflectance).
+    input:
+        image: image with bands 2,3,4,5,6, and 7
+        aoi: the area of interest (ee.Geometry)
+        grid: processing grid, see pixel_fetch.compute_grid
+        image_id: asset ID of the Landsat image, used for the download cache
+    output:
+        RasterArray with the bands
+    """
+    return fetch_clipped(landsat_reflectance(image), LANDSAT_BANDS, grid, aoi,
+                         image_id=landsat_cache_id(image_id))
 
 def DEMexport_Landsat(image, crs_string, output, aoi):
     """
@@ -289,6 +617,5 @@ def DEMexport_Landsat(image, crs_string, output, aoi):
 
     final_selected = image.select(band_names, band_names)
 
-    geemap.ee_export_image(final_selected, output_file, scale=30, region=aoi,
-                           crs=crs_string)
+    export_image(final_selected, output_file, scale=30, region=aoi, crs=crs_string)
     return DEMexport
\ No newline at end of file
@@ -1,6 +1,55 @@
 import os
+import threading
 import pandas as pd
 from datetime import datetime, timedelta
+from .stage_cache import stage_params, first_stale_stage
+
+# Serializes read-modify-write cycles on region CSVs (interactive and background jobs)
+_csv_lock = threading.Lock()
+
+# NO DATA markers expire so that scenes ingested late into the catalog are picked up.
+# Each tier is "max_age_days:ttl_hours": a date younger than max_age_days is re-verified
+# once its marker is older than ttl_hours. Markers for dates older than the last tier
+# never expire.
+NO_DATA_TTL_TIERS = os.getenv("NO_DATA_TTL_TIERS", "7:6,30:24,90:168")
+
+
+def parse_ttl_tiers(spec=None):
+    """Parse a NO_DATA_TTL_TIERS string into a sorted list of (max_age_days, ttl_hours)."""
+    spec = NO_DATA_TTL_TIERS if spec is None else spec
+    tiers = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        max_age, ttl = part.split(":")
+        tiers.append((float(max_age), float(ttl)))
+    return sorted(tiers)
+
+
+def no_data_expired(date_str, checked_at, now=None):
+    """
+    Check whether a NO DATA marker has to be re-verified.
+
+    Parameters:
+        date_str: Date of the marker in 'YYYY-MM-DD' format
+        checked_at: ISO timestamp of the catalog check that produced the marker (None for legacy rows)
+        now: Current time, defaults to datetime.utcnow()
+    Returns:
+        bool: True if the marker expired
+    """
+    now = now or datetime.utcnow()
+    age_days = (now - datetime.strptime(date_str, '%Y-%m-%d')).days
+    for max_age_days, ttl_hours in parse_ttl_tiers():
+        if age_days < max_age_days:
+            if checked_at is None or pd.isna(checked_at) or str(checked_at).strip() == '':
+                return True
+            try:
+                checked = datetime.fromisoformat(str(checked_at))
+            except ValueError:
+                return True
+            return now - checked > timedelta(hours=ttl_hours)
+    return False
 
 
 def get_dates_from_range(start_date, end_date):
@@ -19,12 +68,23 @@ def get_dates_from_range(start_date, end_date):
     return dates
 
 
-def check_existing_data(output_master, region_name, requested_dates):
+def check_existing_data(output_master, region_name, requested_dates, accept_preview=False, request_params=None,
+                        accept_scales=()):
     """
     Check what data already exists in the CSV file and determine which dates need processing.
+    Rows computed by a preview run only count as existing when accept_preview is True.
+
+    With request_params (dict with coordinates, crs, endmember, unmixing_mode, scale, amc, p) each
+    cached date is also checked against its stage manifest (see stage_cache.py): dates whose imagery
+    stage was computed with other parameters are reprocessed, dates where only the cn/runoff stages
+    differ are returned in stale_downstream so they can be refreshed without a recompute.
     
     Returns:
-        tuple: (dates_to_process, existing_data_dict)
+        tuple: (dates_to_process, existing_data_dict, expired_no_data_dates, stale_downstream)
+        expired_no_data_dates are included in dates_to_process and must be re-checked
+        against the catalog rather than trusted from the scene index.
+        stale_downstream maps date -> {'stage': 'cn' or 'runoff', 'resolution': row resolution}
+        for dates in existing_data_dict whose downstream stages must be refreshed
     """
     csv_file_path = os.path.join(output_master, region_name, 'output.csv')
     
@@ -32,6 +92,8 @@ def check_existing_data(output_master, region_name, requested_dates):
     requested_date_strings = [date.strftime('%Y-%m-%d') if isinstance(date, datetime) else date for date in requested_dates]
     
     existing_data = {}
+    expired_no_data = []
+    stale_downstream = {}
     dates_to_process = requested_date_strings.copy()
     
     if os.path.exists(csv_file_path):
@@ -48,6 +110,10 @@ def check_existing_data(output_master, region_name, requested_dates):
                     # Check if this date is marked as NO DATA
                     if (pd.notna(row.get('veg_mean')) and 
                         str(row.get('veg_mean')).upper() == 'NO DATA'):
+                        if no_data_expired(date_str, row.get('checked_at')):
+                            print(f"Date {date_str} NO DATA marker expired, will re-verify")
+                            expired_no_data.append(date_str)
+                            continue
                         print(f"Date {date_str} marked as NO DATA, skipping processing")
                         dates_to_process.remove(date_str)
                         # Don't add NO DATA entries to existing_data (they won't be returned to API)
@@ -56,8 +122,28 @@ def check_existing_data(output_master, region_name, requested_dates):
                     # Check if the row has all required columns with valid numeric data
                     required_columns = ['veg_mean', 'soil_mean', 'curve_number', 'ndvi', 'temperature', 'precipitation']
                     
+                    is_preview = str(row.get('resolution', 'full')).lower() == 'preview'
+                    if is_preview and not accept_preview:
+                        print(f"Date {date_str} only has preview data, will process at full resolution")
+                        continue
+
                     if all(pd.notna(row.get(col)) and 
                           str(row.get(col)).upper() != 'NO DATA' for col in required_columns):
+                        if request_params is not None:
+                            stale_stage = first_stale_stage(
+                                os.path.join(output_master, region_name, date_str),
+                                stage_params(date_str, **request_params),
+                                accept_scales=accept_scales
+                            )
+                            if stale_stage == 'imagery':
+                                print(f"Date {date_str} was processed with other imagery parameters, will reprocess")
+                                continue
+                            if stale_stage is not None:
+                                print(f"Date {date_str} has stale {stale_stage} stage, will refresh downstream stages")
+                                stale_downstream[date_str] = {
+                                    'stage': stale_stage,
+                                    'resolution': 'preview' if is_preview else 'full'
+                                }
                         print(f"Date {date_str} already has complete data, skipping processing")
                         existing_data[date_str] = {
                             "ndvi": float(row.get('ndvi', 0)),
@@ -85,15 +171,23 @@ def check_existing_data(output_master, region_name, requested_dates):
     print(f"Total requested dates: {len(requested_date_strings)}")
     print(f"Dates with existing data: {len(existing_data)}")
     print(f"Dates to process: {len(dates_to_process_dt)}")
+    print(f"Expired NO DATA dates to re-verify: {len(expired_no_data)}")
+    print(f"Dates with stale downstream stages: {len(stale_downstream)}")
     
-    return dates_to_process_dt, existing_data
+    return dates_to_process_dt, existing_data, expired_no_data, stale_downstream
 
 
-def append_to_csv(output_master, region_name, new_data, no_data_dates=None):
+def append_to_csv(output_master, region_name, new_data, no_data_dates=None, resolution='full'):
     """
     Append new data to the CSV file, maintaining chronological order.
     Also marks dates with no data as "NO DATA".
+    resolution ('full' or 'preview') is recorded so preview rows are replaced by the full-resolution run.
     """
+    with _csv_lock:
+        return _append_to_csv(output_master, region_name, new_data, no_data_dates, resolution)
+
+
+def _append_to_csv(output_master, region_name, new_data, no_data_dates, resolution):
     csv_file_path = os.path.join(output_master, region_name, 'output.csv')
     region_output_dir = os.path.join(output_master, region_name)
     os.makedirs(region_output_dir, exist_ok=True)
@@ -110,13 +204,17 @@ def append_to_csv(output_master, region_name, new_data, no_data_dates=None):
             'curve_number': values.get('curve-number', 0),
             'ndvi': values.get('ndvi', 0),
             'temperature': values.get('temperature', 0),
-            'precipitation': values.get('precipitation', 0)
+            'precipitation': values.get('precipitation', 0),
+            'resolution': resolution
         }
         new_rows.append(row)
     
     # Add NO DATA entries for dates with no imagery
     if no_data_dates:
+        checked_at = datetime.utcnow().isoformat(timespec='seconds')
         for date_str in no_data_dates:
+            if isinstance(date_str, datetime):
+                date_str = date_str.strftime('%Y-%m-%d')
             row = {
                 'date': date_str,
                 'veg_mean': 'NO DATA',
@@ -124,7 +222,8 @@ def append_to_csv(output_master, region_name, new_data, no_data_dates=None):
                 'curve_number': 'NO DATA',
                 'ndvi': 'NO DATA',
                 'temperature': 'NO DATA',
-                'precipitation': 'NO DATA'
+                'precipitation': 'NO DATA',
+                'checked_at': checked_at
             }
             new_rows.append(row)
         print(f"Marking {len(no_data_dates)} dates as NO DATA: {no_data_dates}")
@@ -154,8 +253,9 @@ def append_to_csv(output_master, region_name, new_data, no_data_dates=None):
             print(f"Appending {len(new_df)} new rows to existing {len(existing_df)} rows")
             
         except Exception as e:
-            print(f"Error reading existing CSV: {e}. Creating new file.")
-            combined_df = new_df
+            # Never replace the cached rows with only the new ones
+            print(f"Error merging into existing CSV {csv_file_path}: {e}")
+            raise
     else:
         print("Creating new CSV file")
         combined_df = new_df
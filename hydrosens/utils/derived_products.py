@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from osgeo import gdal
+
+from .Functions_update import convert_amc, clean_curve_number
+from .runoff import runoff_from_cn, CN_NODATA
+from .stage_cache import read_stage_manifest, write_stage_manifest
+
+# Products derived from the stored AMC II curve numbers. The pipeline keeps the slope-corrected
+# AMC II layer (CN_AMCII.tif) and per-AMC statistics (cn_stats.json) for every date; curve
+# numbers and runoff for other antecedent moisture conditions are derived from it on request
+# and cached next to it under derived/.
+CN_AMCII_FILE = "CN_AMCII.tif"
+CN_STATS_FILE = "cn_stats.json"
+DERIVED_DIR = "derived"
+CN_AMCII_NODATA = -9999
+AMC_VALUES = (1, 2, 3)
+
+_derived_lock = threading.Lock()
+
+
+def write_cn_stats(output, cn_amcii, endmember=3, scale=10):
+    """
+    Write cn_stats.json with the mean curve number for every AMC.
+
+    The statistics use the same definition as the curve-number column of the region CSV
+    (mean of the cleaned CN map), so a cached date can be reported for any AMC.
+
+    Parameters:
+        output: Date output folder
+        cn_amcii: Cleaned, masked AMC II CN array
+        endmember: Number of endmembers used for the CN map
+        scale: Processing resolution in meters
+    """
+    stats = {
+        "curve_number": {
+            str(amc): float(np.nanmean(clean_curve_number(convert_amc(cn_amcii, amc)))) for amc in AMC_VALUES
+        },
+        "endmember": endmember,
+        "scale": scale
+    }
+    with open(os.path.join(output, CN_STATS_FILE), "w") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+def read_cn_stats(date_dir):
+    """Return the cn_stats.json content of a date folder, or None if it was processed before AMC II was stored."""
+    path = os.path.join(date_dir, CN_STATS_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        return None
+
+
+def has_amcii(date_dir):
+    return os.path.exists(os.path.join(date_dir, CN_AMCII_FILE))
+
+
+def _is_current(derived_path, source_path):
+    # A derived file is stale once the date has been reprocessed
+    return os.path.exists(derived_path) and os.path.getmtime(derived_path) >= os.path.getmtime(source_path)
+
+
+def _write_like(array, reference, output_path, gdal_type, nodata_value):
+    tmp_path = output_path + ".part.tif"
+    output_raster = gdal.GetDriverByName("GTiff").Create(tmp_path, reference.RasterXSize,
+                                                         reference.RasterYSize, 1, gdal_type)
+    output_raster.SetProjection(reference.GetProjection())
+    output_raster.SetGeoTransform(reference.GetGeoTransform())
+    band = output_raster.GetRasterBand(1)
+    band.SetNoDataValue(nodata_value)
+    band.WriteArray(array)
+    output_raster.FlushCache()
+    output_raster = None
+    os.replace(tmp_path, output_path)
+
+
+def _read_amcii(date_dir):
+    dataset = gdal.Open(os.path.join(date_dir, CN_AMCII_FILE))
+    band = dataset.GetRasterBand(1)
+    cn = band.ReadAsArray()
+    nodata = band.GetNoDataValue()
+    valid = cn != (nodata if nodata is not None else CN_AMCII_NODATA)
+    return cn, valid, dataset
+
+
+def amc_cn_layer(date_dir, amc):
+    """
+    Path of the final CN layer of a date for the given AMC, derived from CN_AMCII.tif if needed.
+
+    The result matches CCN_final.tif of a run with that AMC: converted, cleaned, truncated to
+    integers, with 255 outside the polygon.
+
+    Returns:
+        str: path of derived/CCN_final_AMC<amc>.tif, or None if the date has no AMC II layer
+    """
+    source_path = os.path.join(date_dir, CN_AMCII_FILE)
+    if not os.path.exists(source_path):
+        return None
+    derived_path = os.path.join(date_dir, DERIVED_DIR, f"CCN_final_AMC{int(amc)}.tif")
+
+    with _derived_lock:
+        if _is_current(derived_path, source_path):
+            return derived_path
+        os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+
+        cn, valid, dataset = _read_amcii(date_dir)
+        cn_final = clean_curve_number(convert_amc(cn.astype(float), int(amc))).astype(np.int32)
+        cn_final[~valid] = CN_NODATA
+        _write_like(cn_final, dataset, derived_path, gdal.GDT_Int32, CN_NODATA)
+        dataset = None
+        print(f"Derived AMC {amc} curve numbers: {derived_path}")
+    return derived_path
+
+
+def amc_runoff_layer(date_dir, amc, p):
+    """
+    Path of the runoff layer of a date for the given AMC and precipitation (mm), derived and cached on request.
+
+    Returns:
+        str: path of derived/Runoff_AMC<amc>_P<p>.tif, or None if the date has no AMC II layer
+    """
+    cn_path = amc_cn_layer(date_dir, amc)
+    if cn_path is None:
+        return None
+    derived_path = os.path.join(date_dir, DERIVED_DIR, f"Runoff_AMC{int(amc)}_P{float(p):g}.tif")
+
+    with _derived_lock:
+        if _is_current(derived_path, cn_path):
+            return derived_path
+        dataset = gdal.Open(cn_path)
+        cn = dataset.GetRasterBand(1).ReadAsArray()
+        # The pipeline evaluates runoff on the whole CCN_final grid, nodata included
+        runoff_c = runoff_from_cn(cn.astype(float), float(p))
+        _write_like(runoff_c, dataset, derived_path, gdal.GDT_Float64, np.nan)
+        dataset = None
+        print(f"Derived AMC {amc} runoff for P={p}mm: {derived_path}")
+    return derived_path
+
+
+def refresh_downstream_stages(date_dir, params):
+    """
+    Bring the cn and runoff stages of a cached date up to date with the requested parameters.
+
+    CCN_final.tif and Runoff.tif are replaced by the products derived from CN_AMCII.tif for the
+    requested AMC and precipitation, and the stage manifest is updated. The imagery stage and
+    its parameters (including the scale it was processed at) are kept.
+
+    Parameters:
+        date_dir: Date output folder
+        params: Requested parameters, see stage_cache.stage_params
+    Returns:
+        float or None: Mean curve number for the requested AMC (None if the date cannot be refreshed)
+    """
+    stats = read_cn_stats(date_dir)
+    manifest = read_stage_manifest(date_dir)
+    if stats is None or manifest is None or not has_amcii(date_dir):
+        return None
+
+    imagery = manifest["imagery"]["params"]
+    amc = params["cn"]["amc"]
+    p = params["runoff"]["p"]
+
+    shutil.copyfile(amc_cn_layer(date_dir, amc), os.path.join(date_dir, "CCN_final.tif"))
+    if p is not None:
+        shutil.copyfile(amc_runoff_layer(date_dir, amc, p), os.path.join(date_dir, "Runoff.tif"))
+
+    write_stage_manifest(date_dir, {
+        "imagery": imagery,
+        "cn": dict(params["cn"], scale=imagery["scale"]),
+        "runoff": dict(params["runoff"], scale=imagery["scale"])
+    })
+    print(f"Refreshed CN/runoff stages of {os.path.basename(date_dir)} for AMC {amc}, P={p}mm")
+    return stats["curve_number"].get(str(amc))
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+# Content-addressed cache for Earth Engine image downloads.
+# Files are stored as <sha256>.tif under EXPORT_CACHE_DIR and evicted in
+# least-recently-used order once the directory exceeds EXPORT_CACHE_MAX_MB.
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./data/cache/exports")
+EXPORT_CACHE_MAX_MB = float(os.getenv("EXPORT_CACHE_MAX_MB", "2048"))
+
+_cache_lock = threading.Lock()
+# One lock per cache key, so concurrent downloads of the same export (e.g. the DEM shared by
+# every date of a region) run once and the other callers are served from the cache
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def geometry_hash(aoi):
+    """
+    Compute a stable hash of an Earth Engine geometry without contacting Earth Engine.
+
+    Parameters:
+        aoi: ee.Geometry constructed on the client (e.g. from coordinates)
+    Returns:
+        str: hex digest identifying the geometry
+    """
+    try:
+        payload = json.dumps(aoi.toGeoJSON(), sort_keys=True)
+    except Exception:
+        # Computed geometries cannot be converted locally, fall back to the serialized expression
+        payload = aoi.serialize()
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def export_cache_key(image_id, band_names, region_hash, scale, crs):
+    """
+    Build the content address of an export.
+
+    Parameters:
+        image_id: Earth Engine asset ID of the exported image (or collection for mosaics)
+        band_names: list of exported band names
+        region_hash: hash of the export region, see geometry_hash
+        scale: export scale in meters
+        crs: CRS string of the export
+    Returns:
+        str: sha256 hex digest used as the cache file name
+    """
+    key = json.dumps({
+        "image_id": image_id,
+        "bands": list(band_names),
+        "region": region_hash,
+        "scale": float(scale),
+        "crs": str(crs).upper(),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def export_key_lock(key):
+    """Lock serializing fetch-or-download of a single cache key."""
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _cache_path(key):
+    return os.path.join(EXPORT_CACHE_DIR, key + ".tif")
+
+
+def cache_enabled():
+    return EXPORT_CACHE_MAX_MB > 0
+
+
+def fetch_cached_export(key, output_file):
+    """
+    Copy a cached export to output_file if it exists.
+
+    Returns:
+        bool: True on a cache hit, False otherwise
+    """
+    if not cache_enabled():
+        return False
+    path = _cache_path(key)
+    with _cache_lock:
+        if not os.path.exists(path):
+            return False
+        # Touch the entry so eviction treats it as most recently used
+        os.utime(path, None)
+        shutil.copyfile(path, output_file)
+    print(f"Export cache hit: {os.path.basename(output_file)} ({key[:12]})")
+    return True
+
+
+def read_cached_export(key, reader):
+    """
+    Read a cached export in place with reader(path), without copying it.
+
+    Returns:
+        The result of reader, or None on a cache miss
+    """
+    if not cache_enabled():
+        return None
+    path = _cache_path(key)
+    with _cache_lock:
+        if not os.path.exists(path):
+            return None
+        os.utime(path, None)
+        return reader(path)
+
+
+def store_export(key, source_file):
+    """
+    Add a freshly downloaded export to the cache and evict old entries if needed.
+    """
+    if not cache_enabled() or not os.path.exists(source_file):
+        return
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    with _cache_lock:
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_file, tmp_path)
+            os.replace(tmp_path, _cache_path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _evict()
+
+
+def _evict():
+    """Remove least recently used entries until the cache fits in EXPORT_CACHE_MAX_MB."""
+    max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    total = 0
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        if not name.endswith(".tif"):
+            continue
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            print(f"Evicted export cache entry: {os.path.basename(path)}")
+        except OSError as e:
+            print(f"Warning: Could not evict {path}: {e}")
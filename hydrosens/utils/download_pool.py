@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded concurrency for Earth Engine downloads. Exports are blocking HTTP downloads, so the
+# band and DEM exports of a date run in parallel and the next dates are downloaded while the
+# current one is being computed.
+EE_DOWNLOAD_CONCURRENCY = int(os.getenv("EE_DOWNLOAD_CONCURRENCY", "4"))
+# Number of dates downloaded ahead of the compute stage
+EE_PREFETCH_DATES = int(os.getenv("EE_PREFETCH_DATES", "2"))
+
+_DONE = object()
+
+
+class DownloadPool:
+    """
+    Thread pool for Earth Engine exports.
+
+    Parameters:
+        max_workers: Maximum number of concurrent downloads (EE_DOWNLOAD_CONCURRENCY)
+        prefetch: Number of dates fetched ahead of the consumer (EE_PREFETCH_DATES)
+    """
+
+    def __init__(self, max_workers=None, prefetch=None):
+        self.max_workers = max(1, max_workers or EE_DOWNLOAD_CONCURRENCY)
+        self.prefetch_dates = max(1, prefetch or EE_PREFETCH_DATES)
+        self._downloads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ee-download")
+        # Date-level tasks wait on their downloads, so they get their own executor to avoid deadlocks
+        self._dates = ThreadPoolExecutor(max_workers=self.prefetch_dates, thread_name_prefix="ee-prefetch")
+        self._closed = threading.Event()
+
+    def run_all(self, tasks):
+        """
+        Run several download callables concurrently and wait for all of them.
+
+        Returns:
+            list: results in the order of tasks. The first exception is re-raised.
+        """
+        futures = [self._downloads.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def prefetch(self, items, fetch):
+        """
+        Fetch items ahead of the consumer.
+
+        A feeder thread submits fetch(item) for up to prefetch_dates items at a time and hands
+        the pending results to the consumer through a bounded queue, in the order of items.
+
+        Parameters:
+            items: Iterable of work items (e.g. dates)
+            fetch: Callable performing the downloads of one item
+        Yields:
+            tuple: (item, fetch(item)). Exceptions of fetch are re-raised in the consumer.
+        """
+        pending = queue.Queue(maxsize=self.prefetch_dates)
+
+        def feed():
+            try:
+                for item in items:
+                    if self._closed.is_set():
+                        break
+                    future = self._dates.submit(fetch, item)
+                    # Blocks while prefetch_dates items are already waiting for the consumer
+                    while not self._closed.is_set():
+                        try:
+                            pending.put((item, future), timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+            finally:
+                # Nobody is listening any more once the pool was shut down
+                while not self._closed.is_set():
+                    try:
+                        pending.put((_DONE, None), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+
+        feeder = threading.Thread(target=feed, daemon=True, name="ee-prefetch-feeder")
+        feeder.start()
+        try:
+            while True:
+                item, future = pending.get()
+                if item is _DONE:
+                    break
+                yield item, future.result()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop feeding new work and cancel downloads that have not started."""
+        self._closed.set()
+        self._dates.shutdown(wait=False, cancel_futures=True)
+        self._downloads.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,97 @@
+"""
+Import-time benchmark for worker startup.
+
+Imports each module in a fresh interpreter with `python -X importtime`, reports the total
+import time and the slowest imports, and fails when a module exceeds its budget or
+initializes Earth Engine at import time.
+
+Usage (from the service directory, e.g. hydrosens/ or api-app/):
+    python utils/import_benchmark.py                       # app, utils.main_sentinel_update
+    python utils/import_benchmark.py utils.generate_report --budget 3 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["app", "utils.main_sentinel_update"]
+# Seconds of import time allowed per module before the benchmark fails
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "5"))
+IMPORT_BENCHMARK_RUNS = int(os.getenv("IMPORT_BENCHMARK_RUNS", "3"))
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+# Printed by the child after importing: did anything initialize Earth Engine?
+_PROBE = (
+    "import importlib, sys\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "ee_client = sys.modules.get('hydrosens_shared.ee_client')\n"
+    "print('EE_INITIALIZED=%s' % bool(ee_client is not None and ee_client._initialized))\n"
+)
+
+
+def measure(module):
+    """
+    Import module in a fresh interpreter.
+
+    Returns:
+        dict: total (s), imports (list of (cumulative s, self s, name) for top-level
+              and nested imports), ee_initialized, error
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE, module],
+                          capture_output=True, text=True, cwd=os.getcwd())
+    imports = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        imports.append((cumulative_us / 1e6, self_us / 1e6, name))
+        # Only top-level entries (one leading space) add up to the total
+        if len(indent) == 1:
+            total_us += cumulative_us
+    error = None
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+    return {
+        "total": total_us / 1e6,
+        "imports": imports,
+        "ee_initialized": "EE_INITIALIZED=True" in proc.stdout,
+        "error": error
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of service modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_S, help="Seconds allowed per module")
+    parser.add_argument("--runs", type=int, default=IMPORT_BENCHMARK_RUNS, help="Runs per module, best is reported")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        results = [measure(module) for _ in range(max(1, args.runs))]
+        best = min(results, key=lambda r: r["total"])
+        if best["error"]:
+            print(f"{module}: import failed: {best['error']}")
+            failed = True
+            continue
+
+        status = "OK" if best["total"] <= args.budget else "OVER BUDGET"
+        print(f"{module}: {best['total']:.2f}s (best of {len(results)}, budget {args.budget:g}s) {status}")
+        for cumulative, self_time, name in sorted(best["imports"], reverse=True)[:args.top]:
+            print(f"    {cumulative:7.3f}s cumulative {self_time:7.3f}s self  {name}")
+        if best["ee_initialized"]:
+            print(f"{module}: Earth Engine was initialized at import time")
+            failed = True
+        if best["total"] > args.budget:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .data_utils import get_dates_from_range, check_existing_data, append_to_csv
+from .region_registry import load_registry
+from .main_sentinel_update import run_hydrosens_with_coordinates
+
+# Scheduled background ingestion. Every INGEST_INTERVAL_HOURS the scheduler looks for new
+# Sentinel-2 acquisitions of the last INGEST_LOOKBACK_DAYS for every registered region that has a
+# cache folder under OUTPUT_MASTER, and runs them through the pipeline so interactive requests
+# find them in the cache. Ingestion runs at low priority, but only at date granularity: its thread
+# is reniced (INGEST_NICE), dates are processed one at a time, and before each date the scheduler
+# waits while request work (interactive or full-resolution jobs) is running. A date that has
+# already started is not preempted, so a request may wait for it (region lock, Earth Engine slots,
+# memory) for up to one date's processing time.
+INGEST_INTERVAL_HOURS = float(os.getenv("INGEST_INTERVAL_HOURS", "0"))  # 0 disables ingestion
+INGEST_LOOKBACK_DAYS = int(os.getenv("INGEST_LOOKBACK_DAYS", "5"))
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))
+INGEST_BUSY_POLL_SECONDS = 15
+
+# Used for regions without recorded request parameters (see region_registry.record_ingest_params)
+DEFAULT_INGEST_PARAMS = {
+    "amc": 2,
+    "precipitation": 10.0,
+    "endmember": 3,
+    "unmixing_mode": "mesma"
+}
+
+
+def lower_thread_priority(niceness=INGEST_NICE):
+    """Renice the calling thread (Linux applies nice values per thread); processes it forks inherit it."""
+    if niceness <= 0 or not hasattr(os, "setpriority"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except OSError as e:
+        print(f"Could not lower ingestion thread priority: {e}")
+
+
+class IngestionScheduler:
+    """
+    Periodic ingestion of new scenes for cached regions.
+
+    Parameters:
+        output_master: Root output folder holding the region caches and the region registry
+        get_region_lock: Callable returning the lock of a region ID, shared with interactive jobs
+        is_busy: Callable returning True while request work (interactive or full-resolution jobs) is running
+        interval_hours: Time between ingestion cycles (INGEST_INTERVAL_HOURS)
+        lookback_days: Number of recent days checked for new scenes (INGEST_LOOKBACK_DAYS)
+        scale: Processing resolution in meters
+    """
+
+    def __init__(self, output_master, get_region_lock, is_busy, interval_hours=None, lookback_days=None, scale=10):
+        self.output_master = output_master
+        self.get_region_lock = get_region_lock
+        self.is_busy = is_busy
+        self.interval_hours = INGEST_INTERVAL_HOURS if interval_hours is None else interval_hours
+        self.lookback_days = INGEST_LOOKBACK_DAYS if lookback_days is None else lookback_days
+        self.scale = scale
+        self._stop = threading.Event()
+        self._thread = None
+        self.state = {
+            "running": False,
+            "last_started": None,
+            "last_finished": None,
+            "next_run": None,
+            "regions_checked": 0,
+            "dates_ingested": 0,
+            "errors": []
+        }
+
+    def start(self):
+        """Start the scheduler thread. Returns False if ingestion is disabled."""
+        if self.interval_hours <= 0:
+            return False
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="hydrosens-ingestion")
+        self._thread.start()
+        print(f"Background ingestion every {self.interval_hours:g}h, looking back {self.lookback_days} days")
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return dict(self.state, enabled=self.interval_hours > 0)
+
+    def _loop(self):
+        lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Ingestion cycle failed: {e}")
+                self._record_error(e)
+            next_run = time.time() + self.interval_hours * 3600
+            self.state["next_run"] = next_run
+            self._stop.wait(max(0.0, next_run - time.time()))
+
+    def _record_error(self, error, region_id=None):
+        """Keep the last 10 errors for status()."""
+        prefix = f"{datetime.now().isoformat()}: " + (f"{region_id}: " if region_id else "")
+        self.state["errors"] = (self.state["errors"] + [prefix + str(error)])[-10:]
+
+    def _wait_while_busy(self):
+        """Request work has priority: hold ingestion back, between dates, while any is running."""
+        while self.is_busy() and not self._stop.is_set():
+            self._stop.wait(INGEST_BUSY_POLL_SECONDS)
+
+    def cached_regions(self):
+        """Registered regions that have a cache folder: (region ID, registry entry)."""
+        regions = load_registry(self.output_master)["regions"]
+        return [(region_id, entry) for region_id, entry in sorted(regions.items())
+                if os.path.isdir(os.path.join(self.output_master, region_id))]
+
+    def run_once(self):
+        """Run one ingestion cycle over all cached regions."""
+        self.state.update(running=True, last_started=time.time(), regions_checked=0)
+        end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_date = end_date - timedelta(days=self.lookback_days)
+        ingested = 0
+        try:
+            for region_id, entry in self.cached_regions():
+                if self._stop.is_set():
+                    break
+                # A failing region must not hold back the others until the next cycle
+                try:
+                    ingested += self.ingest_region(region_id, entry, start_date, end_date)
+                except Exception as e:
+                    print(f"Ingestion of region {region_id} failed: {e}")
+                    self._record_error(e, region_id)
+                self.state["regions_checked"] += 1
+        finally:
+            self.state.update(running=False, last_finished=time.time(),
+                              dates_ingested=self.state["dates_ingested"] + ingested)
+        print(f"Ingestion cycle finished: {ingested} new dates over {self.state['regions_checked']} regions")
+        return ingested
+
+    def ingest_region(self, region_id, entry, start_date, end_date):
+        """
+        Process the dates of a region in [start_date, end_date] that are not cached yet.
+
+        Returns:
+            int: Number of dates with imagery that were processed
+        """
+        params = dict(DEFAULT_INGEST_PARAMS, **entry.get("ingest_params", {}))
+        coordinates, crs = entry["coordinates"], entry["crs"]
+        request_params = {
+            "coordinates": coordinates,
+            "crs": crs,
+            "endmember": params["endmember"],
+            "unmixing_mode": params["unmixing_mode"],
+            "scale": self.scale,
+            "amc": params["amc"],
+            "p": params["precipitation"]
+        }
+        dates_to_process, _, expired_no_data, _ = check_existing_data(
+            self.output_master, region_id, get_dates_from_range(start_date, end_date),
+            request_params=request_params)
+        if not dates_to_process:
+            return 0
+        print(f"Ingesting {len(dates_to_process)} dates for region {region_id}")
+
+        processed = 0
+        # One date at a time, so interactive jobs never wait for more than one date
+        for date in dates_to_process:
+            date_str = date.strftime('%Y-%m-%d')
+            self._wait_while_busy()
+            if self._stop.is_set():
+                break
+            with self.get_region_lock(region_id):
+                results = run_hydrosens_with_coordinates(
+                    region_name=region_id,
+                    coordinates=coordinates,
+                    dates_to_process=[date],
+                    output_dir=self.output_master,
+                    amc=params["amc"],
+                    precipitation=params["precipitation"],
+                    crs=crs,
+                    endmember=params["endmember"],
+                    refresh_dates=[date_str] if date_str in expired_no_data else None,
+                    unmixing_mode=params["unmixing_mode"],
+                    scale=self.scale
+                )
+                no_data_dates = [] if results else [date_str]
+                append_to_csv(self.output_master, region_id, results, no_data_dates, resolution='full')
+            processed += len(results)
+        return processed
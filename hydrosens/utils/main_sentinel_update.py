@@ -1,9 +1,18 @@
 ### Import required libraries ###
 from .GEE_Functions_update import *
 from .Functions_update import *
-import matplotlib.pyplot
+from .scene_index import get_scene_index
+from .memory_profiler import checkpoint
+from .runoff import runoff_from_cn
+from .derived_products import write_cn_stats
+from .stage_cache import stage_params, write_stage_manifest, clear_stage_manifest
+from .download_pool import DownloadPool
+from .pipeline import PublishStage
+from .scene_stats import get_scene_statistics
+from hydrosens_shared.ee_client import EECallTimeout
+from .pixel_fetch import pixel_fetch_enabled, compute_grid, fits_single_request, open_raster, EE_DOWNLOAD_MAX_BYTES
+from .sensors import get_sensor, sensor_storage_key
 import glob
-from spectral_libraries.core import amuses
 from datetime import timedelta, datetime
 import sys
 #from Report import *
@@ -13,7 +22,24 @@ import time
 # Start the timer
 start_time = time.time()
 
-def run_hydrosens(main_folder, region_name, dates_to_process, output_master, amc, p, coordinates, crs='EPSG:4326', endmember=3):
+# Reduction scale of the statistics-only mode, coarser than the pipeline since only means are needed
+STATS_SCALE = float(os.getenv("STATS_SCALE", "30"))
+
+# Floating point precision of the raster math: 'float64' (default) or 'float32'.
+# float32 halves memory bandwidth and peak RSS; reflectance scaled to 0-1 does not need float64.
+HYDROSENS_PRECISION = os.getenv("HYDROSENS_PRECISION", "float64")
+
+
+def resolve_precision(precision=None):
+    """Return the numpy dtype for a precision mode ('float32' or 'float64')."""
+    precision = (precision or HYDROSENS_PRECISION).lower()
+    if precision not in ('float32', 'float64'):
+        print(f"Unknown precision '{precision}', using float64")
+        precision = 'float64'
+    return np.dtype(precision)
+
+
+def run_hydrosens(main_folder, region_name, dates_to_process, output_master, amc, p, coordinates, crs='EPSG:4326', endmember=3, refresh_dates=None, unmixing_mode='mesma', scale=10, precision=None, memory_profiler=None, sensor='sentinel2'):
     """
     Run the Hydrosens workflow for specific dates and coordinate-based area of interest.
     
@@ -29,22 +55,41 @@ def run_hydrosens(main_folder, region_name, dates_to_process, output_master, amc
         endmember: Number of endmembers for MESMA (2 or 3, default: 3)
                   3 = vegetation, impervious, soil
                   2 = vegetation, soil (no impervious)
+        refresh_dates: Dates whose cached scene availability must be re-checked (expired NO DATA markers)
+        unmixing_mode: 'mesma' (default) for full MESMA model search, 'fcls' for fast fully constrained
+                  least squares against class-mean spectra
+        scale: processing resolution in meters (10 m, or coarser for preview runs)
+        precision: 'float64' or 'float32' raster math (default: HYDROSENS_PRECISION)
+        memory_profiler: Optional MemoryProfiler recording RSS and top allocators at each stage
+        sensor: 'sentinel2' (default) or 'landsat' (Landsat 8/9), see sensors.py
     """    
     # Convert coordinates to Earth Engine geometry
     aoi = coordinates_to_ee_geometry(coordinates)
     
     print(f"Processing coordinate-based AOI with {len(coordinates)} vertices for region: {region_name}")
     print(f"Processing {len(dates_to_process)} specific dates")
-    return process_specific_dates(dates_to_process, aoi, output_master, region_name, amc, p, coordinates, crs, endmember)
+    return process_specific_dates(dates_to_process, aoi, output_master, region_name, amc, p, coordinates, crs, endmember, refresh_dates, unmixing_mode, scale, precision, memory_profiler, sensor)
+
 
+def process_specific_dates(dates_to_process, aoi, output_master, region_name, amc, p, coordinates, crs, endmember=3, refresh_dates=None, unmixing_mode='mesma', scale=10, precision=None, memory_profiler=None, sensor='sentinel2'):
+    """
+    Process the images of a sensor for specific dates if imagery exists.
+
+    Everything sensor specific (catalog, bands, index bands, water threshold, reflectance scaling and
+    spectral library) comes from the sensor adapter; results of sensors other than Sentinel-2 are
+    stored below the region folder, see sensors.sensor_storage_key.
+    """
 
-def process_specific_dates(dates_to_process, aoi, output_master, region_name, amc, p, coordinates, crs, endmember=3):
-    """Process Sentinel-2 images for specific dates if imagery exists."""
+    sensor = get_sensor(sensor)
+    region_folder = sensor_storage_key(region_name, sensor)
+    num_bands = len(sensor.band_names)
+    dtype = resolve_precision(precision)
+    print(f"Sensor: {sensor.label}, raster math precision: {dtype}")
 
     all_weather_data = get_daily_weather(dates_to_process, aoi)
 
     HSG250m = os.getenv("HSG250m")
-    sli = os.getenv("SLI")
+    sli = os.getenv(sensor.sli_env)
     dates_with_images = []
     vegetation_values = []
     impervious_values = []
@@ -54,484 +99,538 @@ def process_specific_dates(dates_to_process, aoi, output_master, region_name, am
     avg_temp = []
     avg_p = []
 
+    # One aggregated catalog query per date range tells us which dates have imagery,
+    # expired NO DATA dates are re-verified as part of the same query
+    scene_ids = get_scene_index(aoi, os.path.join(output_master, region_folder), dates_to_process,
+                                refresh_dates=refresh_dates, query=sensor.query_scenes)
+    checkpoint(memory_profiler, "catalog_and_weather", dates=len(dates_to_process), scenes=len(scene_ids))
+
+    scene_dates = []
     for date in dates_to_process:
         if isinstance(date, str):
             date = datetime.strptime(date, '%Y-%m-%d')
-            
-        print(f"Processing for date: {date.strftime('%Y-%m-%d')} in region: {region_name}")
-        # extract S-2 data
-        StartDate = date
-        EndDate = StartDate + timedelta(days=1, seconds=-1)
-
-        filtered_col, num_images = load_Sentinel2(aoi, StartDate, EndDate)
 
-        if num_images == 0:
-            print(f"No images found for {StartDate.strftime('%Y-%m-%d')}. Skipping to next date.")
+        if scene_ids.get(date.strftime('%Y-%m-%d')) is None:
+            print(f"No images found for {date.strftime('%Y-%m-%d')}. Skipping to next date.")
             continue
+        scene_dates.append(date)
+
+    # Use the provided CRS instead of reading from shapefile
+    crs_string = crs
+    download_pool = DownloadPool()
+    # Pixels are fetched straight into memory on one grid shared by bands and DEM (EE_FETCH_MODE).
+    # AOIs too large for a single file export are always fetched this way, as tiles.
+    grid = compute_grid(coordinates, crs_string, scale)
+    export_fits = fits_single_request(grid, num_bands, max_bytes=EE_DOWNLOAD_MAX_BYTES)
+    if not pixel_fetch_enabled():
+        if export_fits:
+            grid = None
+        else:
+            print(f"AOI of {grid['width']}x{grid['height']} px exceeds the export limit, fetching tiles")
 
-        dates_with_images.append(date)
-        
-        output = create_output_folder(output_master, region_name, date)
-        print("Output: ", output)
+    def download_date(date):
+        """Download bands and DEM of one date concurrently, runs ahead of the compute loop."""
+        image_id = scene_ids[date.strftime('%Y-%m-%d')]
+        filtered_col = ee.Image(image_id).select(*sensor.band_names)
 
-        print(f"Image found for {date}, creating output folder.")
+        output = create_output_folder(output_master, region_folder, date)
+        clear_stage_manifest(output)
+        DEM = getDEM(aoi)
 
-        print(f"Processing image from {date}")
+        if grid is not None:
+            print(f"Image found for {date}, fetching {grid['width']}x{grid['height']} px")
+            # The grid does the reprojection, bilinear as in resampling()
+            resample_img = filtered_col.resample('bilinear')
+            try:
+                bands_src, dem_src = download_pool.run_all([
+                    lambda: sensor.fetch_bands(resample_img, aoi, grid, image_id=image_id),
+                    lambda: DEMfetch(DEM, aoi, grid)
+                ])
+                return output, bands_src, dem_src
+            except (ee.EEException, EECallTimeout) as e:
+                if not export_fits:
+                    # Failed tiles were already retried by ee_call, and a single export of the whole AOI
+                    # would exceed the download limit
+                    raise
+                # Bands and DEM have to share one grid, so both are exported, never just one of them
+                print(f"computePixels failed ({e}), exporting bands and DEM to file")
+
+        print(f"Image found for {date}, downloading to {output}")
+        resample_img = resampling(filtered_col, crs_string, scale=scale, band_names=sensor.band_names)
+        download_pool.run_all([
+            lambda: sensor.export_bands(resample_img, crs_string, output, aoi, image_id=image_id, scale=scale),
+            lambda: DEMexport(DEM, crs_string, output, aoi, scale=scale)
+        ])
+        return output, output + r"/Bands.tif", output + r"/DEM.tif"
+
+    def publish_date(output, date_str):
+        """Cleanup, polygon clipping and stage manifest of a computed date, runs on the publish stage."""
+        # Clean up output folder - keep only essential files
+        cleanup_output_folder(output)
 
-        # Use the provided CRS instead of reading from shapefile
-        crs_string = crs
-        resample_img = resampling(filtered_col, crs_string)
-        DEM = getDEM(aoi)
-        Bandsexport(resample_img, crs_string, output, aoi)
-        DEMexport(DEM, crs_string, output, aoi)
-
-        weather_day = all_weather_data.get(date.strftime('%Y-%m-%d'))
-        if weather_day:
-            temperature = weather_day['temperature']
-            precipitation = weather_day['precipitation']
-            avg_temp.append(temperature)
-            avg_p.append(precipitation)
-        else:
-            # Handle cases where weather data might be missing for a day
-            print("[temp] NO TEMP DATA FOUND")
-            avg_temp.append(0)
-            avg_p.append(0)
-
-        bands = gdal.Open(output + r"/Bands.tif")
-        band_array = bands.ReadAsArray()
-        arr2 = bands.GetRasterBand(1).ReadAsArray().astype('float64') 
-        arr3 = bands.GetRasterBand(2).ReadAsArray().astype('float64')
-        arr4 = bands.GetRasterBand(3).ReadAsArray().astype('float64')
-        arr8A = bands.GetRasterBand(6).ReadAsArray().astype('float64')
-        arr11 = bands.GetRasterBand(7).ReadAsArray().astype('float64')
-
-        # True Color Image 
-        np.seterr(invalid='ignore') 
-        writeTCI(arr4, arr3, arr2, bands, "TCI", output) 
-
-        # NDVI
-        np.seterr(invalid='ignore')
-        NDVI = (np.divide((arr8A - arr4), (arr8A + arr4), out=np.zeros_like(arr8A), where=(arr8A + arr4) != 0))
-        ndvi_values.append(np.nanmean(NDVI))
-        CreateFloat(NDVI, bands, "NDVI", output)
-
-        # MNDWI
-        np.seterr(invalid='ignore')
-        MNDWI = (np.divide((arr3 - arr11), (arr3 + arr11), out=np.zeros_like(arr3), where=(arr3 + arr11) != 0))
-
-        ### Water Mask ###
-        # Default MNDWI threshold is 0
-
-        reclassified_MNDWI = np.where(MNDWI > 0, 1, 0)
-        CreateFloat(reclassified_MNDWI, bands, "null_MNDWI", output)
-        del MNDWI
-
-        # Sieve sparse, unconnected pixels in MNDWI to maintain contiguous water bodies
-        null = gdal.Open(output + r"/null_MNDWI.tif", 1)
-        Band = null.GetRasterBand(1)
-        gdal.SieveFilter(srcBand=Band, maskBand=None, dstBand=Band, threshold=16, connectedness=8)
-        del null, Band
-
-        # Mask out water
-        mask = gdal.Open(output + r"/null_MNDWI.tif")
-        mask_array = mask.ReadAsArray()
-
-        # Mask and save all bands of band_array
-        driver = gdal.GetDriverByName('GTiff')
-        output_raster_path = output + r"/bands_masked.tif"
-        if os.path.exists(output_raster_path):
-            os.remove(output_raster_path)
-        output_raster = driver.Create(output + r"/bands_masked.tif", bands.RasterXSize, bands.RasterYSize,
-                                      band_array.shape[0],
-                                      gdal.GDT_Float64)
-        output_raster.SetProjection(bands.GetProjection())
-        output_raster.SetGeoTransform(bands.GetGeoTransform())
-
-        for band_index in range(band_array.shape[0]):
-            masked_band = np.where(mask_array == 0, band_array[band_index], 0)
-            output_raster.GetRasterBand(band_index + 1).WriteArray(masked_band)
-
-        output_raster.FlushCache()
-        output_raster = None
-
-        ### MESMA ###
-
-        # Prepare image and spectral library for MESMA
-        input_img = r"/Bands.tif"
-        image = gdal.Open(output + input_img)
-        image_array = image.ReadAsArray()
-        image_array[np.isnan(image_array)] = -9999
-        image_array[np.isinf(image_array)] = -9999
-        image_array[image_array == 0] = -9999
-        img = prepare_S2image(output + r"/bands_masked.tif")
-        class_list_init_, initial_lib = prepare_sli(sli, num_bands=8)
-
-        # Always run AMUSES on the full original library
-        A = amuses.Amuses()
-        em_spectra_dict = A.execute(image_array, initial_lib, 0.9, 0.95, 15, (0.0002, 0.02))
-        em_spectra_list = list(em_spectra_dict.values())
-        indices_array = em_spectra_dict['amuses_indices']
-
-        # Get the trimmed library from the original spectral library using AMUSES indices
-        class_list_init, em_spectra_trim = trimmed_library(sli, num_bands=8, row_numbers=indices_array)
-
-        output_file = output + r"/trimmed_library.csv"
-        wavelengths = [490, 560, 665, 783, 842, 865, 1610, 2190]
-
-        # Create dataframe with all AMUSES-selected endmembers
-        data = {
-            "MaterialClass": class_list_init,
-            **{str(wavelengths[i]): em_spectra_trim[i] for i in range(len(wavelengths))}
-        }
-        df = pd.DataFrame(data)
-
-        # Filter based on endmember parameter AFTER getting AMUSES results
-        if endmember == 2:
-            # For 2 endmembers, we need to work around MESMA library limitations
-            # Keep vegetation and soil, but also include minimal impervious to avoid indexing errors
-            material_order = ['vegetation', 'soil']
-            df_filtered = df[df['MaterialClass'].isin(material_order)].copy()
-            
-            # If we don't have enough endmembers, we need to create a dummy impervious entry
-            # to prevent MESMA from failing with indexing errors
-            if len(df_filtered) > 0:
-                # Add one minimal impervious endmember to satisfy MESMA's internal requirements
-                impervious_rows = df[df['MaterialClass'] == 'impervious']
-                if len(impervious_rows) > 0:
-                    # Take just one impervious endmember to complete the set
-                    dummy_impervious = impervious_rows.iloc[:1].copy()
-                    df_filtered = pd.concat([df_filtered, dummy_impervious])
-                    material_order = ['vegetation', 'impervious', 'soil']  # Standard order for MESMA
-                    print(f"Using 2 endmembers: vegetation and soil (with dummy impervious for MESMA compatibility)")
-                else:
-                    print("Warning: No impervious endmembers available for MESMA compatibility")
+        # Post-processing: Clip all important TIF files to polygon shape
+        # This ensures that instead of having bounding box rasters, we get precise polygon-clipped rasters
+        # that match the exact area of interest defined by the coordinates
+        clipping_results = clip_tif_files_to_polygon(output, coordinates, crs)
+        
+        # Store clipping results for potential debugging or reporting
+        if clipping_results['failure_count'] > 0:
+            print(f"Warning: {clipping_results['failure_count']} files failed to clip properly")
+
+        # Record what each stage of this date was computed with, see stage_cache.py
+        write_stage_manifest(output, stage_params(date_str, coordinates, crs, endmember, unmixing_mode, scale, amc, p, sensor=sensor.name))
+
+    # Fetch, compute and publish run as a pipeline, see pipeline.py. Downloads of the next
+    # EE_PREFETCH_DATES dates overlap with the computation of the current one, which in turn
+    # overlaps with the clipping of the previous one.
+    publisher = PublishStage()
+    try:
+        for date, (output, bands_src, dem_src) in download_pool.prefetch(scene_dates, download_date):
+            print(f"Processing {sensor.label} for date: {date.strftime('%Y-%m-%d')} in region: {region_name}")
+            print("Output: ", output)
+
+            dates_with_images.append(date)
+            date_str = date.strftime('%Y-%m-%d')
+            checkpoint(memory_profiler, "download", date=date_str)
+
+            weather_day = all_weather_data.get(date_str)
+            if weather_day:
+                temperature = weather_day['temperature']
+                precipitation = weather_day['precipitation']
+                avg_temp.append(temperature)
+                avg_p.append(precipitation)
+            else:
+                # Handle cases where weather data might be missing for a day
+                print("[temp] NO TEMP DATA FOUND")
+                avg_temp.append(0)
+                avg_p.append(0)
+
+            bands = open_raster(bands_src)
+            band_array = bands.ReadAsArray()
+            blue = bands.GetRasterBand(sensor.blue).ReadAsArray().astype(dtype)
+            green = bands.GetRasterBand(sensor.green).ReadAsArray().astype(dtype)
+            red = bands.GetRasterBand(sensor.red).ReadAsArray().astype(dtype)
+            nir = bands.GetRasterBand(sensor.nir).ReadAsArray().astype(dtype)
+            swir1 = bands.GetRasterBand(sensor.swir1).ReadAsArray().astype(dtype)
+
+            # True Color Image 
+            np.seterr(invalid='ignore') 
+            writeTCI(red, green, blue, bands, "TCI", output) 
+
+            # NDVI
+            NDVI = normalized_difference(nir, red)
+            ndvi_values.append(np.nanmean(NDVI))
+            CreateFloat(NDVI, bands, "NDVI", output)
+
+            # MNDWI
+            MNDWI = normalized_difference(green, swir1)
+
+            ### Water Mask ###
+            # MNDWI threshold of the sensor, applied to surface reflectance
+
+            reclassified_MNDWI = np.where(MNDWI > sensor.mndwi_threshold, 1, 0).astype(dtype)
+            CreateFloat(reclassified_MNDWI, bands, "null_MNDWI", output)
+            del MNDWI
+
+            # Sieve sparse, unconnected pixels in MNDWI to maintain contiguous water bodies
+            null = gdal.Open(output + r"/null_MNDWI.tif", 1)
+            Band = null.GetRasterBand(1)
+            gdal.SieveFilter(srcBand=Band, maskBand=None, dstBand=Band, threshold=16, connectedness=8)
+            del null, Band
+
+            # Mask out water
+            mask = gdal.Open(output + r"/null_MNDWI.tif")
+            mask_array = mask.ReadAsArray()
+
+            # Mask and save all bands of band_array
+            driver = gdal.GetDriverByName('GTiff')
+            output_raster_path = output + r"/bands_masked.tif"
+            if os.path.exists(output_raster_path):
+                os.remove(output_raster_path)
+            output_raster = driver.Create(output + r"/bands_masked.tif", bands.RasterXSize, bands.RasterYSize,
+                                          band_array.shape[0],
+                                          gdal_float_type(dtype))
+            output_raster.SetProjection(bands.GetProjection())
+            output_raster.SetGeoTransform(bands.GetGeoTransform())
+
+            for band_index in range(band_array.shape[0]):
+                masked_band = np.where(mask_array == 0, band_array[band_index], 0).astype(dtype, copy=False)
+                output_raster.GetRasterBand(band_index + 1).WriteArray(masked_band)
+
+            output_raster.FlushCache()
+            output_raster = None
+            checkpoint(memory_profiler, "indices_and_water_mask", date=date_str, shape=list(band_array.shape))
+
+            ### Spectral unmixing ###
+
+            # Prepare image for unmixing
+            image = bands
+            img = sensor.prepare_image(output + r"/bands_masked.tif")
+
+            if unmixing_mode == 'fcls':
+                # Fast fully constrained least squares against class-mean spectra of the library
+                vegetation, impervious, soil = fcls_fractions(img, sli, num_bands=num_bands, endmember=endmember)
+                vegetation, impervious, soil = (f.astype(dtype, copy=False) for f in (vegetation, impervious, soil))
+                print(f"FCLS unmixing ({endmember} endmembers): vegetation, impervious, and soil fractions calculated")
+            else:
+                ### MESMA ###
+
+                # Prepare image and spectral library for AMUSES and MESMA
+                image_array = image.ReadAsArray()
+                image_array[np.isnan(image_array)] = -9999
+                image_array[np.isinf(image_array)] = -9999
+                image_array[image_array == 0] = -9999
+                class_list_init_, initial_lib = prepare_sli(sli, num_bands=num_bands)
+
+                # Always run AMUSES on the full original library
+                from spectral_libraries.core import amuses
+                A = amuses.Amuses()
+                em_spectra_dict = A.execute(image_array, initial_lib, 0.9, 0.95, 15, (0.0002, 0.02))
+                em_spectra_list = list(em_spectra_dict.values())
+                indices_array = em_spectra_dict['amuses_indices']
+
+                # Get the trimmed library from the original spectral library using AMUSES indices
+                class_list_init, em_spectra_trim = trimmed_library(sli, num_bands=num_bands, row_numbers=indices_array)
+
+                output_file = output + r"/trimmed_library.csv"
+                wavelengths = sensor.wavelengths
+
+                # Create dataframe with all AMUSES-selected endmembers
+                data = {
+                    "MaterialClass": class_list_init,
+                    **{str(wavelengths[i]): em_spectra_trim[i] for i in range(len(wavelengths))}
+                }
+                df = pd.DataFrame(data)
+
+                # Filter based on endmember parameter AFTER getting AMUSES results
+                if endmember == 2:
+                    # For 2 endmembers, we need to work around MESMA library limitations
+                    # Keep vegetation and soil, but also include minimal impervious to avoid indexing errors
                     material_order = ['vegetation', 'soil']
+                    df_filtered = df[df['MaterialClass'].isin(material_order)].copy()
             
-            print(f"Original AMUSES selection had {len(df)} endmembers, filtered to {len(df_filtered)}")
-        else:
-            # Use all 3 endmembers
-            material_order = ['vegetation', 'impervious', 'soil']
-            df_filtered = df[df['MaterialClass'].isin(material_order)].copy()
-            print("Using 3 endmembers: vegetation, impervious, and soil")
-
-        # Ensure we have endmembers for the analysis
-        if len(df_filtered) == 0:
-            print("Warning: No endmembers of desired types found after filtering. Using original AMUSES selection.")
-            df_filtered = df.copy()
-            material_order = list(df['MaterialClass'].unique())
-
-        # For balanced selection, limit the number per class
-        unique_classes = df_filtered['MaterialClass'].unique()
-        if len(unique_classes) >= 2:
-            # Balance the selection but ensure we have all required classes
-            max_per_class = max(3, min(10, len(df_filtered) // len(unique_classes)))
-            balanced_df = []
-            for cls in unique_classes:
-                cls_rows = df_filtered[df_filtered['MaterialClass'] == cls].head(max_per_class)
-                balanced_df.append(cls_rows)
-            df_filtered = pd.concat(balanced_df).copy()
+                    # If we don't have enough endmembers, we need to create a dummy impervious entry
+                    # to prevent MESMA from failing with indexing errors
+                    if len(df_filtered) > 0:
+                        # Add one minimal impervious endmember to satisfy MESMA's internal requirements
+                        impervious_rows = df[df['MaterialClass'] == 'impervious']
+                        if len(impervious_rows) > 0:
+                            # Take just one impervious endmember to complete the set
+                            dummy_impervious = impervious_rows.iloc[:1].copy()
+                            df_filtered = pd.concat([df_filtered, dummy_impervious])
+                            material_order = ['vegetation', 'impervious', 'soil']  # Standard order for MESMA
+                            print(f"Using 2 endmembers: vegetation and soil (with dummy impervious for MESMA compatibility)")
+                        else:
+                            print("Warning: No impervious endmembers available for MESMA compatibility")
+                            material_order = ['vegetation', 'soil']
             
-            class_counts = df_filtered['MaterialClass'].value_counts().to_dict()
-            print(f"Balanced selection: {class_counts}")
+                    print(f"Original AMUSES selection had {len(df)} endmembers, filtered to {len(df_filtered)}")
+                else:
+                    # Use all 3 endmembers
+                    material_order = ['vegetation', 'impervious', 'soil']
+                    df_filtered = df[df['MaterialClass'].isin(material_order)].copy()
+                    print("Using 3 endmembers: vegetation, impervious, and soil")
+
+                # Ensure we have endmembers for the analysis
+                if len(df_filtered) == 0:
+                    print("Warning: No endmembers of desired types found after filtering. Using original AMUSES selection.")
+                    df_filtered = df.copy()
+                    material_order = list(df['MaterialClass'].unique())
+
+                # For balanced selection, limit the number per class
+                unique_classes = df_filtered['MaterialClass'].unique()
+                if len(unique_classes) >= 2:
+                    # Balance the selection but ensure we have all required classes
+                    max_per_class = max(3, min(10, len(df_filtered) // len(unique_classes)))
+                    balanced_df = []
+                    for cls in unique_classes:
+                        cls_rows = df_filtered[df_filtered['MaterialClass'] == cls].head(max_per_class)
+                        balanced_df.append(cls_rows)
+                    df_filtered = pd.concat(balanced_df).copy()
+            
+                    class_counts = df_filtered['MaterialClass'].value_counts().to_dict()
+                    print(f"Balanced selection: {class_counts}")
 
-        print(f"Final endmember selection: {list(df_filtered['MaterialClass'].unique())}")
+                print(f"Final endmember selection: {list(df_filtered['MaterialClass'].unique())}")
 
-        # Sort by material class
-        df_filtered['MaterialClass'] = pd.Categorical(df_filtered['MaterialClass'], categories=material_order, ordered=True)
-        df_filtered = df_filtered.sort_values('MaterialClass')
-        df_filtered = df_filtered.reset_index(drop=True)
+                # Sort by material class
+                df_filtered['MaterialClass'] = pd.Categorical(df_filtered['MaterialClass'], categories=material_order, ordered=True)
+                df_filtered = df_filtered.sort_values('MaterialClass')
+                df_filtered = df_filtered.reset_index(drop=True)
 
-        output_csv = output + r"/trimmed_library.csv"
-        print("output_csv", output_csv)
-        df_filtered.to_csv(output_csv, index=False)
+                output_csv = output + r"/trimmed_library.csv"
+                print("output_csv", output_csv)
+                df_filtered.to_csv(output_csv, index=False)
 
-        class_list, trim_lib = prepare_sli(output + r"/trimmed_library.csv", num_bands=8)
+                class_list, trim_lib = prepare_sli(output + r"/trimmed_library.csv", num_bands=num_bands)
 
-        # Run MESMA algorithm using trimmed spectral library
-        out_fractions = doMESMA(class_list, img, trim_lib)
-        final = np.flip(out_fractions, axis=1)
-        final = np.rot90(final, k=3, axes=(1, 2))
+                # Run MESMA algorithm using trimmed spectral library
+                out_fractions = doMESMA(class_list, img, trim_lib, dtype=dtype, memory_profiler=memory_profiler)
+                final = np.flip(out_fractions, axis=1)
+                final = np.rot90(final, k=3, axes=(1, 2))
         
-        # Handle different endmember configurations
-        if endmember == 2:
-            # For 2 endmembers: We included a dummy impervious for MESMA compatibility
-            # Now we need to extract only vegetation and soil, and set impervious to zero
-            unique_classes = list(df_filtered['MaterialClass'].unique())
-            print(f"MESMA output shape: {final.shape}, Classes: {unique_classes}")
+                # Handle different endmember configurations
+                if endmember == 2:
+                    # For 2 endmembers: We included a dummy impervious for MESMA compatibility
+                    # Now we need to extract only vegetation and soil, and set impervious to zero
+                    unique_classes = list(df_filtered['MaterialClass'].unique())
+                    print(f"MESMA output shape: {final.shape}, Classes: {unique_classes}")
             
-            # Find indices for vegetation and soil in the final output
-            class_indices = {cls: i for i, cls in enumerate(sorted(unique_classes))}
+                    # Find indices for vegetation and soil in the final output
+                    class_indices = {cls: i for i, cls in enumerate(sorted(unique_classes))}
             
-            if 'vegetation' in class_indices and 'soil' in class_indices:
-                vegetation = final[class_indices['vegetation']]
-                soil = final[class_indices['soil']]
-                print(f"Extracted vegetation (index {class_indices['vegetation']}) and soil (index {class_indices['soil']})")
-            else:
-                # Fallback: assume first two bands are what we want
-                vegetation = final[0] if len(final) > 0 else np.zeros_like(mask_array)
-                soil = final[1] if len(final) > 1 else np.zeros_like(mask_array)
-                print("Fallback: using first two MESMA output bands")
+                    if 'vegetation' in class_indices and 'soil' in class_indices:
+                        vegetation = final[class_indices['vegetation']]
+                        soil = final[class_indices['soil']]
+                        print(f"Extracted vegetation (index {class_indices['vegetation']}) and soil (index {class_indices['soil']})")
+                    else:
+                        # Fallback: assume first two bands are what we want
+                        vegetation = final[0] if len(final) > 0 else np.zeros_like(mask_array)
+                        soil = final[1] if len(final) > 1 else np.zeros_like(mask_array)
+                        print("Fallback: using first two MESMA output bands")
             
-            # Set impervious to zero array for 2-endmember case
-            impervious = np.zeros_like(soil)
-            print("2-endmember MESMA: vegetation and soil fractions calculated, impervious set to zero")
-        else:
-            # For 3 endmembers: Standard processing
-            unique_classes = list(df_filtered['MaterialClass'].unique())
-            print(f"MESMA output shape: {final.shape}, Classes: {unique_classes}")
+                    # Set impervious to zero array for 2-endmember case
+                    impervious = np.zeros_like(soil)
+                    print("2-endmember MESMA: vegetation and soil fractions calculated, impervious set to zero")
+                else:
+                    # For 3 endmembers: Standard processing
+                    unique_classes = list(df_filtered['MaterialClass'].unique())
+                    print(f"MESMA output shape: {final.shape}, Classes: {unique_classes}")
             
-            if len(unique_classes) >= 3:
-                # Standard 3-endmember case - order depends on alphabetical sorting
-                class_indices = {cls: i for i, cls in enumerate(sorted(unique_classes))}
-                vegetation = final[class_indices.get('vegetation', 0)]
-                impervious = final[class_indices.get('impervious', 1)]
-                soil = final[class_indices.get('soil', 2)]
-                print(f"Extracted vegetation (index {class_indices.get('vegetation', 0)}), "
-                      f"impervious (index {class_indices.get('impervious', 1)}), "
-                      f"soil (index {class_indices.get('soil', 2)})")
-            else:
-                # Fallback for cases with fewer than 3 endmembers
-                vegetation = final[0] if len(final) > 0 else np.zeros_like(mask_array)
-                impervious = final[1] if len(final) > 1 else np.zeros_like(mask_array)
-                soil = final[2] if len(final) > 2 else np.zeros_like(mask_array)
-                print("Fallback: using first three MESMA output bands")
-            print("3-endmember MESMA: vegetation, impervious, and soil fractions calculated")
+                    if len(unique_classes) >= 3:
+                        # Standard 3-endmember case - order depends on alphabetical sorting
+                        class_indices = {cls: i for i, cls in enumerate(sorted(unique_classes))}
+                        vegetation = final[class_indices.get('vegetation', 0)]
+                        impervious = final[class_indices.get('impervious', 1)]
+                        soil = final[class_indices.get('soil', 2)]
+                        print(f"Extracted vegetation (index {class_indices.get('vegetation', 0)}), "
+                              f"impervious (index {class_indices.get('impervious', 1)}), "
+                              f"soil (index {class_indices.get('soil', 2)})")
+                    else:
+                        # Fallback for cases with fewer than 3 endmembers
+                        vegetation = final[0] if len(final) > 0 else np.zeros_like(mask_array)
+                        impervious = final[1] if len(final) > 1 else np.zeros_like(mask_array)
+                        soil = final[2] if len(final) > 2 else np.zeros_like(mask_array)
+                        print("Fallback: using first three MESMA output bands")
+                    print("3-endmember MESMA: vegetation, impervious, and soil fractions calculated")
+
+                os.remove(output + r"/trimmed_library.csv")
         
-        vegetation_values.append(np.nanmean(vegetation))
-        impervious_values.append(np.nanmean(impervious))
-        soil_values.append(np.nanmean(soil))
-
-        del img
-        os.remove(output + r"/trimmed_library.csv")
-        CreateFloat(soil, image, "soil", output)
-        CreateFloat(impervious, image, "impervious", output)
-        CreateFloat(vegetation, image, "vegetation", output)
-
-        ### Global Soil Dataset Processing ###
-
-        # Create buffered coordinates for soil dataset extraction
-        try:
-            buffered_coords, buffered_crs = Create_buffer(coordinates, crs)
-            print(f"Created buffer with {len(buffered_coords)} coordinates")
-        except Exception as e:
-            print(f"Error creating buffer: {e}")
-            raise
-
-        # Matching global dataset projection to buffered coordinates for extraction
-        try:
-            HSG250m_open = gdal.Open(HSG250m)
-            if HSG250m_open is None:
-                raise ValueError(f"Could not open HSG dataset: {HSG250m}")
-            soil_crs = HSG250m_open.GetProjection()
-            print(f"HSG dataset CRS: {soil_crs}")
-        except Exception as e:
-            print(f"Error accessing HSG dataset: {e}")
-            raise
-
-        # Extract study area from global dataset using buffered coordinates
-        try:
-            print(f"Extracting from HSG dataset using buffered coordinates...")
-            Extract(HSG250m, buffered_coords, buffered_crs, output + r"/extracted.tif", nodata_value=255)
-            print("HSG extraction completed successfully")
-        except Exception as e:
-            print(f"Error in HSG extraction: {e}")
-            # Try with original coordinates if buffered extraction fails
+            vegetation_values.append(np.nanmean(vegetation))
+            impervious_values.append(np.nanmean(impervious))
+            soil_values.append(np.nanmean(soil))
+
+            del img
+            CreateFloat(soil, image, "soil", output)
+            CreateFloat(impervious, image, "impervious", output)
+            CreateFloat(vegetation, image, "vegetation", output)
+            checkpoint(memory_profiler, "unmixing", date=date_str, mode=unmixing_mode)
+
+            ### Global Soil Dataset Processing ###
+
+            # Create buffered coordinates for soil dataset extraction
+            try:
+                buffered_coords, buffered_crs = Create_buffer(coordinates, crs)
+                print(f"Created buffer with {len(buffered_coords)} coordinates")
+            except Exception as e:
+                print(f"Error creating buffer: {e}")
+                raise
+
+            # Matching global dataset projection to buffered coordinates for extraction
             try:
-                print("Retrying with original coordinates...")
-                Extract(HSG250m, coordinates, crs, output + r"/extracted.tif", nodata_value=255)
-                print("HSG extraction with original coordinates completed")
-            except Exception as e2:
-                print(f"Error in HSG extraction retry: {e2}")
+                HSG250m_open = gdal.Open(HSG250m)
+                if HSG250m_open is None:
+                    raise ValueError(f"Could not open HSG dataset: {HSG250m}")
+                soil_crs = HSG250m_open.GetProjection()
+                print(f"HSG dataset CRS: {soil_crs}")
+            except Exception as e:
+                print(f"Error accessing HSG dataset: {e}")
                 raise
 
-        # Reproject extracted raster to match MNDWI
-        MNDWI = gdal.Open(output + r"/null_MNDWI.tif")
-        print(output + r"/null_MNDWI.tif")
-        setcrs = MNDWI.GetProjection()
+            # Extract study area from global dataset using buffered coordinates
+            try:
+                print(f"Extracting from HSG dataset using buffered coordinates...")
+                Extract(HSG250m, buffered_coords, buffered_crs, output + r"/extracted.tif", nodata_value=255)
+                print("HSG extraction completed successfully")
+            except Exception as e:
+                print(f"Error in HSG extraction: {e}")
+                # Try with original coordinates if buffered extraction fails
+                try:
+                    print("Retrying with original coordinates...")
+                    Extract(HSG250m, coordinates, crs, output + r"/extracted.tif", nodata_value=255)
+                    print("HSG extraction with original coordinates completed")
+                except Exception as e2:
+                    print(f"Error in HSG extraction retry: {e2}")
+                    raise
+
+            # Reproject extracted raster to match MNDWI
+            MNDWI = gdal.Open(output + r"/null_MNDWI.tif")
+            print(output + r"/null_MNDWI.tif")
+            setcrs = MNDWI.GetProjection()
         
-        print("MNDWI CRS", setcrs)
-        inputfile = output + r"/extracted.tif"
-        output_raster = output + r"/HSG_match.tif"
-
-        # Extract the resolution information from the MNDWI raster
-        MNDWI_geotransform = MNDWI.GetGeoTransform()
-        MNDWI_res = (MNDWI_geotransform[1], MNDWI_geotransform[5])
-        warp = gdal.Warp(output_raster, inputfile, dstSRS=setcrs, xRes=MNDWI_res[0],
-                         yRes=MNDWI_res[1], outputType=gdal.GDT_Int16)
-
-        del inputfile, output_raster, MNDWI, warp
-
-        # Fill NoData holes in the extracted data
-        reference = gdal.Open(output + r"/HSG_match.tif")
-        data = matplotlib.pyplot.imread(output + r"/HSG_match.tif")
-        filled = Fill(data)
-        CreateInt(filled, reference, "filled", output)
-        matplotlib.pyplot.close()
-        reference = None
-        del data, filled, reference
-
-        # Reclassify to HSG value
-        soilraster = gdal.Open(output + r"/filled.tif")
-        reclass = soilraster.ReadAsArray()
-
-        reclass[np.where((1 <= reclass) & (reclass <= 3))] = 4
-        reclass[np.where((3 <= reclass) & (reclass <= 8))] = 3
-        reclass[reclass == 10] = 3
-        reclass[reclass == 11] = 2
-        reclass[reclass == 9] = 2
-        reclass[reclass == 12] = 1
-
-        CreateInt(reclass, soilraster, "HSG_reclass", output)
-        del soilraster
-
-        extract_raster(output + r"/HSG_reclass.tif", output + r"/null_MNDWI.tif", output + r"/HSG_final.tif")
-
-        ### Initial CN classification for vegetation and soil ###
-
-        # Reclassify NDVI
-        NDVI = gdal.Open(output + r"/NDVI.tif")
-        newNDVI = NDVI.ReadAsArray()
-        newNDVI[newNDVI >= 0.62] = 10
-        newNDVI[np.where((0.55 <= newNDVI) & (newNDVI < 0.62))] = 20
-        newNDVI[(0.31 < newNDVI) & (newNDVI < 0.55)] = 30
-        newNDVI[newNDVI <= 0.31] = 40
-
-        # Reclassify Vegetation Fraction
-        new_veg = vegetation.copy()
-        new_veg[new_veg >= 0.75] = 3
-        new_veg[(0.5 < new_veg) & (new_veg < 0.75)] = 2
-        new_veg[new_veg <= 0.5] = 1
-
-        # Combine
-        array1 = new_veg + newNDVI
-        array1[array1 == 42] = 41
-        array1[array1 == 43] = 41
-        array1[np.isnan(array1)] = 0
-        array1[np.isinf(array1)] = 0
-
-        CreateInt(array1, NDVI, "veghealth", output)
+            print("MNDWI CRS", setcrs)
+            inputfile = output + r"/extracted.tif"
+            output_raster = output + r"/HSG_match.tif"
+
+            # Extract the resolution information from the MNDWI raster
+            MNDWI_geotransform = MNDWI.GetGeoTransform()
+            MNDWI_res = (MNDWI_geotransform[1], MNDWI_geotransform[5])
+            warp = gdal.Warp(output_raster, inputfile, dstSRS=setcrs, xRes=MNDWI_res[0],
+                             yRes=MNDWI_res[1], outputType=gdal.GDT_Int16)
+
+            del inputfile, output_raster, MNDWI, warp
+
+            # Fill NoData holes in the extracted data
+            reference = gdal.Open(output + r"/HSG_match.tif")
+            data = reference.GetRasterBand(1).ReadAsArray()
+            filled = Fill(data, nodata_value=255)
+            CreateInt(filled, reference, "filled", output)
+            reference = None
+            del data, filled, reference
+
+            # Reclassify to HSG value
+            soilraster = gdal.Open(output + r"/filled.tif")
+            reclass = soilraster.ReadAsArray()
+
+            reclass[np.where((1 <= reclass) & (reclass <= 3))] = 4
+            reclass[np.where((3 <= reclass) & (reclass <= 8))] = 3
+            reclass[reclass == 10] = 3
+            reclass[reclass == 11] = 2
+            reclass[reclass == 9] = 2
+            reclass[reclass == 12] = 1
+
+            CreateInt(reclass, soilraster, "HSG_reclass", output)
+            del soilraster
+
+            extract_raster(output + r"/HSG_reclass.tif", output + r"/null_MNDWI.tif", output + r"/HSG_final.tif")
+
+            checkpoint(memory_profiler, "soil_groups", date=date_str)
+
+            ### Initial CN classification for vegetation and soil ###
+
+            # Reclassify NDVI
+            NDVI = gdal.Open(output + r"/NDVI.tif")
+            newNDVI = NDVI.ReadAsArray()
+            newNDVI[newNDVI >= 0.62] = 10
+            newNDVI[np.where((0.55 <= newNDVI) & (newNDVI < 0.62))] = 20
+            newNDVI[(0.31 < newNDVI) & (newNDVI < 0.55)] = 30
+            newNDVI[newNDVI <= 0.31] = 40
+
+            # Reclassify Vegetation Fraction
+            new_veg = vegetation.copy()
+            new_veg[new_veg >= 0.75] = 3
+            new_veg[(0.5 < new_veg) & (new_veg < 0.75)] = 2
+            new_veg[new_veg <= 0.5] = 1
+
+            # Combine
+            array1 = new_veg + newNDVI
+            array1[array1 == 42] = 41
+            array1[array1 == 43] = 41
+            array1[np.isnan(array1)] = 0
+            array1[np.isinf(array1)] = 0
+
+            CreateInt(array1, NDVI, "veghealth", output)
         
-        # Extract using coordinates instead of shapefile
-        try:
-            Extract(output + r"/veghealth.tif", coordinates, crs, output + r"/Vegetation_Health.tif", nodata_value=255)
-            print("Vegetation health extraction completed")
-        except Exception as e:
-            print(f"Error in vegetation health extraction: {e}")
-            raise
-
-        # Get files
-        file2 = gdal.Open(output + r"/HSG_final.tif")
-        array2 = file2.ReadAsArray()
-        CN_table = r"./data/CN_lookup.csv"
-
-        # Vegetation CN Reclassification
-        veg_reclass = classification(CN_table, array1, array2)
-
-        # Soil CN Reclassification
-        array3 = array1 * 0
-        soil_reclass = classification(CN_table, array3, array2)
-
-        file2 = None
-
-        # CCN calculation - adjust based on endmember parameter
-        imp_CN = 98
-        if endmember == 2:
-            # For 2 endmembers: only use soil and vegetation (impervious is zero)
-            CCNarr = (soil_reclass * soil) + (veg_reclass * vegetation)
-            print("CCN calculation using 2 endmembers (soil and vegetation only)")
-        else:
-            # For 3 endmembers: use soil, vegetation, and impervious
-            CCNarr = (soil_reclass * soil) + (veg_reclass * vegetation) + (imp_CN * impervious)
-            print("CCN calculation using 3 endmembers (soil, vegetation, and impervious)")
-
-        ### Slope Correction ###
+            # Extract using coordinates instead of shapefile
+            try:
+                Extract(output + r"/veghealth.tif", coordinates, crs, output + r"/Vegetation_Health.tif", nodata_value=255)
+                print("Vegetation health extraction completed")
+            except Exception as e:
+                print(f"Error in vegetation health extraction: {e}")
+                raise
 
-        # Create slope map isolating pixels >5%
-        DEMfile = gdal.Open(output + r"/DEM.tif")
-        DEM = DEMfile.ReadAsArray()
-        cellsize = 10
+            # Get files
+            file2 = gdal.Open(output + r"/HSG_final.tif")
+            array2 = file2.ReadAsArray()
+            CN_table = r"./data/CN_lookup.csv"
 
-        px, py = np.gradient(DEM, cellsize)
-        slope_init = np.sqrt(px ** 2 + py ** 2)
-        slope = np.degrees(np.arctan(slope_init))
+            # Vegetation CN Reclassification
+            veg_reclass = classification(CN_table, array1, array2)
 
-        slope[slope < 5] = 0
-        slope[slope == 90] = 0
+            # Soil CN Reclassification
+            array3 = array1 * 0
+            soil_reclass = classification(CN_table, array3, array2)
 
-        # Sharpley-Williams Method for slope correction
+            file2 = None
 
-        AMC_III = AMCIII(CCNarr)
-        CN_slope_SW = (1 / 3) * (AMC_III - CCNarr) * (1 - ((2 * 2.718281) ** (-13.86 * slope))) + CCNarr
+            # CCN calculation - adjust based on endmember parameter
+            imp_CN = 98
+            if endmember == 2:
+                # For 2 endmembers: only use soil and vegetation (impervious is zero)
+                CCNarr = (soil_reclass * soil) + (veg_reclass * vegetation)
+                print("CCN calculation using 2 endmembers (soil and vegetation only)")
+            else:
+                # For 3 endmembers: use soil, vegetation, and impervious
+                CCNarr = (soil_reclass * soil) + (veg_reclass * vegetation) + (imp_CN * impervious)
+                print("CCN calculation using 3 endmembers (soil, vegetation, and impervious)")
 
-        ### Conversion to different AMC if required ###
+            ### Slope Correction ###
 
-        while amc > 0:
-            choice = amc
-            if choice == 1:
-                CCN_arr = AMCI(CN_slope_SW)
-            elif choice == 3:
-                CCN_arr = AMCIII(CN_slope_SW)
-            else:
-                CCN_arr = CN_slope_SW
-            break
-
-        # One last extraction to clean up edges of CCN map
-        CCN_arr_final = np.where(mask_array == 0, CCN_arr, 0)
-
-        CCN_arr_final[np.isnan(CCN_arr_final)] = 100
-        CCN_arr_final[np.isinf(CCN_arr_final)] = 100
-        CCN_arr_final[CCN_arr_final > 100] = 100
-        CCN_arr_final[CCN_arr_final == 0] = 100
-        curve_number.append(np.nanmean(CCN_arr_final))
-        CreateInt(CCN_arr_final, DEMfile, "CCN_masked", output)
-        
-        # Extract using coordinates instead of shapefile
-        try:
-            Extract(output + r"/CCN_masked.tif", coordinates, crs, output + f"/CCN_final.tif", nodata_value=255)
-            print("CCN final extraction completed")
-        except Exception as e:
-            print(f"Error in CCN final extraction: {e}")
-            raise
+            # Sharpley-Williams Method for slope correction
+            DEMfile = open_raster(dem_src)
+            DEM = DEMfile.ReadAsArray().astype(dtype)
+            CN_slope_SW = slope_correction(CCNarr, DEM, cellsize=scale)
 
-        del mask, DEMfile
+            ### Conversion to different AMC if required ###
 
-        ### Runoff Calculation ###
+            # The slope-corrected AMC II layer is kept so AMC I/III products can be derived later without
+            # a recompute (see derived_products.py)
+            CN_AMCII = clean_curve_number(np.where(mask_array == 0, CN_slope_SW, 0))
+            CreateFloat(CN_AMCII, DEMfile, "CN_AMCII_masked", output)
+            try:
+                Extract(output + r"/CN_AMCII_masked.tif", coordinates, crs, output + r"/CN_AMCII.tif", nodata_value=-9999)
+            except Exception as e:
+                print(f"Error in AMC II CN extraction: {e}")
+                raise
+            write_cn_stats(output, CN_AMCII, endmember=endmember, scale=scale)
 
-        """US Department of Agriculture (USDA) Natural Resources Conservation Service (NRCS) 
-        CN method for determining the Runoff Coefficient
-                Storage = 254 * (1-CN/100)
-                Initial Abstraction = 0.2*S
-                Runoff  = (P-Ia)^2/(P-Ia+S)
-        """
+            CCN_arr = convert_amc(CN_slope_SW, amc)
 
-        # Storage
-        CCN = gdal.Open(output + r"/CCN_final.tif")
-        CCN_array = CCN.ReadAsArray()
+            # One last extraction to clean up edges of CCN map
+            CCN_arr_final = clean_curve_number(np.where(mask_array == 0, CCN_arr, 0))
+            curve_number.append(np.nanmean(CCN_arr_final))
+            CreateInt(CCN_arr_final, DEMfile, "CCN_masked", output)
+        
+            # Extract using coordinates instead of shapefile
+            try:
+                Extract(output + r"/CCN_masked.tif", coordinates, crs, output + f"/CCN_final.tif", nodata_value=255)
+                print("CCN final extraction completed")
+            except Exception as e:
+                print(f"Error in CCN final extraction: {e}")
+                raise
 
-        storage = 254 * (1 - (CCN_array / 100.0))
+            del mask, DEMfile
+            checkpoint(memory_profiler, "curve_number", date=date_str)
 
-        # Initial Abstraction
-        Ia = 0.2 * storage
+            ### Runoff Calculation ###
 
-        # Runoff Coefficient
-        # precipitation in mm
+            """US Department of Agriculture (USDA) Natural Resources Conservation Service (NRCS) 
+            CN method for determining the Runoff Coefficient
+                    Storage = 254 * (1-CN/100)
+                    Initial Abstraction = 0.2*S
+                    Runoff  = (P-Ia)^2/(P-Ia+S)
+            """
 
-        runoff_c = (p - Ia) ** 2 / (p - Ia + storage)
-        runoff_c[runoff_c < 0] = np.nan
+            CCN = gdal.Open(output + r"/CCN_final.tif")
+            CCN_array = CCN.ReadAsArray().astype(dtype)
 
-        CreateFloat(runoff_c, CCN, "Runoff", output)
+            # Runoff Coefficient, precipitation in mm (shared with the /hydrosens/runoff what-if endpoint)
+            runoff_c = runoff_from_cn(CCN_array, p)
 
-        # Clean up output folder - keep only essential files
-        cleanup_output_folder(output)
+            CreateFloat(runoff_c, CCN, "Runoff", output)
+            checkpoint(memory_profiler, "runoff", date=date_str)
 
-        # Post-processing: Clip all important TIF files to polygon shape
-        # This ensures that instead of having bounding box rasters, we get precise polygon-clipped rasters
-        # that match the exact area of interest defined by the coordinates
-        clipping_results = clip_tif_files_to_polygon(output, coordinates, crs)
-        
-        # Store clipping results for potential debugging or reporting
-        if clipping_results['failure_count'] > 0:
-            print(f"Warning: {clipping_results['failure_count']} files failed to clip properly")
+            # Release the dataset handles before the publish stage rewrites the files behind them,
+            # and the band arrays so only the prefetched dates stay in memory
+            del bands, image, NDVI, CCN, band_array, blue, green, red, nir, swir1
+            publisher.submit(publish_date, output, date_str)
+            # Taken on the compute thread: the publish stage runs concurrently with the next date
+            checkpoint(memory_profiler, "publish_submitted", date=date_str)
+    except BaseException:
+        # Failed or terminated job: queued dates are not published
+        publisher.abort()
+        raise
+    publisher.close()
 
     # Create results dictionary for only the dates that were successfully processed
     formatted_data = {}
@@ -575,6 +674,7 @@ def cleanup_output_folder(output_folder):
     - NDVI.tif
     - Vegetation_Health.tif
     - soil.tif
+    - CN_AMCII.tif and cn_stats.json (AMC II curve numbers for derived AMC I/III products)
     """
     import os
     import glob
@@ -588,7 +688,10 @@ def cleanup_output_folder(output_folder):
         'NDVI.tif',
         'Vegetation_Health.tif',
         'soil.tif',
-        'TCI.tif'
+        'TCI.tif',
+        'CN_AMCII.tif',
+        'cn_stats.json',
+        'stages.json'
     }
     
     # Get all files in the output folder
@@ -609,7 +712,7 @@ def cleanup_output_folder(output_folder):
 
 
 # Updated convenience function for the coordinate-based approach
-def run_hydrosens_with_coordinates(region_name, coordinates, dates_to_process, output_dir=None, amc=2, precipitation=10.0, crs='EPSG:4326', endmember=3):
+def run_hydrosens_with_coordinates(region_name, coordinates, dates_to_process, output_dir=None, amc=2, precipitation=10.0, crs='EPSG:4326', endmember=3, refresh_dates=None, unmixing_mode='mesma', scale=None, precision=None, memory_profiler=None, sensor='sentinel2'):
     """
     Convenience function to run Hydrosens analysis with coordinate array
     
@@ -627,6 +730,12 @@ def run_hydrosens_with_coordinates(region_name, coordinates, dates_to_process, o
         endmember: Number of endmembers for MESMA (2 or 3, default: 3)
                   3 = vegetation, impervious, soil
                   2 = vegetation, soil (no impervious)
+        refresh_dates: Dates whose cached scene availability must be re-checked against the catalog
+        unmixing_mode: 'mesma' (default) or 'fcls' for fast fully constrained unmixing
+        scale: processing resolution in meters (default: the sensor's native resolution, coarser for previews)
+        precision: 'float64' or 'float32' raster math (default: HYDROSENS_PRECISION environment variable)
+        memory_profiler: Optional MemoryProfiler recording memory at each pipeline stage
+        sensor: 'sentinel2' (default) or 'landsat'; Landsat results are stored in <region>/landsat
     
     Returns:
         Dictionary with analysis results
@@ -651,10 +760,17 @@ def run_hydrosens_with_coordinates(region_name, coordinates, dates_to_process, o
     # Validate endmember parameter - default to 3 if not 2
     if endmember != 2:
         endmember = 3
+
+    # Validate unmixing mode - default to full MESMA
+    if unmixing_mode not in ('mesma', 'fcls'):
+        unmixing_mode = 'mesma'
     
     print(f"Running Hydrosens analysis for region '{region_name}' with polygon of {len(coordinates)} vertices")
     print(f"Processing {len(process_dates)} dates")
     print(f"AMC: {amc}, Precipitation: {precipitation}mm")
+    sensor = get_sensor(sensor)
+    scale = scale or sensor.native_scale
+    print(f"Sensor: {sensor.label}, Unmixing mode: {unmixing_mode}, Scale: {scale}m")
     
     return run_hydrosens(
         main_folder=".",  # Current directory as main folder
@@ -665,5 +781,55 @@ def run_hydrosens_with_coordinates(region_name, coordinates, dates_to_process, o
         p=precipitation,
         coordinates=coordinates,
         crs=crs,
-        endmember=endmember
-    )
\ No newline at end of file
+        endmember=endmember,
+        refresh_dates=refresh_dates,
+        unmixing_mode=unmixing_mode,
+        scale=scale,
+        precision=precision,
+        memory_profiler=memory_profiler,
+        sensor=sensor
+    )
+
+
+def run_statistics_with_coordinates(region_name, coordinates, dates_to_process, output_dir, crs='EPSG:4326', scale=None):
+    """
+    Statistics-only mode: per-date scalars computed inside Earth Engine, without downloading rasters
+    or running the unmixing.
+
+    Parameters:
+        region_name: Region folder (region ID) holding the scene index and statistics caches
+        coordinates: List of [lon, lat] pairs defining the polygon boundary
+        dates_to_process: List of datetime objects or 'YYYY-MM-DD' strings
+        output_dir: Output directory path
+        crs: Coordinate reference system (default: 'EPSG:4326')
+        scale: Reduction scale in meters (default: STATS_SCALE)
+
+    Returns:
+        Dictionary 'YYYY-MM-DD' -> {ndvi, water-fraction, scale, temperature, precipitation} for dates with imagery.
+        ndvi and water-fraction are polygon means reduced in Earth Engine at scale meters, see compute_scene_statistics
+    """
+    if not coordinates or len(coordinates) < 3:
+        raise ValueError("Need at least 3 coordinate pairs to define a polygon")
+
+    aoi = coordinates_to_ee_geometry(coordinates)
+    region_dir = os.path.join(output_dir, region_name)
+    scale = scale or STATS_SCALE
+
+    scene_ids = get_scene_index(aoi, region_dir, dates_to_process)
+    statistics = get_scene_statistics(aoi, region_dir, scene_ids, crs, scale)
+    weather = get_daily_weather(sorted(scene_ids), aoi)
+
+    formatted_data = {}
+    for date_str in sorted(statistics):
+        values = statistics[date_str]
+        weather_day = weather.get(date_str) or {}
+        formatted_data[date_str] = {
+            "ndvi": values.get("ndvi"),
+            "water-fraction": values.get("water-fraction"),
+            "scale": values.get("scale"),
+            "precipitation": weather_day.get("precipitation"),
+            "temperature": weather_day.get("temperature")
+        }
+
+    print(f"Statistics computed for {len(formatted_data)} of {len(dates_to_process)} requested dates at {scale}m")
+    return formatted_data
@@ -0,0 +1,222 @@
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+# Opt-in memory instrumentation for the processing pipeline. Each checkpoint records the
+# current and peak RSS of the worker plus the top Python/NumPy allocators (tracemalloc),
+# so OOM kills can be attributed to a pipeline stage. GDAL's own buffers are not seen by
+# tracemalloc but are included in the RSS figures.
+#
+# tracemalloc, the RSS high-water mark and their peak resets are process-wide. Concurrent
+# profiled jobs share one tracemalloc session (reference counted below) and every checkpoint
+# resets the peaks for all of them, so their figures are not isolated from each other;
+# checkpoints record how many profiles were active. Profile one job at a time for exact
+# per-stage peaks.
+MEMORY_PROFILE = os.getenv("HYDROSENS_MEMORY_PROFILE", "0").lower() in ("1", "true", "yes")
+MEMORY_PROFILE_TOP_N = int(os.getenv("MEMORY_PROFILE_TOP_N", "10"))
+MEMORY_PROFILE_FRAMES = int(os.getenv("MEMORY_PROFILE_FRAMES", "1"))
+# The report is rewritten at most this often during a run (and always at stop()), so long
+# runs do not serialize the whole, growing report at every checkpoint
+MEMORY_PROFILE_WRITE_INTERVAL_S = float(os.getenv("MEMORY_PROFILE_WRITE_INTERVAL_S", "30"))
+# MESMA records a checkpoint every N chunks (and for the last one) instead of every chunk
+MEMORY_PROFILE_CHUNK_SAMPLE = max(1, int(os.getenv("MEMORY_PROFILE_CHUNK_SAMPLE", "10")))
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    """Start tracemalloc for the first active profile; returns the number of active profiles."""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_PROFILE_FRAMES)
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+        return _tracemalloc_users
+
+
+def _release_tracemalloc():
+    """Stop tracemalloc when the last active profile ends, unless it was started elsewhere."""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users = max(0, _tracemalloc_users - 1)
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def active_profiles():
+    with _tracemalloc_lock:
+        return _tracemalloc_users
+
+
+def _read_proc_status(field):
+    """Read a kB value such as VmRSS or VmHWM from /proc/self/status, None if unavailable."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_mb():
+    rss_kb = _read_proc_status("VmRSS")
+    return round(rss_kb / 1024, 1) if rss_kb is not None else None
+
+
+def peak_rss_mb():
+    hwm_kb = _read_proc_status("VmHWM")
+    if hwm_kb is None:
+        # ru_maxrss is reported in kB on Linux
+        hwm_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(hwm_kb / 1024, 1)
+
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark so the next peak is per stage (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class MemoryProfiler:
+    """
+    Records memory usage at pipeline stage boundaries.
+
+    Parameters:
+        run_id: Identifier of the run, used as the report name
+        report_path: Optional JSON file written at stop() and at most every write_interval
+                     seconds in between, so most of the report survives a worker that is
+                     OOM-killed mid-run
+        top_n: Number of top allocators kept per checkpoint
+        write_interval: Minimum seconds between report writes during the run
+                        (MEMORY_PROFILE_WRITE_INTERVAL_S)
+    """
+
+    def __init__(self, run_id=None, report_path=None, top_n=MEMORY_PROFILE_TOP_N,
+                 write_interval=MEMORY_PROFILE_WRITE_INTERVAL_S):
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.report_path = report_path
+        self.top_n = top_n
+        self.write_interval = write_interval
+        self.checkpoints = []
+        self.started_at = time.time()
+        self._last_write = None
+        self._stopped = False
+        # Checkpoints may come from the job thread and from pipeline stage threads
+        self._lock = threading.RLock()
+        _acquire_tracemalloc()
+        self._per_stage_peak = _reset_peak_rss()
+        self.checkpoint("start")
+
+    def checkpoint(self, stage, **context):
+        """
+        Record memory usage at the end of a stage.
+
+        Parameters:
+            stage: Name of the stage that just finished (e.g. 'download', 'mesma')
+            context: Extra values stored with the checkpoint (date, chunk, array shapes...)
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            self._checkpoint(stage, context)
+
+    def _checkpoint(self, stage, context):
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        top_allocators = [{
+            "location": str(stat.traceback),
+            "size_mb": round(stat.size / 1024 / 1024, 2),
+            "count": stat.count
+        } for stat in snapshot.statistics("lineno")[:self.top_n]]
+
+        rss = current_rss_mb()
+        previous_rss = self.checkpoints[-1]["rss_mb"] if self.checkpoints else None
+        entry = {
+            "stage": stage,
+            "elapsed_s": round(time.time() - self.started_at, 2),
+            "rss_mb": rss,
+            "rss_delta_mb": round(rss - previous_rss, 1) if rss is not None and previous_rss is not None else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "traced_current_mb": round(traced_current / 1024 / 1024, 1),
+            "traced_peak_mb": round(traced_peak / 1024 / 1024, 1),
+            "concurrent_profiles": active_profiles(),
+            "top_allocators": top_allocators
+        }
+        if context:
+            entry["context"] = context
+        self.checkpoints.append(entry)
+
+        print(f"[memory] {stage}: rss={entry['rss_mb']}MB peak={entry['peak_rss_mb']}MB "
+              f"traced={entry['traced_current_mb']}MB (stage peak {entry['traced_peak_mb']}MB)")
+
+        # Peaks are reset after every checkpoint so each entry reports the peak of its own stage
+        # (process-wide: this also resets the peaks seen by concurrent profiles)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        if self._per_stage_peak:
+            _reset_peak_rss()
+
+        if self.report_path and (self._last_write is None
+                                 or time.time() - self._last_write >= self.write_interval):
+            self.write_report(self.report_path)
+
+    def summary(self):
+        """Compact view of the run for the job record (without the allocator lists)."""
+        stages = [{k: v for k, v in c.items() if k != "top_allocators"} for c in self.checkpoints]
+        peak_stage = max(self.checkpoints, key=lambda c: c["peak_rss_mb"] or 0) if self.checkpoints else None
+        return {
+            "run_id": self.run_id,
+            "report_path": self.report_path,
+            "peak_rss_mb": peak_stage["peak_rss_mb"] if peak_stage else None,
+            "peak_stage": peak_stage["stage"] if peak_stage else None,
+            "peak_is_per_stage": self._per_stage_peak,
+            "stages": stages
+        }
+
+    def report(self):
+        report = self.summary()
+        report["checkpoints"] = self.checkpoints
+        del report["stages"]
+        return report
+
+    def write_report(self, path):
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+            os.replace(tmp_path, path)
+            self._last_write = time.time()
+            return path
+
+    def stop(self):
+        """Write the final report and release tracemalloc (stopped with the last active profile)."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            if self.report_path:
+                self.write_report(self.report_path)
+        _release_tracemalloc()
+
+
+def checkpoint(profiler, stage, **context):
+    """Record a checkpoint when profiling is enabled (profiler may be None)."""
+    if profiler is not None:
+        profiler.checkpoint(stage, **context)
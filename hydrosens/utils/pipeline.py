@@ -0,0 +1,75 @@
+import os
+import queue
+import threading
+
+# Stages of the date loop in process_specific_dates:
+#   fetch:   Earth Engine downloads, run ahead of the compute stage (DownloadPool.prefetch)
+#   compute: indices, unmixing, soil groups, curve numbers and runoff, on the job thread
+#   publish: output folder cleanup, polygon clipping and the stage manifest (PublishStage)
+# Bounded queues sit between the stages, so downloads, CPU work and the file I/O of publishing
+# overlap across dates while at most EE_PREFETCH_DATES downloaded and PIPELINE_PUBLISH_DATES
+# computed dates are waiting at any time.
+PIPELINE_PUBLISH_DATES = int(os.getenv("PIPELINE_PUBLISH_DATES", "1"))
+
+_STOP = object()
+
+
+class PublishStage:
+    """
+    Background worker running the publish step of computed dates in submission order.
+
+    submit() blocks while max_pending dates are already waiting (backpressure on the compute
+    stage). The first error of a publish task is re-raised by the next submit() or by close(),
+    so a failed date still fails the job.
+
+    Parameters:
+        max_pending: Number of dates queued ahead of the worker (PIPELINE_PUBLISH_DATES)
+        name: Thread name used in logs
+    """
+
+    def __init__(self, max_pending=None, name="hydrosens-publish"):
+        self.max_pending = max(1, max_pending or PIPELINE_PUBLISH_DATES)
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._error = None
+        self._aborted = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                return
+            # After an error or an abort the remaining dates are dropped, like the serial loop would
+            if self._error is not None or self._aborted.is_set():
+                continue
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"Publish stage failed: {e}")
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs), blocking while max_pending tasks are waiting."""
+        self._raise_error()
+        self._queue.put((func, args, kwargs))
+
+    def close(self):
+        """Wait until every queued task is published; re-raises the first publish error."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def abort(self):
+        """Drop queued tasks and stop without waiting (the running task, if any, finishes on its own)."""
+        self._aborted.set()
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            # The worker drains the queue without running anything and exits at the next put
+            threading.Thread(target=self._queue.put, args=(_STOP,), daemon=True).start()
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import math
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+import numpy as np
+from osgeo import gdal, osr
+
+from hydrosens_shared.ee_client import ee_call
+from .download_cache import cache_enabled, export_cache_key, read_cached_export, store_export, export_key_lock
+
+# Direct-to-NumPy pixel fetch. Instead of downloading a GeoTIFF with ee_client.export_image and
+# re-opening it, pixels are requested with ee.data.computePixels in the NUMPY_NDARRAY encoding on a
+# grid computed locally from the AOI, and handed to the pipeline as in-memory GDAL datasets.
+# Nothing is written to disk unless the export cache is enabled.
+#
+# EE_FETCH_MODE: 'pixels' (default) or 'file' for the original GeoTIFF downloads.
+EE_FETCH_MODE = os.getenv("EE_FETCH_MODE", "pixels").lower()
+# computePixels rejects responses above 48 MB; larger grids are split into grid-aligned tiles
+# that are fetched in parallel and mosaicked locally
+EE_PIXELS_MAX_BYTES = int(float(os.getenv("EE_PIXELS_MAX_MB", "45")) * 1024 * 1024)
+EE_PIXELS_MAX_DIMENSION = 32768
+# getDownloadURL (file exports) allows at most 32 MB per request
+EE_DOWNLOAD_MAX_BYTES = 32 * 1024 * 1024
+# Tile edge in pixels, 0 derives the largest square tile under EE_PIXELS_MAX_BYTES
+EE_TILE_SIZE = int(os.getenv("EE_TILE_SIZE", "0"))
+EE_TILE_CONCURRENCY = int(os.getenv("EE_TILE_CONCURRENCY", "4"))
+# Earth Engine interprets the scale of geographic projections in meters at the equator
+METERS_PER_DEGREE = 111319.49079327357
+
+RasterArray = namedtuple("RasterArray", ["array", "geotransform", "projection"])
+
+
+def pixel_fetch_enabled():
+    return EE_FETCH_MODE == "pixels"
+
+
+def compute_grid(coordinates, crs_string, scale):
+    """
+    Pixel grid covering the AOI bounds in crs_string at the given scale.
+
+    Parameters:
+        coordinates: List of [lon, lat] pairs defining the polygon boundary
+        crs_string: Target CRS (e.g. 'EPSG:32633')
+        scale: Pixel size in meters
+    Returns:
+        dict: crs, geotransform (GDAL order), width, height
+    """
+    source = osr.SpatialReference()
+    source.ImportFromEPSG(4326)
+    target = osr.SpatialReference()
+    target.SetFromUserInput(crs_string)
+    for srs in (source, target):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source, target)
+
+    points = [transform.TransformPoint(float(lon), float(lat))[:2] for lon, lat in coordinates]
+    xs, ys = zip(*points)
+    min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+
+    pixel_size = float(scale)
+    if target.IsGeographic():
+        pixel_size = pixel_size / METERS_PER_DEGREE
+
+    width = max(1, int(math.ceil((max_x - min_x) / pixel_size)))
+    height = max(1, int(math.ceil((max_y - min_y) / pixel_size)))
+    return {
+        "crs": crs_string,
+        "geotransform": [min_x, pixel_size, 0.0, max_y, 0.0, -pixel_size],
+        "width": width,
+        "height": height,
+        "projection": target.ExportToWkt()
+    }
+
+
+def grid_hash(grid):
+    payload = json.dumps({k: grid[k] for k in ("crs", "geotransform", "width", "height")}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fits_single_request(grid, n_bands, bytes_per_value=4, max_bytes=EE_PIXELS_MAX_BYTES):
+    return (grid["width"] <= EE_PIXELS_MAX_DIMENSION and grid["height"] <= EE_PIXELS_MAX_DIMENSION and
+            grid["width"] * grid["height"] * n_bands * bytes_per_value <= max_bytes)
+
+
+def sub_grid(grid, row, col, height, width):
+    """Window of grid starting at pixel (row, col); it shares the pixel edges of grid exactly."""
+    gt = grid["geotransform"]
+    return dict(grid,
+                geotransform=[gt[0] + col * gt[1] + row * gt[2], gt[1], gt[2],
+                              gt[3] + col * gt[4] + row * gt[5], gt[4], gt[5]],
+                width=width, height=height)
+
+
+def plan_tiles(grid, n_bands, bytes_per_value=4):
+    """
+    Split grid into tiles that each fit in one computePixels request.
+
+    Parameters:
+        grid: Pixel grid, see compute_grid
+        n_bands: Number of bands requested per tile
+        bytes_per_value: Size of one pixel value in the response (float32)
+    Returns:
+        list: (row, col, tile grid) in row-major order
+    """
+    tile_size = EE_TILE_SIZE
+    if tile_size <= 0:
+        tile_size = int(math.sqrt(EE_PIXELS_MAX_BYTES / (n_bands * bytes_per_value)))
+    tile_size = max(1, min(tile_size, EE_PIXELS_MAX_DIMENSION))
+
+    tiles = []
+    for row in range(0, grid["height"], tile_size):
+        for col in range(0, grid["width"], tile_size):
+            height = min(tile_size, grid["height"] - row)
+            width = min(tile_size, grid["width"] - col)
+            tiles.append((row, col, sub_grid(grid, row, col, height, width)))
+    return tiles
+
+
+def fetch_tiled(image, band_names, grid):
+    """
+    Fetch a grid too large for one request as tiles in parallel and mosaic them into one array.
+
+    Returns:
+        float32 array of shape (bands, rows, cols) covering the whole grid
+    """
+    tiles = plan_tiles(grid, len(band_names))
+    print(f"Fetching {grid['width']}x{grid['height']} px as {len(tiles)} tiles")
+    mosaic = np.empty((len(band_names), grid["height"], grid["width"]), dtype=np.float32)
+
+    def fetch_tile(tile):
+        row, col, tile_grid = tile
+        mosaic[:, row:row + tile_grid["height"], col:col + tile_grid["width"]] = \
+            fetch_pixels(image, band_names, tile_grid)
+
+    # Requests are additionally bounded by the ee_client concurrency and QPS limits
+    with ThreadPoolExecutor(max_workers=max(1, EE_TILE_CONCURRENCY), thread_name_prefix="ee-tile") as tile_pool:
+        list(tile_pool.map(fetch_tile, tiles))
+    return mosaic
+
+
+def fetch_grid(image, band_names, grid):
+    """Fetch image on grid in one request, or tiled when the grid exceeds the request limits."""
+    if fits_single_request(grid, len(band_names)):
+        return fetch_pixels(image, band_names, grid)
+    return fetch_tiled(image, band_names, grid)
+
+
+def fetch_pixels(image, band_names, grid):
+    """
+    Fetch the pixels of image on grid as a float32 array of shape (bands, rows, cols).
+    """
+    gt = grid["geotransform"]
+    request = {
+        "expression": image.select(band_names).toFloat(),
+        "fileFormat": "NUMPY_NDARRAY",
+        "bandIds": list(band_names),
+        "grid": {
+            "dimensions": {"width": grid["width"], "height": grid["height"]},
+            "affineTransform": {
+                "scaleX": gt[1], "shearX": gt[2], "translateX": gt[0],
+                "shearY": gt[4], "scaleY": gt[5], "translateY": gt[3]
+            },
+            "crsCode": grid["crs"]
+        }
+    }
+    pixels = ee_call(ee.data.computePixels, request, description="computePixels")
+    # The NUMPY_NDARRAY encoding is a structured array with one field per band
+    return np.stack([pixels[band].astype(np.float32) for band in band_names])
+
+
+def _read_raster(path):
+    dataset = gdal.Open(path)
+    raster = RasterArray(dataset.ReadAsArray(), dataset.GetGeoTransform(), dataset.GetProjection())
+    dataset = None
+    return raster
+
+
+def _write_raster(raster, path):
+    array = raster.array if raster.array.ndim == 3 else raster.array[np.newaxis]
+    output_raster = gdal.GetDriverByName("GTiff").Create(path, array.shape[2], array.shape[1], array.shape[0],
+                                                         gdal.GDT_Float32)
+    output_raster.SetGeoTransform(tuple(raster.geotransform))
+    output_raster.SetProjection(raster.projection)
+    for band_index in range(array.shape[0]):
+        output_raster.GetRasterBand(band_index + 1).WriteArray(array[band_index])
+    output_raster.FlushCache()
+    output_raster = None
+
+
+def fetch_raster(image, band_names, grid, image_id=None):
+    """
+    Fetch image pixels on grid into memory, through the export cache when it is enabled.
+    Grids above the computePixels limits are fetched as tiles and mosaicked.
+
+    Parameters:
+        image: ee.Image to fetch
+        band_names: Bands to fetch
+        grid: Pixel grid, see compute_grid
+        image_id: Asset ID identifying the pixels for the cache (None disables caching)
+    Returns:
+        RasterArray: array (bands, rows, cols), GDAL geotransform and projection WKT
+    """
+    key = None
+    if image_id is not None and cache_enabled():
+        key = export_cache_key(image_id, band_names, grid_hash(grid), grid["geotransform"][1], grid["crs"])
+
+    if key is None:
+        array = fetch_grid(image, band_names, grid)
+        return RasterArray(array, tuple(grid["geotransform"]), grid["projection"])
+
+    with export_key_lock(key):
+        raster = read_cached_export(key, _read_raster)
+        if raster is not None:
+            print(f"Pixel cache hit: {', '.join(band_names)} ({key[:12]})")
+            return raster
+
+        raster = RasterArray(fetch_grid(image, band_names, grid), tuple(grid["geotransform"]), grid["projection"])
+        fd, tmp_path = tempfile.mkstemp(suffix=".tif")
+        os.close(fd)
+        try:
+            _write_raster(raster, tmp_path)
+            store_export(key, tmp_path)
+        finally:
+            os.remove(tmp_path)
+        return raster
+
+
+def open_raster(source):
+    """
+    Open a downloaded raster as a GDAL dataset.
+
+    Parameters:
+        source: Path of a GeoTIFF (file downloads) or a RasterArray (pixel fetch)
+    Returns:
+        gdal.Dataset; RasterArrays are wrapped in an in-memory (MEM) dataset
+    """
+    if isinstance(source, str):
+        return gdal.Open(source)
+
+    array = source.array if source.array.ndim == 3 else source.array[np.newaxis]
+    dataset = gdal.GetDriverByName("MEM").Create("", array.shape[2], array.shape[1], array.shape[0],
+                                                 gdal.GDT_Float32)
+    dataset.SetGeoTransform(tuple(source.geotransform))
+    dataset.SetProjection(source.projection)
+    for band_index in range(array.shape[0]):
+        dataset.GetRasterBand(band_index + 1).WriteArray(array[band_index])
+    return dataset
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Regions are addressed by a hash of their canonical polygon and CRS. Free-text region
+# names are kept as aliases pointing at a region ID, so identical geometries share one
+# cache folder and an edited polygon gets a fresh one even if its name is unchanged.
+#
+# Other services never compute region IDs themselves, they ask POST /hydrosens/region-id.
+REGISTRY_FILE = "regions.json"
+COORDINATE_PRECISION = 7  # ~1 cm at the equator
+
+_registry_lock = threading.Lock()
+
+
+def normalize_crs(crs):
+    crs = str(crs or 'EPSG:4326').strip().upper()
+    if crs.isdigit():
+        crs = f'EPSG:{crs}'
+    return crs
+
+
+def canonicalize_polygon(coordinates, precision=COORDINATE_PRECISION):
+    """
+    Bring a polygon ring into a canonical form.
+
+    The ring is rounded, opened (closing vertex removed), stripped of repeated vertices,
+    oriented counter-clockwise and rotated to start at its smallest vertex, so the same
+    shape always yields the same vertex list regardless of how it was drawn.
+
+    Parameters:
+        coordinates: List of [lon, lat] pairs
+        precision: Number of decimals kept for each coordinate
+    Returns:
+        list: Canonical list of [x, y] pairs
+    """
+    ring = [[round(float(x), precision) + 0.0, round(float(y), precision) + 0.0] for x, y in coordinates]
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+
+    deduped = []
+    for point in ring:
+        if not deduped or deduped[-1] != point:
+            deduped.append(point)
+    while len(deduped) > 1 and deduped[0] == deduped[-1]:
+        deduped.pop()
+    ring = deduped
+
+    # Shoelace formula: a negative signed area means the ring is clockwise
+    signed_area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))
+    if signed_area < 0:
+        ring.reverse()
+
+    start = ring.index(min(ring))
+    return ring[start:] + ring[:start]
+
+
+def compute_region_id(coordinates, crs='EPSG:4326'):
+    """
+    Compute the stable region ID of a polygon.
+
+    Returns:
+        str: 'r' followed by 16 hex characters
+    """
+    payload = json.dumps({
+        "crs": normalize_crs(crs),
+        "ring": canonicalize_polygon(coordinates)
+    }, separators=(",", ":"))
+    return "r" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _registry_path(output_master):
+    return os.path.join(output_master, REGISTRY_FILE)
+
+
+def load_registry(output_master):
+    path = _registry_path(output_master)
+    if not os.path.exists(path):
+        return {"regions": {}, "aliases": {}}
+    try:
+        with open(path, "r") as f:
+            registry = json.load(f)
+    except Exception as e:
+        print(f"Error reading region registry {path}: {e}")
+        return {"regions": {}, "aliases": {}}
+    registry.setdefault("regions", {})
+    registry.setdefault("aliases", {})
+    return registry
+
+
+def _save_registry(output_master, registry):
+    os.makedirs(output_master, exist_ok=True)
+    path = _registry_path(output_master)
+    tmp_path = path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def register_region(output_master, region_name, coordinates, crs='EPSG:4326'):
+    """
+    Register a polygon and point region_name at it.
+
+    If region_name previously pointed at another geometry (the polygon was edited), the
+    alias is moved so the old cached results are no longer served under that name.
+
+    Returns:
+        str: The region ID to key caches on
+    """
+    region_id = compute_region_id(coordinates, crs)
+    with _registry_lock:
+        registry = load_registry(output_master)
+        regions = registry["regions"]
+        aliases = registry["aliases"]
+
+        previous_id = aliases.get(region_name)
+        if previous_id is not None and previous_id != region_id:
+            print(f"Region '{region_name}' geometry changed: {previous_id} -> {region_id}")
+            old_entry = regions.get(previous_id)
+            if old_entry and region_name in old_entry.get("aliases", []):
+                old_entry["aliases"].remove(region_name)
+
+        entry = regions.setdefault(region_id, {
+            "crs": normalize_crs(crs),
+            "coordinates": canonicalize_polygon(coordinates),
+            "aliases": [],
+            "created_at": time.time()
+        })
+        if region_name not in entry["aliases"]:
+            entry["aliases"].append(region_name)
+        aliases[region_name] = region_id
+        _save_registry(output_master, registry)
+
+    return region_id
+
+
+def resolve_region_id(output_master, region_name):
+    """Return the region ID registered for region_name, or None if it is unknown."""
+    with _registry_lock:
+        return load_registry(output_master)["aliases"].get(region_name)
+
+
+def region_storage_key(output_master, region_name):
+    """
+    Folder name under output_master that holds the cache for region_name.
+    Names that were never registered fall back to the legacy name-keyed folder.
+    """
+    return resolve_region_id(output_master, region_name) or region_name
+
+
+def record_ingest_params(output_master, region_id, params):
+    """
+    Remember the processing parameters of the latest full analysis of a region, so background
+    ingestion (see ingestion.py) computes new dates the way the region is actually requested.
+    """
+    with _registry_lock:
+        registry = load_registry(output_master)
+        entry = registry["regions"].get(region_id)
+        if entry is None or entry.get("ingest_params") == params:
+            return
+        entry["ingest_params"] = params
+        _save_registry(output_master, registry)
+
+
+def delete_region_alias(output_master, region_name):
+    """
+    Forget region_name and delete the cache it pointed at once no other alias uses it.
+
+    region_name may also be a region ID, which deletes that region with all its aliases. The
+    registry is updated and the folder removed under the registry lock, so background ingestion
+    never sees a registered region without its cache or the other way round.
+
+    Returns:
+        dict: region_id (None for unregistered names), deleted (cache folder removed),
+              remaining_aliases (aliases still pointing at the kept cache)
+    """
+    with _registry_lock:
+        registry = load_registry(output_master)
+        regions = registry["regions"]
+        aliases = registry["aliases"]
+
+        if region_name in regions:
+            region_id = region_name
+            removed = list(regions[region_id].get("aliases", []))
+        else:
+            region_id = aliases.get(region_name)
+            removed = [region_name]
+
+        if region_id is None:
+            # Legacy name-keyed folder that was never registered
+            folder = os.path.join(output_master, region_name)
+            deleted = os.path.isdir(folder)
+            if deleted:
+                shutil.rmtree(folder)
+            return {"region_id": None, "deleted": deleted, "remaining_aliases": []}
+
+        entry = regions.get(region_id, {"aliases": []})
+        for alias in removed:
+            if aliases.get(alias) == region_id:
+                del aliases[alias]
+            if alias in entry["aliases"]:
+                entry["aliases"].remove(alias)
+
+        deleted = False
+        if not entry["aliases"]:
+            regions.pop(region_id, None)
+            folder = os.path.join(output_master, region_id)
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+                deleted = True
+        _save_registry(output_master, registry)
+        return {"region_id": region_id, "deleted": deleted, "remaining_aliases": list(entry["aliases"])}
@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+from osgeo import gdal
+
+# Runoff what-if analysis on cached curve number layers. Precipitation only enters the last
+# step of the pipeline, so any storm depth can be evaluated from CCN_final.tif without
+# touching Earth Engine or re-running the unmixing.
+CN_FILE = "CCN_final.tif"
+CN_NODATA = 255
+
+
+def runoff_from_cn(cn, p):
+    """
+    runoff_from_cn
+        US Department of Agriculture (USDA) Natural Resources Conservation Service (NRCS)
+        CN method for determining the Runoff Coefficient
+                Storage = 254 * (1-CN/100)
+                Initial Abstraction = 0.2*S
+                Runoff  = (P-Ia)^2/(P-Ia+S)
+        Negative results are set to NaN, as in the original pipeline.
+    Parameters:
+        cn: array of curve numbers (any shape)
+        p: precipitation in mm, a scalar or an array broadcastable against cn
+           (e.g. shape (k, 1) against a flat cn array evaluates k storms in one pass)
+    Returns:
+        array of runoff depths in mm
+    """
+    storage = 254 * (1 - (cn / 100.0))
+    Ia = 0.2 * storage
+    with np.errstate(divide='ignore', invalid='ignore'):
+        runoff_c = (p - Ia) ** 2 / (p - Ia + storage)
+    runoff_c = np.asarray(runoff_c)
+    runoff_c[runoff_c < 0] = np.nan
+    return runoff_c
+
+
+def read_cn_layer(path, nodata_value=CN_NODATA):
+    """
+    Read a curve number raster and return its valid pixels.
+
+    Returns:
+        tuple: (cn array with NaN for nodata, boolean mask of valid pixels, gdal dataset)
+    """
+    dataset = gdal.Open(path)
+    band = dataset.GetRasterBand(1)
+    cn = band.ReadAsArray().astype(float)
+    nodata = band.GetNoDataValue()
+    valid = np.isfinite(cn) & (cn != (nodata if nodata is not None else nodata_value))
+    cn[~valid] = np.nan
+    return cn, valid, dataset
+
+
+def _weighted_percentile(values, weights, q):
+    cumulative = np.cumsum(weights)
+    return float(values[np.searchsorted(cumulative, q / 100.0 * cumulative[-1])])
+
+
+def runoff_statistics(cn_values, precipitations):
+    """
+    Runoff statistics of a set of CN pixels for several precipitation depths.
+
+    CN layers hold few distinct values (integers 0-100), so the runoff is evaluated once per
+    (precipitation, distinct CN) pair in a single broadcast and the statistics are weighted
+    by pixel counts. The results are identical to evaluating every pixel.
+
+    Parameters:
+        cn_values: 1D array of valid curve numbers
+        precipitations: list of precipitation depths in mm
+    Returns:
+        list of dicts, one per precipitation depth
+    """
+    p = np.asarray(precipitations, dtype=float)
+    unique_cn, counts = np.unique(cn_values, return_counts=True)
+    # shape (len(p), len(unique_cn))
+    runoff = runoff_from_cn(unique_cn[np.newaxis, :], p[:, np.newaxis])
+
+    stats = []
+    for i, depth in enumerate(p):
+        finite = np.isfinite(runoff[i])
+        values, weights = runoff[i][finite], counts[finite]
+        entry = {"precipitation": float(depth), "pixels": int(counts.sum()), "valid_pixels": int(weights.sum())}
+        if weights.sum() == 0:
+            entry.update({"mean": None, "std": None, "min": None, "max": None,
+                          "p10": None, "median": None, "p90": None, "runoff_coefficient": None})
+        else:
+            order = np.argsort(values)
+            values, weights = values[order], weights[order]
+            mean = float(np.average(values, weights=weights))
+            entry.update({
+                "mean": mean,
+                "std": float(np.sqrt(np.average((values - mean) ** 2, weights=weights))),
+                "min": float(values[0]),
+                "max": float(values[-1]),
+                "p10": _weighted_percentile(values, weights, 10),
+                "median": _weighted_percentile(values, weights, 50),
+                "p90": _weighted_percentile(values, weights, 90),
+                "runoff_coefficient": mean / depth if depth > 0 else None
+            })
+        stats.append(entry)
+    return stats
+
+
+def cached_cn_dates(region_dir, dates=None, cn_file=CN_FILE):
+    """
+    Dates of a region folder that have a cached CN layer.
+
+    Parameters:
+        region_dir: Region cache folder (OUTPUT_MASTER/<region_id>)
+        dates: Optional iterable of 'YYYY-MM-DD' strings to restrict the result to
+        cn_file: Name of the CN layer inside each date folder
+    Returns:
+        dict: 'YYYY-MM-DD' -> path of the CN layer
+    """
+    if not os.path.isdir(region_dir):
+        return {}
+    wanted = set(dates) if dates is not None else None
+    found = {}
+    for date_folder in sorted(os.listdir(region_dir)):
+        if wanted is not None and date_folder not in wanted:
+            continue
+        cn_path = os.path.join(region_dir, date_folder, cn_file)
+        if os.path.isfile(cn_path):
+            found[date_folder] = cn_path
+    return found
+
+
+def runoff_what_if(cn_paths, precipitations, raster_dir=None):
+    """
+    Evaluate runoff for several precipitation depths on cached CN layers.
+
+    Parameters:
+        cn_paths: dict 'YYYY-MM-DD' -> CN raster path (see cached_cn_dates)
+        precipitations: list of precipitation depths in mm
+        raster_dir: Optional folder; if given, Runoff_P<depth>.tif is written per date and depth
+    Returns:
+        dict: 'YYYY-MM-DD' -> {"cn_mean": ..., "runoff": [stats per precipitation]}
+    """
+    results = {}
+    for date_str, cn_path in cn_paths.items():
+        cn, valid, dataset = read_cn_layer(cn_path)
+        results[date_str] = {
+            "cn_mean": float(np.nanmean(cn)) if valid.any() else None,
+            "runoff": runoff_statistics(cn[valid], precipitations)
+        }
+
+        if raster_dir is not None:
+            date_dir = os.path.join(raster_dir, date_str)
+            os.makedirs(date_dir, exist_ok=True)
+            # All storms for this date in one broadcast, shape (len(p), rows, cols)
+            runoff = runoff_from_cn(cn[np.newaxis], np.asarray(precipitations, dtype=float)[:, np.newaxis, np.newaxis])
+            for depth, layer in zip(precipitations, runoff):
+                _write_runoff(layer, dataset, os.path.join(date_dir, f"Runoff_P{depth:g}.tif"))
+        dataset = None
+    return results
+
+
+def _write_runoff(array, reference, output_path, nodata_value=-9999):
+    output_raster = gdal.GetDriverByName("GTiff").Create(output_path, reference.RasterXSize,
+                                                         reference.RasterYSize, 1, gdal.GDT_Float32)
+    output_raster.SetProjection(reference.GetProjection())
+    output_raster.SetGeoTransform(reference.GetGeoTransform())
+    band = output_raster.GetRasterBand(1)
+    band.SetNoDataValue(nodata_value)
+    band.WriteArray(np.where(np.isfinite(array), array, nodata_value).astype(np.float32))
+    output_raster.FlushCache()
+    output_raster = None
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .GEE_Functions_update import query_sentinel2_scenes
+from .download_cache import geometry_hash
+
+# Per-region index of satellite acquisitions (one index per sensor folder). Each checked date records the chosen image ID
+# (or None when no scene exists), so the date loop never asks Earth Engine about empty days.
+SCENE_INDEX_FILE = "scene_index.json"
+# Scenes for recent days can still be ingested into the catalog, so those entries expire
+SCENE_INDEX_RECENT_DAYS = int(os.getenv("SCENE_INDEX_RECENT_DAYS", "10"))
+SCENE_INDEX_RECENT_TTL_HOURS = float(os.getenv("SCENE_INDEX_RECENT_TTL_HOURS", "6"))
+
+_index_lock = threading.Lock()
+
+
+def _to_date_string(date):
+    return date if isinstance(date, str) else date.strftime('%Y-%m-%d')
+
+
+def _load_index(index_path, aoi_hash):
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except Exception as e:
+        print(f"Error reading scene index {index_path}: {e}")
+        return {}
+    # A different polygon under the same folder invalidates everything we know
+    if index.get("aoi_hash") != aoi_hash:
+        print("Scene index was built for a different geometry, discarding it")
+        return {}
+    return index.get("dates", {})
+
+
+def _save_index(index_path, aoi_hash, entries):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = index_path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump({"aoi_hash": aoi_hash, "dates": entries}, f, sort_keys=True)
+    os.replace(tmp_path, index_path)
+
+
+def _is_fresh(date_str, entry, now):
+    if entry is None:
+        return False
+    recent_limit = datetime.utcnow() - timedelta(days=SCENE_INDEX_RECENT_DAYS)
+    if datetime.strptime(date_str, '%Y-%m-%d') < recent_limit:
+        return True
+    return now - entry.get("checked_at", 0) < SCENE_INDEX_RECENT_TTL_HOURS * 3600
+
+
+def get_scene_index(aoi, region_dir, dates, refresh_dates=None, query=query_sentinel2_scenes):
+    """
+    Resolve which of the requested dates have a scene over the aoi.
+
+    Dates that are not in the region's index (or whose entry has expired) are looked up
+    with one aggregated catalog query spanning their range.
+
+    Parameters:
+        aoi: The area of interest (ee.Geometry)
+        region_dir: Region cache folder holding scene_index.json
+        dates: List of datetime objects or 'YYYY-MM-DD' strings
+        refresh_dates: Optional dates that must be re-checked against the catalog
+        query: Catalog query of the sensor, see GEE_Functions_update.query_scenes
+    Returns:
+        dict: 'YYYY-MM-DD' -> image asset ID, only for dates with a scene
+    """
+    date_strings = sorted(set(_to_date_string(date) for date in dates))
+    if not date_strings:
+        return {}
+    refresh = set(_to_date_string(date) for date in (refresh_dates or []))
+
+    aoi_hash = geometry_hash(aoi)
+    index_path = os.path.join(region_dir, SCENE_INDEX_FILE)
+    now = time.time()
+
+    with _index_lock:
+        entries = _load_index(index_path, aoi_hash)
+
+    unknown = [d for d in date_strings if d in refresh or not _is_fresh(d, entries.get(d), now)]
+    if unknown:
+        start = datetime.strptime(unknown[0], '%Y-%m-%d')
+        end = datetime.strptime(unknown[-1], '%Y-%m-%d')
+        print(f"Scene index: querying catalog for {unknown[0]} to {unknown[-1]} "
+              f"({len(unknown)} of {len(date_strings)} dates unknown)")
+        scenes = query(aoi, start, end)
+
+        with _index_lock:
+            entries = _load_index(index_path, aoi_hash)
+            current = start
+            while current <= end:
+                date_str = current.strftime('%Y-%m-%d')
+                scene = scenes.get(date_str)
+                entries[date_str] = {
+                    "id": scene["id"] if scene else None,
+                    "cloud": scene["cloud"] if scene else None,
+                    "checked_at": now
+                }
+                current += timedelta(days=1)
+            _save_index(index_path, aoi_hash, entries)
+    else:
+        print(f"Scene index: all {len(date_strings)} dates resolved from cache")
+
+    return {d: entries[d]["id"] for d in date_strings if entries.get(d) and entries[d].get("id")}
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+
+from .GEE_Functions_update import compute_scene_statistics
+
+# Per-region cache of scene statistics reduced in Earth Engine (stats-only mode). A Sentinel-2
+# scene never changes once published, so entries are keyed on (image ID, scale) and never expire.
+# Entries written before the reduction stopped using bestEffort may have been reduced at a coarser
+# scale than recorded, they are recomputed (see STATS_VERSION).
+SCENE_STATS_FILE = "scene_stats.json"
+STATS_VERSION = 2
+
+_stats_lock = threading.Lock()
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading scene statistics {path}: {e}")
+        return {}
+
+
+def _save(path, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump(entries, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def get_scene_statistics(aoi, region_dir, scene_ids, crs_string, scale):
+    """
+    Scene statistics for the given scenes, reducing only the scenes that are not cached yet.
+
+    Parameters:
+        aoi: The area of interest (ee.Geometry)
+        region_dir: Region cache folder holding scene_stats.json
+        scene_ids: dict 'YYYY-MM-DD' -> Sentinel-2 asset ID
+        crs_string: CRS string for projection
+        scale: Reduction scale in meters
+    Returns:
+        dict: 'YYYY-MM-DD' -> {'ndvi', 'water-fraction', 'scale'}
+    """
+    path = os.path.join(region_dir, SCENE_STATS_FILE)
+    with _stats_lock:
+        entries = _load(path)
+
+    def cached(date_str, image_id):
+        entry = entries.get(date_str)
+        return (entry is not None and entry.get("id") == image_id and entry.get("scale") == float(scale)
+                and entry.get("version") == STATS_VERSION)
+
+    missing = {d: i for d, i in scene_ids.items() if not cached(d, i)}
+    print(f"Scene statistics: {len(scene_ids) - len(missing)} cached, {len(missing)} to reduce in Earth Engine")
+
+    if missing:
+        computed = compute_scene_statistics(aoi, missing, crs_string, scale=scale)
+        now = time.time()
+        with _stats_lock:
+            entries = _load(path)
+            for date_str, values in computed.items():
+                entries[date_str] = dict(values, id=missing[date_str], scale=float(scale), version=STATS_VERSION,
+                                         computed_at=now)
+            _save(path, entries)
+
+    return {
+        d: {"ndvi": entries[d].get("ndvi"), "water-fraction": entries[d].get("water-fraction"),
+            "scale": entries[d].get("scale")}
+        for d in scene_ids if d in entries
+    }
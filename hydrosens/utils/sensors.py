@@ -0,0 +1,90 @@
+import os
+from collections import namedtuple
+
+from .GEE_Functions_update import (SENTINEL2_BANDS, LANDSAT_BANDS, query_sentinel2_scenes, query_landsat_scenes,
+                                   Bandsfetch, Bandsexport, Bandsfetch_Landsat, Bandsexport_Landsat)
+from .Functions_update import prepare_S2image, prepare_L8image
+
+# Sensor adapters of the processing pipeline. process_specific_dates is sensor-agnostic: everything
+# that differs between satellites (catalog query, band layout, index bands, water threshold,
+# reflectance scaling, spectral library and native resolution) is looked up here, so download,
+# caching, unmixing and curve numbers are shared by all sensors.
+#
+# Band positions are 1-based GDAL band numbers within band_names.
+Sensor = namedtuple("Sensor", [
+    "name",             # request value, e.g. 'sentinel2'
+    "label",            # name used in log messages
+    "band_names",       # bands exported/fetched, in Bands.tif order
+    "wavelengths",      # center wavelength (nm) of each band, columns of the trimmed library
+    "blue", "green", "red", "nir", "swir1",
+    "mndwi_threshold",  # pixels with MNDWI above the threshold are masked as water
+    "native_scale",     # full processing resolution in meters
+    "sli_env",          # environment variable holding the spectral library path (band count must match)
+    "query_scenes",     # (aoi, start, end) -> {'YYYY-MM-DD': {'id', 'cloud'}}
+    "fetch_bands",      # Bandsfetch-style function (pixel/tiled fetch)
+    "export_bands",     # Bandsexport-style function (GeoTIFF export)
+    "prepare_image",    # Bands file (reflectance * 10000) -> reflectance scaled to 0-1 for unmixing
+    "subfolder"         # results folder below the region folder, '' keeps the region folder itself
+])
+
+SENTINEL2 = Sensor(
+    name="sentinel2",
+    label="Sentinel-2",
+    band_names=SENTINEL2_BANDS,
+    wavelengths=[490, 560, 665, 783, 842, 865, 1610, 2190],
+    blue=1, green=2, red=3, nir=6, swir1=7,  # B2, B3, B4, B8A, B11
+    mndwi_threshold=0,
+    native_scale=10,
+    sli_env="SLI",
+    query_scenes=query_sentinel2_scenes,
+    fetch_bands=Bandsfetch,
+    export_bands=Bandsexport,
+    prepare_image=prepare_S2image,
+    subfolder=""
+)
+
+LANDSAT = Sensor(
+    name="landsat",
+    label="Landsat 8/9",
+    band_names=LANDSAT_BANDS,
+    wavelengths=[482, 561, 655, 865, 1609, 2201],
+    blue=1, green=2, red=3, nir=4, swir1=5,  # SR_B2, SR_B3, SR_B4, SR_B5, SR_B6
+    mndwi_threshold=0,
+    native_scale=30,
+    sli_env="SLI_LANDSAT",
+    query_scenes=query_landsat_scenes,
+    fetch_bands=Bandsfetch_Landsat,
+    export_bands=Bandsexport_Landsat,
+    prepare_image=prepare_L8image,
+    subfolder="landsat"
+)
+
+SENSORS = {sensor.name: sensor for sensor in (SENTINEL2, LANDSAT)}
+DEFAULT_SENSOR = "sentinel2"
+
+
+def get_sensor(name=None):
+    """
+    Look up a sensor adapter by name.
+
+    Parameters:
+        name: 'sentinel2' (default) or 'landsat'; a Sensor is returned unchanged
+    Returns:
+        Sensor
+    """
+    if isinstance(name, Sensor):
+        return name
+    key = (name or DEFAULT_SENSOR).lower()
+    if key not in SENSORS:
+        raise ValueError(f"Unknown sensor '{name}', expected one of {sorted(SENSORS)}")
+    return SENSORS[key]
+
+
+def sensor_storage_key(region_key, sensor=None):
+    """
+    Folder (relative to the output master) holding a region's results for a sensor.
+    Sentinel-2 keeps the region folder, so existing caches stay valid; other sensors get a subfolder.
+    """
+    sensor = get_sensor(sensor)
+    return os.path.join(region_key, sensor.subfolder) if sensor.subfolder else region_key
+
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+
+from .region_registry import compute_region_id
+
+# Per-date manifest of the parameters each pipeline stage was computed with.
+#   imagery: imagery download, indices and unmixing -> date, geometry, endmember, unmixing mode, scale, sensor
+#   cn:      curve numbers                          -> imagery parameters + AMC
+#   runoff:  runoff layer                           -> cn parameters + precipitation
+# A cached date is only reused for the stages whose parameters match the request; when only
+# AMC or precipitation changed, the cn/runoff stages are rebuilt from the stored AMC II layer.
+STAGES_FILE = "stages.json"
+STAGES = ("imagery", "cn", "runoff")
+# Bumped when the imagery of a sensor is processed differently, so its cached dates are recomputed.
+# landsat 2: Collection 2 scale and offset applied before indices and unmixing
+SENSOR_REVISIONS = {"landsat": 2}
+
+
+def stage_params(date_str, coordinates, crs, endmember, unmixing_mode, scale, amc, p, sensor='sentinel2'):
+    """
+    Parameters every stage of a date depends on.
+    The sensor is only recorded when it is not Sentinel-2, so manifests written before sensors
+    were pluggable keep their keys.
+
+    Returns:
+        dict: stage name -> parameter dict
+    """
+    imagery = {
+        "date": date_str,
+        "geometry": compute_region_id(coordinates, crs),
+        "endmember": 2 if endmember == 2 else 3,
+        "unmixing_mode": unmixing_mode or 'mesma',
+        "scale": float(scale)
+    }
+    if sensor and sensor != 'sentinel2':
+        imagery["sensor"] = sensor
+        if sensor in SENSOR_REVISIONS:
+            imagery["sensor_revision"] = SENSOR_REVISIONS[sensor]
+    cn = dict(imagery, amc=int(amc) if amc in (1, 3, '1', '3') else 2)
+    runoff = dict(cn, p=float(p) if p is not None else None)
+    return {"imagery": imagery, "cn": cn, "runoff": runoff}
+
+
+def stage_key(params):
+    """Short content hash of a stage's parameters."""
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_stage_manifest(date_dir):
+    path = os.path.join(date_dir, STAGES_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading stage manifest {path}: {e}")
+        return None
+
+
+def write_stage_manifest(date_dir, params):
+    """Record the parameters (and their keys) the stages of a date folder were computed with."""
+    manifest = {stage: {"key": stage_key(params[stage]), "params": params[stage]} for stage in STAGES}
+    path = os.path.join(date_dir, STAGES_FILE)
+    tmp_path = path + ".part"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def clear_stage_manifest(date_dir):
+    """Drop the manifest of a date that is being reprocessed, so a failed run never looks current."""
+    path = os.path.join(date_dir, STAGES_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def first_stale_stage(date_dir, params, accept_scales=()):
+    """
+    Find the first stage of a cached date whose parameters differ from the request.
+
+    Parameters:
+        date_dir: Date output folder
+        params: Requested parameters, see stage_params
+        accept_scales: Additional stored scales accepted in place of the requested one
+                       (e.g. full-resolution results for a preview request)
+    Returns:
+        str or None: 'imagery', 'cn' or 'runoff', or None if every stage is current.
+        Dates without a manifest (processed before stages were recorded) report 'imagery'.
+    """
+    manifest = read_stage_manifest(date_dir)
+    if manifest is None:
+        return "imagery"
+
+    stored_scale = manifest.get("imagery", {}).get("params", {}).get("scale")
+    for stage in STAGES:
+        expected = params[stage]
+        if stored_scale in accept_scales:
+            expected = dict(expected, scale=stored_scale)
+        entry = manifest.get(stage)
+        if entry is None or entry.get("key") != stage_key(expected):
+            return stage
+    return None
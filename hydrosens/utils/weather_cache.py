@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Persistent (centroid cell, date) -> {temperature, precipitation} cache for ERA5-Land.
+# Cells follow the 0.1 degree ERA5-Land grid, so every AOI whose centroid falls in the same
+# cell samples the same ERA5 pixel and can share cached values.
+WEATHER_CACHE_DIR = os.getenv("WEATHER_CACHE_DIR", "./data/cache/weather")
+WEATHER_CELL_SIZE = 0.1
+# ERA5T values for recent days may still be revised; days older than this are final.
+WEATHER_FINAL_LAG_DAYS = int(os.getenv("WEATHER_FINAL_LAG_DAYS", "90"))
+# Provisional (non-final) values are refetched after this many hours
+WEATHER_PROVISIONAL_TTL_HOURS = float(os.getenv("WEATHER_PROVISIONAL_TTL_HOURS", "24"))
+
+_cache_lock = threading.Lock()
+
+
+def weather_cell(lon, lat):
+    """
+    Snap a point to its ERA5-Land grid cell.
+
+    Returns:
+        tuple: (cell_id, cell_center_lon, cell_center_lat)
+    """
+    ix = int(round(lon / WEATHER_CELL_SIZE))
+    iy = int(round(lat / WEATHER_CELL_SIZE))
+    return f"{ix}_{iy}", ix * WEATHER_CELL_SIZE, iy * WEATHER_CELL_SIZE
+
+
+def _cell_path(cell_id):
+    return os.path.join(WEATHER_CACHE_DIR, f"{cell_id}.json")
+
+
+def _load_cell(cell_id):
+    path = _cell_path(cell_id)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading weather cache {path}: {e}")
+        return {}
+
+
+def is_final(date_str, now=None):
+    """Whether ERA5-Land values for date_str are final and can be cached permanently."""
+    now = now or datetime.utcnow()
+    return datetime.strptime(date_str, "%Y-%m-%d") <= now - timedelta(days=WEATHER_FINAL_LAG_DAYS)
+
+
+def get_cached_weather(cell_id, date_strings):
+    """
+    Look up cached weather for a cell.
+
+    Returns:
+        tuple: (cached, missing) where cached maps date -> {temperature, precipitation}
+        and missing lists the dates that have to be fetched from Earth Engine
+    """
+    with _cache_lock:
+        entries = _load_cell(cell_id)
+
+    now = time.time()
+    cached = {}
+    missing = []
+    for date_str in date_strings:
+        entry = entries.get(date_str)
+        if entry is not None and (entry.get("final") or
+                                  now - entry.get("fetched_at", 0) < WEATHER_PROVISIONAL_TTL_HOURS * 3600):
+            cached[date_str] = {
+                "temperature": entry["temperature"],
+                "precipitation": entry["precipitation"]
+            }
+        else:
+            missing.append(date_str)
+    return cached, missing
+
+
+def store_weather(cell_id, weather_data):
+    """Merge freshly fetched weather values into the cell cache."""
+    if not weather_data:
+        return
+    os.makedirs(WEATHER_CACHE_DIR, exist_ok=True)
+    now = time.time()
+    with _cache_lock:
+        entries = _load_cell(cell_id)
+        for date_str, values in weather_data.items():
+            entries[date_str] = {
+                "temperature": values["temperature"],
+                "precipitation": values["precipitation"],
+                "fetched_at": now,
+                "final": is_final(date_str)
+            }
+        path = _cell_path(cell_id)
+        tmp_path = path + ".part"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, sort_keys=True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,2 @@
+# Modules shared by the hydrosens and api-app services. Both images copy this package next
+# to their app.py (see the Dockerfiles); for local runs put the shared/ folder on PYTHONPATH.
@@ -0,0 +1,275 @@
+import os
+import random
+import re
+import threading
+import time
+
+import ee
+import requests
+
+# Shared Earth Engine client wrapper. Every Earth Engine request (getInfo, exports, pixel and
+# thumbnail downloads) goes through ee_call, which
+#   - limits the number of concurrent requests (EE_MAX_CONCURRENT) and the request rate (EE_MAX_QPS)
+#     across all jobs and threads of the process,
+#   - retries transient failures (429 / quota, 5xx, request timeouts, connection errors) with
+#     jittered exponential backoff; deterministic errors such as "Computation timed out." fail fast,
+#   - bounds every call with a timeout (EE_CALL_TIMEOUT seconds), both as the Earth Engine request
+#     deadline and as the time the caller waits,
+#   - counts calls, retries, throttling and failures (ee_client_stats).
+# Earth Engine is initialized lazily on first use (ensure_initialized), so importing the
+# service does not need credentials or a network round-trip.
+EE_MAX_RETRIES = int(os.getenv("EE_MAX_RETRIES", "5"))
+EE_BACKOFF_BASE = float(os.getenv("EE_BACKOFF_BASE", "1.0"))
+EE_BACKOFF_MAX = float(os.getenv("EE_BACKOFF_MAX", "60"))
+EE_MAX_CONCURRENT = int(os.getenv("EE_MAX_CONCURRENT", "8"))
+EE_MAX_QPS = float(os.getenv("EE_MAX_QPS", "10"))
+EE_CALL_TIMEOUT = float(os.getenv("EE_CALL_TIMEOUT", "300"))
+EE_SERVICE_ACCOUNT = os.getenv("EE_SERVICE_ACCOUNT", "khoabui@hydrosens-garfield.iam.gserviceaccount.com")
+EE_KEY_FILE = os.getenv("EE_KEY_FILE", r"./.secret/hydrosens-garfield-f6fe24f0d188.json")
+
+THROTTLE_MARKERS = ("too many requests", "too many concurrent", "quota exceeded", "capacity exceeded",
+                    "rate limit", "resource_exhausted", "resource exhausted")
+TRANSIENT_MARKERS = ("internal error", "backend error", "service unavailable", "deadline exceeded",
+                     "connection reset", "temporarily unavailable", "try again later")
+# Errors that fail the same way on every attempt, even though they mention a timeout or a limit
+PERMANENT_MARKERS = ("computation timed out", "user memory limit exceeded", "too many pixels",
+                     "total request size")
+# HTTP status codes quoted in error messages, e.g. "HTTP Error 503" or "status code: 429". A bare
+# number is not enough: "500" also appears in scales, sizes and asset IDs.
+_STATUS_IN_MESSAGE = re.compile(r"\b(?:http(?: ?error)?|status(?: code)?|error code|code)\s*:?\s*(\d{3})\b")
+
+_init_lock = threading.Lock()
+_initialized = False
+
+_concurrency = threading.BoundedSemaphore(max(1, EE_MAX_CONCURRENT))
+_rate_lock = threading.Lock()
+_next_slot = [0.0]
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "retries": 0, "throttled": 0, "timeouts": 0, "failures": 0}
+
+
+class EECallTimeout(Exception):
+    """An Earth Engine call did not finish within its timeout."""
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def ee_client_stats():
+    """Snapshot of the client counters: calls, retries, throttled, timeouts, failures."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def ensure_initialized():
+    """Initialize Earth Engine with the service account on first use, once per process (thread-safe)."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        start = time.time()
+        credentials = ee.ServiceAccountCredentials(EE_SERVICE_ACCOUNT, EE_KEY_FILE)
+        ee.Initialize(credentials)
+        if EE_CALL_TIMEOUT > 0:
+            # Let the Earth Engine request itself give up with the call, instead of running on
+            # after ee_call stopped waiting for it
+            ee.data.setDeadline(int(EE_CALL_TIMEOUT * 1000))
+        _initialized = True
+        print(f"Earth Engine initialized in {time.time() - start:.2f}s")
+
+
+def _wait_for_rate_slot():
+    """Space requests at least 1 / EE_MAX_QPS seconds apart across all threads."""
+    if EE_MAX_QPS <= 0:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot[0])
+        _next_slot[0] = slot + 1.0 / EE_MAX_QPS
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _status_code(exc):
+    """HTTP status of exc, from its response or, failing that, quoted in its message."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return status
+    match = _STATUS_IN_MESSAGE.search(str(exc).lower())
+    return int(match.group(1)) if match else None
+
+
+def is_throttled(exc):
+    if _status_code(exc) == 429:
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+def is_retryable(exc):
+    """Transient errors worth retrying: throttling, 5xx, request timeouts and connection errors."""
+    if isinstance(exc, (EECallTimeout, TimeoutError, ConnectionError,
+                        requests.ConnectionError, requests.Timeout)):
+        return True
+    if not isinstance(exc, (ee.EEException, requests.RequestException, OSError)):
+        return False
+    message = str(exc).lower()
+    if any(marker in message for marker in PERMANENT_MARKERS):
+        return False
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return is_throttled(exc) or any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(EE_BACKOFF_MAX, EE_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _call_with_timeout(func, args, kwargs, timeout):
+    """
+    Run func in a concurrency slot (acquired by the caller) and release the slot when func returns.
+
+    A request cannot be cancelled from Python. When the caller stops waiting after timeout, the
+    call keeps running on its worker thread and keeps its slot until it finishes, so abandoned
+    calls still count against EE_MAX_CONCURRENT. The request deadline (see ensure_initialized)
+    makes them end shortly after.
+    """
+    if not timeout or timeout <= 0:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _concurrency.release()
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            _concurrency.release()
+
+    worker = threading.Thread(target=target, daemon=True, name="ee-call")
+    try:
+        worker.start()
+    except BaseException:
+        _concurrency.release()
+        raise
+    worker.join(timeout)
+    if worker.is_alive():
+        raise EECallTimeout(f"call timed out after {timeout:g}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+def ee_call(func, *args, description=None, timeout=None, retries=None, **kwargs):
+    """
+    Run an Earth Engine request with concurrency/QPS limits, a timeout and retries.
+
+    Parameters:
+        func: Callable performing the request
+        *args, **kwargs: Passed to func
+        description: Label used in log messages (defaults to the function name)
+        timeout: Seconds before the call is abandoned and retried (EE_CALL_TIMEOUT)
+        retries: Maximum number of retries (EE_MAX_RETRIES)
+    Returns:
+        The result of func. The last error is re-raised once the retries are exhausted,
+        non-transient errors are raised immediately.
+    """
+    description = description or getattr(func, "__name__", "ee call")
+    timeout = EE_CALL_TIMEOUT if timeout is None else timeout
+    retries = EE_MAX_RETRIES if retries is None else retries
+
+    ensure_initialized()
+    attempt = 0
+    while True:
+        _count("calls")
+        try:
+            _concurrency.acquire()
+            try:
+                _wait_for_rate_slot()
+            except BaseException:
+                _concurrency.release()
+                raise
+            # The slot is released by the call itself once it has finished
+            return _call_with_timeout(func, args, kwargs, timeout)
+        except Exception as e:
+            if isinstance(e, EECallTimeout):
+                _count("timeouts")
+            throttled = is_throttled(e)
+            if throttled:
+                _count("throttled")
+            if attempt >= retries or not is_retryable(e):
+                _count("failures")
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            _count("retries")
+            reason = "throttled" if throttled else "transient error"
+            print(f"EE {description}: {reason} ({str(e)[:120]}), retry {attempt}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def get_info(obj, description=None, timeout=None):
+    """obj.getInfo() through ee_call."""
+    return ee_call(obj.getInfo, description=description or "getInfo", timeout=timeout)
+
+
+def download_url(url, description=None, timeout=120):
+    """
+    GET a URL produced by Earth Engine (thumbnails, download URLs) through ee_call.
+
+    Returns:
+        requests.Response with a 2xx status; 429 and 5xx responses are retried
+    """
+    def fetch():
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    return ee_call(fetch, description=description or "download", timeout=timeout + 5)
+
+
+def export_image(image, output_file, scale, region, crs):
+    """
+    Download an image as a GeoTIFF through ee_call.
+
+    Replaces geemap.ee_export_image, which prints and swallows download errors: failed requests
+    are retried here and raised once the retries are exhausted.
+
+    Parameters:
+        image: ee.Image to export
+        output_file: Path of the output geotiff
+        scale: Export scale in meters
+        region: Export region (ee.Geometry)
+        crs: CRS string for projection
+    Returns:
+        str: output_file
+    """
+    name = os.path.basename(output_file)
+    url = ee_call(image.getDownloadURL, {
+        'name': os.path.splitext(name)[0],
+        'filePerBand': False,
+        'format': 'GEO_TIFF',
+        'scale': scale,
+        'crs': crs,
+        'region': region
+    }, description=f"export URL {name}")
+    response = download_url(url, description=f"export {name}", timeout=EE_CALL_TIMEOUT)
+
+    tmp_path = output_file + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(response.content)
+    os.replace(tmp_path, output_file)
+    print(f"Downloaded {name} ({len(response.content) / 1e6:.1f} MB)")
+    return output_file
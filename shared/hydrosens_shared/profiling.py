@@ -0,0 +1,259 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import shutil
+import sys
+import threading
+import time
+
+# Per-request CPU profiling. A request carrying the X-HydroSENS-Profile header (or ?profile=1)
+# runs under cProfile plus a stack-sampling thread; the pstats dump and a speedscope JSON
+# (open in https://www.speedscope.app) are stored under PROFILE_DIR/<profile_id>/.
+# Only the newest PROFILE_MAX_COUNT profiles younger than PROFILE_MAX_AGE_DAYS are kept.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_HEADER = "X-HydroSENS-Profile"
+PROFILE_ID_HEADER = "X-HydroSENS-Profile-Id"
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_TOP_N = 30
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "50"))
+PROFILE_MAX_AGE_DAYS = float(os.getenv("PROFILE_MAX_AGE_DAYS", "7"))
+
+PROFILE_FILES = {
+    "pstats": ("profile.pstats", "application/octet-stream"),
+    "speedscope": ("speedscope.json", "application/json"),
+    "meta": ("meta.json", "application/json"),
+}
+
+_PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def profiling_requested(request):
+    """True if the Flask request asks to be profiled via header or query flag."""
+    value = request.headers.get(PROFILE_HEADER) or request.args.get("profile") or ""
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def profile_path(profile_id, kind):
+    """
+    Path of a stored profile file, or None if the ID or kind is invalid.
+
+    Parameters:
+        profile_id: ID returned in the X-HydroSENS-Profile-Id header / profile_id field
+        kind: 'pstats', 'speedscope' or 'meta'
+    """
+    if not _PROFILE_ID_PATTERN.match(profile_id or "") or kind not in PROFILE_FILES:
+        return None
+    return os.path.join(PROFILE_DIR, profile_id, PROFILE_FILES[kind][0])
+
+
+def list_profiles():
+    """Metadata of all stored profiles, newest first."""
+    if not os.path.exists(PROFILE_DIR):
+        return []
+    profiles = []
+    for profile_id in os.listdir(PROFILE_DIR):
+        meta_path = profile_path(profile_id, "meta")
+        if not meta_path or not os.path.exists(meta_path):
+            continue
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"Error reading profile metadata {meta_path}: {e}")
+            continue
+        meta.pop("top_functions", None)
+        profiles.append(meta)
+    return sorted(profiles, key=lambda m: m.get("started_at", 0), reverse=True)
+
+
+def prune_profiles(max_count=PROFILE_MAX_COUNT, max_age_days=PROFILE_MAX_AGE_DAYS, keep=None):
+    """
+    Delete stored profiles beyond the newest max_count or older than max_age_days.
+
+    Parameters:
+        max_count: Number of profiles kept (0 or less disables the count limit)
+        max_age_days: Maximum age in days (0 or less disables the age limit)
+        keep: Profile ID that is never deleted (the one just written)
+    Returns:
+        list: IDs of the deleted profiles
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for profile_id in os.listdir(PROFILE_DIR):
+        directory = os.path.join(PROFILE_DIR, profile_id)
+        if _PROFILE_ID_PATTERN.match(profile_id) and os.path.isdir(directory):
+            profiles.append((os.path.getmtime(directory), profile_id))
+    profiles.sort(reverse=True)
+
+    cutoff = time.time() - max_age_days * 86400 if max_age_days > 0 else None
+    deleted = []
+    for rank, (mtime, profile_id) in enumerate(profiles):
+        if profile_id == keep:
+            continue
+        if (max_count > 0 and rank >= max_count) or (cutoff is not None and mtime < cutoff):
+            shutil.rmtree(os.path.join(PROFILE_DIR, profile_id), ignore_errors=True)
+            deleted.append(profile_id)
+    if deleted:
+        print(f"Pruned {len(deleted)} stored profiles")
+    return deleted
+
+
+class RequestProfiler:
+    """
+    Profiles the thread that calls start() until stop() is called.
+
+    cProfile gives exact call counts and cumulative times, the sampling thread records
+    wall-clock stacks (including time blocked on Earth Engine or GDAL) for the flamegraph.
+    Samples are aggregated per distinct stack while sampling, so memory grows with the
+    number of distinct stacks rather than with the run time; the flamegraph and the
+    left-heavy view are unaffected, the time-order view shows one block per stack.
+
+    Parameters:
+        profile_id: ID under which the profile is stored
+        label: Human readable description (endpoint, region...)
+        interval_ms: Sampling interval of the stack sampler
+    """
+
+    def __init__(self, profile_id, label="", interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.profile_id = profile_id
+        self.label = label
+        self.interval = interval_ms / 1000.0
+        self.saved = threading.Event()
+        self._profile = cProfile.Profile()
+        self._stop_event = threading.Event()
+        self._frames = []
+        self._frame_index = {}
+        # Collapsed stacks: tuple of frame indices (root to leaf) -> [sample count, seconds]
+        self._stacks = {}
+        self._sample_count = 0
+        self._sampler = None
+        self._target_thread_id = None
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self):
+        self._target_thread_id = threading.get_ident()
+        self.started_at = time.time()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def _frame_id(self, frame):
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = len(self._frames)
+            self._frame_index[key] = index
+            self._frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame))
+                frame = frame.f_back
+            # speedscope expects stacks ordered from the root to the leaf
+            stack.reverse()
+            entry = self._stacks.get(tuple(stack))
+            if entry is None:
+                entry = self._stacks[tuple(stack)] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += now - last
+            self._sample_count += 1
+            last = now
+
+    def stop(self, status="completed"):
+        """Stop profiling and write pstats, speedscope and meta files."""
+        self._profile.disable()
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=5)
+        self.stopped_at = time.time()
+        try:
+            self._write(status)
+            prune_profiles(keep=self.profile_id)
+        except Exception as e:
+            print(f"Error writing profile {self.profile_id}: {e}")
+        finally:
+            self.saved.set()
+
+    def _write(self, status):
+        directory = os.path.join(PROFILE_DIR, self.profile_id)
+        os.makedirs(directory, exist_ok=True)
+
+        self._profile.dump_stats(profile_path(self.profile_id, "pstats"))
+
+        duration = self.stopped_at - self.started_at
+        stacks = sorted(self._stacks.items(), key=lambda item: item[1][1], reverse=True)
+        samples = [list(stack) for stack, _ in stacks]
+        weights = [seconds for _, (_, seconds) in stacks]
+        speedscope = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.label} ({self.profile_id})",
+            "exporter": "hydrosens",
+            "shared": {"frames": self._frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.label or self.profile_id,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+        with open(profile_path(self.profile_id, "speedscope"), "w") as f:
+            json.dump(speedscope, f)
+
+        stats = pstats.Stats(self._profile)
+        top_functions = []
+        for (filename, line, name), (cc, nc, tottime, cumtime, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_N]:
+            top_functions.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": nc,
+                "tottime": round(tottime, 4),
+                "cumtime": round(cumtime, 4)
+            })
+
+        meta = {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_s": round(duration, 3),
+            "samples": self._sample_count,
+            "distinct_stacks": len(stacks),
+            "sample_interval_ms": self.interval * 1000,
+            "top_functions": top_functions
+        }
+        with open(profile_path(self.profile_id, "meta"), "w") as f:
+            json.dump(meta, f, indent=2)
+        print(f"Profile {self.profile_id} saved ({duration:.1f}s, {self._sample_count} samples, "
+              f"{len(stacks)} distinct stacks)")
+
+
+def run_profiled(profiler, func, *args, **kwargs):
+    """Run func(*args, **kwargs) in the current thread under profiler."""
+    profiler.start()
+    status = "failed"
+    try:
+        result = func(*args, **kwargs)
+        status = "completed"
+        return result
+    except SystemExit:
+        status = "cancelled"
+        raise
+    finally:
+        profiler.stop(status)